@@ -0,0 +1,220 @@
+"""Anotado rápido de frames a partir de arrays de cajas, sin pasar por Results.plot().
+
+plot() de ultralytics copia el frame y dibuja cada etiqueta con su maquinaria de fuentes.
+Annotator dibuja con cv2 directamente sobre el buffer del frame: los rectángulos de cada clase
+se trazan con una sola llamada a cv2.polylines, los centroides se estampan con indexado de
+NumPy, y las etiquetas se componen con parches ya renderizados (nombre de clase, confianza,
+id de pista) que se guardan en caché y solo se copian sobre el frame.
+
+Los colores, grosores y la posición de las etiquetas imitan a plot() para que los informes
+se vean igual.
+
+Estilos: "labels" (cajas con etiqueta, como plot()), "boxes" (solo cajas), "centroids" (solo
+centros), "counts" (recuento por clase sobre el frame) y "none" (sin anotar).
+
+También sirve como script para dibujar más tarde un video a partir de su almacén de detecciones:
+    python annotator.py video.mp4 video_detecciones salida.mp4 --style labels
+"""
+import argparse
+import cv2
+import numpy as np
+from encoder import VideoEncoder
+
+ANNOTATION_STYLES = ("labels", "boxes", "centroids", "counts", "none")
+DEFAULT_STYLE = "labels"
+
+# Paleta de ultralytics (ultralytics.utils.plotting.Colors), en hexadecimal RGB
+_PALETTE_HEX = ("FF3838", "FF9D97", "FF701F", "FFB21D", "CFD231", "48F90A", "92CC17", "3DDB86", "1A9334", "00D4BB",
+                "2C99A8", "00C2FF", "344593", "6473FF", "0018EC", "8438FF", "520085", "CB38FF", "FF95C8", "FF37C7")
+PALETTE_BGR = np.array([[int(h[i:i + 2], 16) for i in (4, 2, 0)] for h in _PALETTE_HEX], dtype=np.uint8)
+
+_TEXT_COLOR = (255, 255, 255)
+_MAX_TRACK_GLYPHS = 4096 # Parches de "id:N" guardados; al superarse se vacía esa caché
+
+
+def class_color(class_id):
+    return tuple(int(c) for c in PALETTE_BGR[int(class_id) % len(PALETTE_BGR)])
+
+
+class Annotator:
+    """Dibuja detecciones (N, 6) sobre frames BGR, en su sitio."""
+
+    def __init__(self, names=None, style=DEFAULT_STYLE, line_width=None):
+        if style not in ANNOTATION_STYLES:
+            raise ValueError(f"Estilo de anotación no soportado: '{style}' (usa {', '.join(ANNOTATION_STYLES)}).")
+        self.names = dict(names or {})
+        self.style = style
+        self.line_width = line_width # None = según el tamaño del frame, como plot()
+        self._glyphs = {} # (texto, class_id, grosor) -> parche BGR
+        self._track_glyphs = {}
+        self._disks = {} # radio -> desplazamientos (k, 2) de un disco
+
+    @property
+    def enabled(self):
+        return self.style != "none"
+
+    def draw(self, frame, boxes, track_ids=None):
+        """Anota frame (se modifica y se devuelve) con boxes (N, 6) y, opcionalmente, sus track_id."""
+        if self.style == "none":
+            return frame
+        lw = self.line_width or max(round(sum(frame.shape[:2]) / 2 * 0.003), 2)
+        boxes = np.asarray(boxes).reshape(-1, 6)
+        if self.style == "counts":
+            self._draw_counts(frame, boxes, lw)
+        elif self.style == "centroids":
+            self._draw_centroids(frame, boxes, lw)
+        else:
+            self._draw_boxes(frame, boxes, lw)
+            if self.style == "labels":
+                self._draw_labels(frame, boxes, track_ids, lw)
+        return frame
+
+    # --- Estilos ---
+    def _draw_boxes(self, frame, boxes, lw):
+        corners = np.round(boxes[:, :4]).astype(np.int32)
+        classes = boxes[:, 5].astype(np.int64)
+        for class_id in np.unique(classes):
+            c = corners[classes == class_id]
+            # Un polígono de 4 vértices por caja y una sola llamada por clase
+            polygons = np.stack([c[:, [0, 1]], c[:, [2, 1]], c[:, [2, 3]], c[:, [0, 3]]], axis=1)
+            cv2.polylines(frame, list(polygons), True, class_color(class_id), lw, cv2.LINE_8) # Sin AA: son líneas rectas
+
+    def _draw_centroids(self, frame, boxes, lw):
+        if not len(boxes):
+            return
+        height, width = frame.shape[:2]
+        centers = np.round((boxes[:, :2] + boxes[:, 2:4]) / 2).astype(np.int64)
+        disk = self._disk(lw + 1)
+        points = (centers[:, None, :] + disk[None, :, :]).reshape(-1, 2)
+        colors = PALETTE_BGR[boxes[:, 5].astype(np.int64) % len(PALETTE_BGR)]
+        colors = np.repeat(colors, len(disk), axis=0)
+        inside = (points[:, 0] >= 0) & (points[:, 0] < width) & (points[:, 1] >= 0) & (points[:, 1] < height)
+        frame[points[inside, 1], points[inside, 0]] = colors[inside]
+
+    def _draw_labels(self, frame, boxes, track_ids, lw):
+        height, width = frame.shape[:2]
+        corners = boxes[:, :4].astype(np.int64)
+        conf_codes = np.clip(np.round(boxes[:, 4] * 100), 0, 100).astype(np.int64)
+        classes = boxes[:, 5].astype(np.int64)
+        ids = track_ids.tolist() if track_ids is not None else [-1] * len(boxes)
+        for (x1, y1, _, _), class_id, conf, track_id in zip(corners.tolist(), classes.tolist(), conf_codes.tolist(), ids):
+            parts = []
+            if track_id >= 0:
+                parts.append(self._track_glyph(track_id, class_id, lw))
+            # Nombre + confianza redondeada a 2 decimales: como mucho 101 parches por clase
+            parts.append(self._glyph(f"{self.names.get(class_id, class_id)} {conf / 100:.2f}", class_id, lw))
+            patch_height = parts[0].shape[0]
+            top = y1 - patch_height if y1 >= patch_height else y1 # Encima de la caja si cabe, si no dentro
+            left = x1
+            for part in parts:
+                _blit(frame, part, left, top, width, height)
+                left += part.shape[1]
+
+    def _draw_counts(self, frame, boxes, lw):
+        counts = np.bincount(boxes[:, 5].astype(np.int64)) if len(boxes) else np.zeros(0, dtype=np.int64)
+        top = lw
+        for class_id in np.flatnonzero(counts).tolist():
+            patch = self._glyph(f"{self.names.get(class_id, class_id)}: {counts[class_id]}", class_id, lw)
+            _blit(frame, patch, lw, top, frame.shape[1], frame.shape[0])
+            top += patch.shape[0] + 2
+
+    # --- Cachés ---
+    def _glyph(self, text, class_id, lw):
+        key = (text, class_id, lw)
+        patch = self._glyphs.get(key)
+        if patch is None:
+            patch = self._glyphs[key] = _render_label(text, class_color(class_id), lw)
+        return patch
+
+    def _track_glyph(self, track_id, class_id, lw):
+        key = (track_id, class_id, lw)
+        patch = self._track_glyphs.get(key)
+        if patch is None:
+            if len(self._track_glyphs) >= _MAX_TRACK_GLYPHS:
+                self._track_glyphs.clear()
+            patch = self._track_glyphs[key] = _render_label(f"id:{track_id} ", class_color(class_id), lw)
+        return patch
+
+    def _disk(self, radius):
+        disk = self._disks.get(radius)
+        if disk is None:
+            ys, xs = np.mgrid[-radius:radius + 1, -radius:radius + 1]
+            inside = xs ** 2 + ys ** 2 <= radius ** 2
+            disk = self._disks[radius] = np.column_stack([xs[inside], ys[inside]])
+        return disk
+
+
+def _font_metrics(lw):
+    """Escala, grosor y alto de texto de las etiquetas para un grosor de línea (como plot())."""
+    thickness = max(lw - 1, 1)
+    scale = lw / 3
+    text_height = cv2.getTextSize("0", 0, fontScale=scale, thickness=thickness)[0][1]
+    return scale, thickness, text_height
+
+
+def _render_label(text, color, lw):
+    scale, thickness, text_height = _font_metrics(lw)
+    text_width = cv2.getTextSize(text, 0, fontScale=scale, thickness=thickness)[0][0]
+    patch = np.empty((text_height + 3, max(text_width, 1), 3), dtype=np.uint8)
+    patch[:] = color
+    cv2.putText(patch, text, (0, text_height + 1), 0, scale, _TEXT_COLOR, thickness, cv2.LINE_AA)
+    return patch
+
+
+def _blit(frame, patch, left, top, width, height):
+    """Copia patch sobre frame en (left, top), recortando lo que quede fuera."""
+    x0, y0 = max(left, 0), max(top, 0)
+    x1, y1 = min(left + patch.shape[1], width), min(top + patch.shape[0], height)
+    if x1 > x0 and y1 > y0:
+        frame[y0:y1, x0:x1] = patch[y0 - top:y1 - top, x0 - left:x1 - left]
+
+
+def render_video(store, video_path, output_path, style=DEFAULT_STYLE, encoder_options=None):
+    """Dibuja un video a partir de su DetectionStore (p. ej. procesado antes con estilo "none")."""
+    annotator = Annotator(store.names, style)
+    frames = store.column("frame_idx")
+    # Las detecciones se guardan en orden de frame: cada frame es un tramo contiguo de filas
+    bounds = np.searchsorted(frames, np.arange(store.num_frames + 1))
+    boxes = np.column_stack([store.column("xyxy"), store.column("conf"), store.column("class_id")]).astype(np.float32)
+    track_ids = store.column("track_id") if store.has_tracks else None
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise IOError(f"No se pudo abrir el archivo de video: {video_path}")
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30
+    size = (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+    try:
+        writer = VideoEncoder(output_path, fps, size, **(encoder_options or {}))
+    except Exception:
+        cap.release()
+        raise
+    try:
+        frame_idx = 0
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            if frame_idx < store.num_frames:
+                rows = slice(bounds[frame_idx], bounds[frame_idx + 1])
+                annotator.draw(frame, boxes[rows], None if track_ids is None else track_ids[rows])
+            writer.write(frame)
+            frame_idx += 1
+    finally:
+        cap.release()
+        writer.close()
+    return frame_idx
+
+
+def main(argv=None):
+    from detection_store import DetectionStore
+    parser = argparse.ArgumentParser(description="Dibuja un video a partir de su almacén de detecciones.")
+    parser.add_argument("video", help="Video original")
+    parser.add_argument("detections", help="Directorio del almacén de detecciones (<nombre>_detecciones)")
+    parser.add_argument("output", help="Video anotado de salida (.mp4)")
+    parser.add_argument("--style", choices=ANNOTATION_STYLES[:-1], default=DEFAULT_STYLE, help="Estilo de anotación")
+    args = parser.parse_args(argv)
+    frames = render_video(DetectionStore.open(args.detections), args.video, args.output, args.style)
+    print(f"{frames} frames dibujados en: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""Micro-benchmark: extracción de clases de un resultado de YOLO, bucle por caja frente a NumPy.
+
+Construye resultados de ultralytics con N cajas aleatorias y mide, por frame, lo que costaba
+recorrer result.boxes caja a caja (int(box.cls[0]) + names[...]) frente a una sola copia a
+NumPy (boxes_array) y np.bincount.
+
+    python bench_extraction.py
+    python bench_extraction.py --boxes 50 500 2000 --repeat 200
+"""
+import argparse
+import time
+import numpy as np
+from detection_cache import boxes_array
+from detector import class_counts, counts_by_name
+
+NAMES = {0: "celula", 1: "globulo_rojo", 2: "globulo_blanco"}
+
+
+def legacy_class_names(result, names):
+    """Extracción anterior: un acceso al tensor por caja."""
+    found = set()
+    for box in result.boxes:
+        class_id = int(box.cls[0])
+        found.add(names[class_id])
+    return found
+
+
+def vectorized_class_counts(result, names):
+    boxes = boxes_array(result)
+    return counts_by_name(class_counts(boxes, len(names)), names)
+
+
+def random_result(num_boxes, rng, size=640):
+    xy = rng.uniform(0, size - 20, (num_boxes, 2))
+    boxes = np.column_stack([xy, xy + rng.uniform(5, 20, (num_boxes, 2)), rng.uniform(0.25, 1, num_boxes),
+                             rng.integers(0, len(NAMES), num_boxes)]).astype(np.float32)
+    import torch
+    from ultralytics.engine.results import Results
+    return Results(np.zeros((size, size, 3), dtype=np.uint8), path="", names=NAMES, boxes=torch.from_numpy(boxes))
+
+
+def time_per_call(function, result, repeat):
+    function(result, NAMES) # Calentamiento
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function(result, NAMES)
+    return (time.perf_counter() - start) / repeat
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Micro-benchmark de la extracción de resultados de YOLO.")
+    parser.add_argument("--boxes", type=int, nargs="+", default=[10, 100, 500, 2000], help="Cajas por frame a probar")
+    parser.add_argument("--repeat", type=int, default=100, help="Repeticiones por medida")
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(0)
+    print(f"{'cajas':>7} {'bucle (ms)':>12} {'numpy (ms)':>12} {'mejora':>8}")
+    for num_boxes in args.boxes:
+        result = random_result(num_boxes, rng)
+        assert legacy_class_names(result, NAMES) == set(vectorized_class_counts(result, NAMES))
+        legacy = time_per_call(legacy_class_names, result, args.repeat)
+        vectorized = time_per_call(vectorized_class_counts, result, args.repeat)
+        print(f"{num_boxes:>7} {legacy * 1000:>12.3f} {vectorized * 1000:>12.3f} {legacy / vectorized:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
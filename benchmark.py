@@ -0,0 +1,349 @@
+"""Banco de pruebas de rendimiento sin GUI, con comparación contra una línea base.
+
+Para cada clip (grabado o sintético) se hacen dos pasadas:
+
+- Por etapas, secuencial: cada frame pasa por decodificación, preproceso, inferencia y
+  postproceso del modelo (según result.speed de ultralytics), extracción de cajas, anotado,
+  codificación (escritor síncrono) y el render de la vista previa de la GUI (reducir al panel,
+  convertir a RGB y crear la imagen PIL; sin Tk). Da ms por etapa y la latencia por frame
+  (p50/p95/p99).
+- Pipeline: el VideoPipeline real, con sus hilos, sobre el clip completo. Da los fps que se
+  obtienen en la práctica.
+
+En ambas se mide el pico de memoria residente (RSS) con psutil. Los resultados se guardan en
+JSON; con --baseline se comparan con una ejecución anterior y el código de salida es 1 si
+alguna métrica empeora más que --tolerance.
+
+    python benchmark.py --synthetic 1280x720 --frames 300 -o base.json
+    python benchmark.py --clip muestra.mp4 --synthetic 1280x720 -o nuevo.json --baseline base.json
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import cv2
+import numpy as np
+import psutil
+
+import detector
+from annotator import Annotator, ANNOTATION_STYLES, DEFAULT_STYLE
+from detection_cache import boxes_array
+from encoder import open_writer, CODECS, DEFAULT_CODEC
+from pipeline import VideoPipeline, DEFAULT_BATCH_SIZE
+from preview import fit_to_size
+from streaming import SyntheticSource
+from inference_backends import add_backend_arguments, backend_options
+
+STAGES = ("decode", "preprocess", "inference", "postprocess", "annotate", "encode", "display")
+DEFAULT_FRAMES = 300 # Frames por clip en la pasada por etapas
+DEFAULT_SYNTHETIC_FPS = 30
+DISPLAY_SIZE = (680, 480) # Tamaño del panel de vista previa de la GUI (main.DEFAULT_DISPLAY_SIZE)
+RSS_SAMPLE_S = 0.05
+DEFAULT_TOLERANCE = 0.10 # Empeoramiento relativo permitido frente a la línea base
+NOISE_FLOOR_MS = 0.25 # Diferencias menores en métricas de ms no cuentan como empeoramiento (ruido del reloj)
+
+# Métricas comparadas con la línea base: (ruta dentro del resultado de un clip, True si mayor es mejor)
+COMPARED_METRICS = [
+    (("pipeline", "fps"), True),
+    (("sequential", "fps"), True),
+    (("sequential", "latency_ms", "p50"), False),
+    (("sequential", "latency_ms", "p95"), False),
+    (("sequential", "latency_ms", "p99"), False),
+    (("peak_rss_mb",), False),
+] + [(("sequential", "stages_ms", stage, "mean"), False) for stage in STAGES]
+
+
+class PeakRSS:
+    """Muestrea en un hilo la memoria residente del proceso y guarda el máximo (en MB)."""
+
+    def __init__(self, interval=RSS_SAMPLE_S):
+        self.interval = interval
+        self.peak = 0
+        self._process = psutil.Process()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self.peak = self._process.memory_info().rss
+        self._thread = threading.Thread(target=self._run, name="rss-sampler", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+
+    @property
+    def peak_mb(self):
+        return self.peak / 2 ** 20
+
+    def _sample(self):
+        self.peak = max(self.peak, self._process.memory_info().rss)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+
+def percentiles_ms(samples):
+    samples = np.asarray(samples, dtype=np.float64) * 1000
+    if not len(samples):
+        return {"mean": None, "p50": None, "p95": None, "p99": None}
+    p50, p95, p99 = np.percentile(samples, (50, 95, 99))
+    return {"mean": round(float(samples.mean()), 3), "p50": round(float(p50), 3),
+            "p95": round(float(p95), 3), "p99": round(float(p99), 3)}
+
+
+def make_synthetic_clip(path, size, frames, fps=DEFAULT_SYNTHETIC_FPS):
+    """Escribe un clip de prueba con células sintéticas (streaming.SyntheticSource)."""
+    source = SyntheticSource(size, fps, frames=frames, realtime=False)
+    writer = open_writer(path, fps, size, codec="mpeg4", backend="opencv")
+    try:
+        while True:
+            frame = source.read()
+            if frame is None:
+                break
+            writer.write(frame)
+    finally:
+        writer.close()
+    return path
+
+
+def _display_render(frame):
+    """El camino de la vista previa de la GUI sin Tk: reducir al panel, BGR->RGB e imagen PIL."""
+    from PIL import Image
+    frame = fit_to_size(frame, DISPLAY_SIZE)
+    rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+    return Image.frombuffer("RGB", (frame.shape[1], frame.shape[0]), rgb, "raw", "RGB", 0, 1)
+
+
+def bench_sequential(model, clip, work_dir, frames=DEFAULT_FRAMES, batch_size=DEFAULT_BATCH_SIZE, predict_args=None,
+                     annotation=DEFAULT_STYLE, encoder_options=None):
+    """Pasada por etapas: tiempo por frame de cada etapa, medido sin solapamiento entre etapas."""
+    predict_args = dict(predict_args or {})
+    encoder_options = dict(encoder_options or {})
+    scale = encoder_options.pop("scale", 1.0)
+    encoder_options.pop("frame_step", None)
+    cap = cv2.VideoCapture(clip)
+    if not cap.isOpened():
+        raise IOError(f"No se pudo abrir el clip: {clip}")
+    fps = cap.get(cv2.CAP_PROP_FPS) or DEFAULT_SYNTHETIC_FPS
+    size = (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+    output_size = (max(2, round(size[0] * scale)), max(2, round(size[1] * scale))) if 0 < scale < 1 else size
+    annotator = Annotator(model.names, annotation)
+    writer = open_writer(os.path.join(work_dir, "secuencial.mp4"), fps, output_size, **encoder_options) if annotator.enabled else None
+    samples = {stage: [] for stage in STAGES}
+    done = 0
+    start = time.perf_counter()
+    try:
+        while done < frames:
+            batch = []
+            while len(batch) < min(batch_size, frames - done):
+                t0 = time.perf_counter()
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                samples["decode"].append(time.perf_counter() - t0)
+                batch.append(frame)
+            if not batch:
+                break
+            t0 = time.perf_counter()
+            results = model.predict(source=batch, verbose=False, stream=False, **predict_args)
+            share = (time.perf_counter() - t0) / len(batch)
+            for frame, result in zip(batch, results):
+                speed = getattr(result, "speed", None) or {}
+                if speed.get("inference") is not None: # ultralytics: ms por imagen de cada fase
+                    samples["preprocess"].append((speed.get("preprocess") or 0) / 1000)
+                    samples["inference"].append(speed["inference"] / 1000)
+                    postprocess = (speed.get("postprocess") or 0) / 1000
+                else: # Sin desglose: todo el tiempo del lote, repartido, cuenta como inferencia
+                    samples["preprocess"].append(0.0)
+                    samples["inference"].append(share)
+                    postprocess = 0.0
+                t0 = time.perf_counter()
+                boxes = boxes_array(result)
+                samples["postprocess"].append(postprocess + time.perf_counter() - t0)
+
+                t0 = time.perf_counter()
+                annotator.draw(frame, boxes)
+                samples["annotate"].append(time.perf_counter() - t0)
+
+                t0 = time.perf_counter()
+                if writer is not None:
+                    writer.write(frame if output_size == size else cv2.resize(frame, output_size, interpolation=cv2.INTER_AREA))
+                samples["encode"].append(time.perf_counter() - t0)
+
+                t0 = time.perf_counter()
+                _display_render(frame)
+                samples["display"].append(time.perf_counter() - t0)
+            done += len(batch)
+    finally:
+        cap.release()
+        if writer is not None:
+            writer.close()
+    elapsed = time.perf_counter() - start
+    per_frame = np.sum([samples[stage] for stage in STAGES], axis=0) if done else []
+    return {
+        "frames": done,
+        "seconds": round(elapsed, 3),
+        "fps": round(done / elapsed, 2) if elapsed > 0 else None,
+        "stages_ms": {stage: percentiles_ms(samples[stage]) for stage in STAGES},
+        "latency_ms": percentiles_ms(per_frame),
+    }
+
+
+def bench_pipeline(model, clip, work_dir, batch_size=DEFAULT_BATCH_SIZE, predict_args=None, annotation=DEFAULT_STYLE,
+                   encoder_options=None):
+    """Pasada de extremo a extremo con el VideoPipeline real (etapas en hilos, sin caché)."""
+    pipeline = VideoPipeline(model, clip, os.path.join(work_dir, "pipeline.mp4"), batch_size=batch_size,
+                             predict_args=predict_args, annotator=Annotator(model.names, annotation),
+                             encoder_options=encoder_options)
+    start = time.perf_counter()
+    pipeline.run()
+    elapsed = time.perf_counter() - start
+    return {"frames": pipeline.processed_frames, "seconds": round(elapsed, 3),
+            "fps": round(pipeline.processed_frames / elapsed, 2) if elapsed > 0 else None}
+
+
+def bench_clip(model, clip, work_dir, frames=DEFAULT_FRAMES, batch_size=DEFAULT_BATCH_SIZE, predict_args=None,
+               annotation=DEFAULT_STYLE, encoder_options=None, pipeline=True):
+    with PeakRSS() as rss:
+        result = {"clip": clip,
+                  "sequential": bench_sequential(model, clip, work_dir, frames, batch_size, predict_args, annotation,
+                                                 encoder_options)}
+        if pipeline:
+            result["pipeline"] = bench_pipeline(model, clip, work_dir, batch_size, predict_args, annotation, encoder_options)
+    result["peak_rss_mb"] = round(rss.peak_mb, 1)
+    return result
+
+
+def environment():
+    info = {"python": platform.python_version(), "platform": platform.platform(), "processor": platform.processor(),
+            "cpu_count": os.cpu_count(), "memory_gb": round(psutil.virtual_memory().total / 2 ** 30, 1),
+            "opencv": cv2.__version__, "numpy": np.__version__}
+    torch = sys.modules.get("torch") # Solo si ya lo cargó ultralytics
+    if torch is not None:
+        info["torch"] = torch.__version__
+        info["cuda"] = torch.cuda.get_device_name(0) if torch.cuda.is_available() else None
+    return info
+
+
+def _metric(run, path):
+    for key in path:
+        if not isinstance(run, dict) or key not in run:
+            return None
+        run = run[key]
+    return run
+
+
+def compare(current, baseline, tolerance=DEFAULT_TOLERANCE):
+    """Compara dos resultados clip a clip. Devuelve [(clip, métrica, base, actual, cambio, empeora)]."""
+    rows = []
+    baseline_clips = baseline.get("clips", {})
+    for name, run in current.get("clips", {}).items():
+        base_run = baseline_clips.get(name)
+        if base_run is None:
+            continue
+        for path, higher_is_better in COMPARED_METRICS:
+            new, old = _metric(run, path), _metric(base_run, path)
+            if new is None or old is None or old == 0:
+                continue
+            change = (new - old) / old
+            worse = change < -tolerance if higher_is_better else change > tolerance
+            if any(key.endswith("_ms") for key in path) and abs(new - old) < NOISE_FLOOR_MS:
+                worse = False
+            rows.append((name, ".".join(path), old, new, change, worse))
+    return rows
+
+
+def print_results(results):
+    for name, run in results["clips"].items():
+        sequential = run["sequential"]
+        print(f"\n{name}: {sequential['frames']} frames, pico RSS {run['peak_rss_mb']} MB")
+        print(f"  {'etapa':<12} {'media':>9} {'p50':>9} {'p95':>9} {'p99':>9}  (ms/frame)")
+        for stage in STAGES + ("latency",):
+            stats = sequential["latency_ms"] if stage == "latency" else sequential["stages_ms"][stage]
+            if stats["mean"] is None:
+                continue
+            label = "total" if stage == "latency" else stage
+            print(f"  {label:<12} {stats['mean']:>9.2f} {stats['p50']:>9.2f} {stats['p95']:>9.2f} {stats['p99']:>9.2f}")
+        print(f"  fps secuencial {sequential['fps']}", end="")
+        if "pipeline" in run:
+            print(f", fps pipeline {run['pipeline']['fps']}", end="")
+        print()
+
+
+def print_comparison(rows, tolerance):
+    if not rows:
+        print("\nNingún clip en común con la línea base.")
+        return
+    print(f"\nComparación con la línea base (tolerancia {tolerance:.0%}):")
+    for name, metric, old, new, change, worse in rows:
+        flag = "  EMPEORA" if worse else ""
+        print(f"  {name:<24} {metric:<36} {old:>10.2f} -> {new:>10.2f} ({change:+.1%}){flag}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark de rendimiento por etapas, sin GUI.")
+    parser.add_argument("--clip", action="append", default=[], help="Video grabado a medir (se puede repetir)")
+    parser.add_argument("--synthetic", action="append", default=[], metavar="WxH",
+                        help="Clip sintético de ese tamaño (se puede repetir). Sin clips se usa 1280x720")
+    parser.add_argument("--frames", type=int, default=DEFAULT_FRAMES, help=f"Frames por clip (por defecto: {DEFAULT_FRAMES})")
+    parser.add_argument("-m", "--model", default=detector.MODEL_NAME, help=f"Pesos YOLO (por defecto: {detector.MODEL_NAME})")
+    parser.add_argument("-b", "--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="Frames por lote de inferencia")
+    parser.add_argument("--device", default=None, help="Dispositivo de inferencia (cpu, 0, cuda:0...), por defecto el de ultralytics")
+    parser.add_argument("-a", "--annotate", choices=ANNOTATION_STYLES, default=DEFAULT_STYLE, help="Estilo de anotación")
+    parser.add_argument("--codec", choices=tuple(CODECS), default=DEFAULT_CODEC, help="Códec de salida")
+    parser.add_argument("--no-pipeline", action="store_true", help="Solo la pasada por etapas")
+    parser.add_argument("-o", "--output", default=None, help="Guardar los resultados en este JSON")
+    parser.add_argument("--baseline", default=None, help="JSON de una ejecución anterior con el que comparar")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help=f"Empeoramiento relativo tolerado, 0.1 = 10%% (por defecto: {DEFAULT_TOLERANCE})")
+    add_backend_arguments(parser)
+    args = parser.parse_args(argv)
+
+    predict_args = {"device": args.device} if args.device is not None else {}
+    encoder_options = {"codec": args.codec}
+    model = detector.load_model(args.model, warmup=True, **backend_options(args))
+    work_dir = tempfile.mkdtemp(prefix="benchmark_")
+    results = {"created": time.strftime("%Y-%m-%dT%H:%M:%S"), "model": args.model, "environment": environment(),
+               "settings": {"frames": args.frames, "batch_size": args.batch_size, "predict_args": predict_args,
+                            "inference": model.backend_options,
+                            "annotation": args.annotate, "encoder": encoder_options},
+               "clips": {}}
+    try:
+        clips = [(os.path.basename(path), path) for path in args.clip]
+        for geometry in args.synthetic or ([] if args.clip else ["1280x720"]):
+            width, height = (int(v) for v in geometry.lower().split("x"))
+            path = make_synthetic_clip(os.path.join(work_dir, f"sintetico_{geometry}.mp4"), (width, height), args.frames)
+            clips.append((f"sintetico_{geometry}", path))
+        for name, path in clips:
+            print(f"Midiendo {name}...")
+            results["clips"][name] = bench_clip(model, path, work_dir, args.frames, args.batch_size, predict_args,
+                                                args.annotate, encoder_options, pipeline=not args.no_pipeline)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print_results(results)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+        print(f"\nResultados guardados en: {args.output}")
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        rows = compare(results, baseline, args.tolerance)
+        print_comparison(rows, args.tolerance)
+        if any(row[-1] for row in rows):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
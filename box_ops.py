@@ -0,0 +1,171 @@
+"""Operaciones vectorizadas sobre cajas xyxy (arrays NumPy)."""
+import numpy as np
+
+
+def box_area(boxes):
+    return np.clip(boxes[:, 2] - boxes[:, 0], 0, None) * np.clip(boxes[:, 3] - boxes[:, 1], 0, None)
+
+
+def scale_boxes(boxes, scale):
+    """Copia de boxes (N, >=4) con las coordenadas xyxy multiplicadas por scale."""
+    scaled = np.array(boxes, dtype=np.float32, copy=True)
+    scaled[:, :4] *= scale
+    return scaled
+
+
+def translate_boxes(boxes, dx, dy):
+    """Copia de boxes (N, >=4) con las coordenadas xyxy desplazadas (dx, dy)."""
+    moved = np.array(boxes, dtype=np.float32, copy=True)
+    moved[:, [0, 2]] += dx
+    moved[:, [1, 3]] += dy
+    return moved
+
+
+def clamp_roi(roi, width, height):
+    """Región de interés (x1, y1, x2, y2) en píxeles enteros dentro de un frame width x height.
+
+    Las esquinas pueden venir en cualquier orden. Lanza ValueError si la región queda vacía.
+    """
+    x1, x2 = sorted(int(round(v)) for v in (roi[0], roi[2]))
+    y1, y2 = sorted(int(round(v)) for v in (roi[1], roi[3]))
+    x1, x2 = max(0, min(x1, width)), max(0, min(x2, width))
+    y1, y2 = max(0, min(y1, height)), max(0, min(y2, height))
+    if x2 - x1 < 2 or y2 - y1 < 2:
+        raise ValueError(f"La región de interés {tuple(roi)} queda fuera del frame de {width}x{height}.")
+    return x1, y1, x2, y2
+
+
+def paired_iou(boxes_a, boxes_b):
+    """IoU fila a fila de dos arrays de cajas (N, 4) alineados. Devuelve (N,)."""
+    top_left = np.maximum(boxes_a[:, :2], boxes_b[:, :2])
+    bottom_right = np.minimum(boxes_a[:, 2:4], boxes_b[:, 2:4])
+    intersection = np.prod(np.clip(bottom_right - top_left, 0, None), axis=1)
+    union = box_area(boxes_a) + box_area(boxes_b) - intersection
+    return (intersection / np.maximum(union, 1e-9)).astype(np.float32)
+
+
+def overlapping_pairs(boxes_a, boxes_b):
+    """Parejas (i, j) cuyas cajas se solapan, sin recorrer la matriz completa N x M.
+
+    Las cajas de boxes_b se reparten en franjas horizontales de la altura de la mayor caja y,
+    dentro de cada franja, se ordenan por x1. Para cada caja de boxes_a se localiza con
+    searchsorted, en las pocas franjas que puede tocar, el tramo de boxes_b que puede
+    solaparla. Con cajas pequeñas y repartidas (células) el número de candidatas crece casi
+    linealmente en vez de cuadráticamente, también en imágenes muy altas. Las parejas salen
+    ordenadas por i.
+    """
+    if len(boxes_a) == 0 or len(boxes_b) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    boxes_a = np.asarray(boxes_a, dtype=np.float64)
+    boxes_b = np.asarray(boxes_b, dtype=np.float64)
+    max_width = float((boxes_b[:, 2] - boxes_b[:, 0]).max())
+    max_height = float((boxes_b[:, 3] - boxes_b[:, 1]).max())
+    band_height = max_height if max_height > 0 else 1.0
+    x_min = float(boxes_b[:, 0].min())
+    x_range = float(boxes_b[:, 0].max()) - x_min
+    span = x_range + 2 # Separa las franjas en la clave compuesta franja * span + x
+    bands = np.floor(boxes_b[:, 1] / band_height)
+    first_band = bands.min()
+    keys = (bands - first_band) * span + (boxes_b[:, 0] - x_min)
+    order = np.argsort(keys, kind="stable")
+    keys = keys[order]
+
+    # Franjas de boxes_b cuyo y1 puede caer en (y1_a - max_height, y2_a)
+    low = np.floor((boxes_a[:, 1] - max_height) / band_height) - first_band
+    high = np.floor(boxes_a[:, 3] / band_height) - first_band
+    x_low = np.clip(boxes_a[:, 0] - max_width - x_min, -0.5, x_range + 0.5)
+    x_high = np.clip(boxes_a[:, 2] - x_min, -0.5, x_range + 0.5)
+    all_rows, all_cols = [], []
+    for step in range(int((high - low).max()) + 1):
+        band = low + step
+        lo = np.searchsorted(keys, band * span + x_low, side="left")
+        hi = np.searchsorted(keys, band * span + x_high, side="right")
+        counts = np.where(band <= high, np.maximum(hi - lo, 0), 0)
+        rows = np.repeat(np.arange(len(boxes_a)), counts)
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        all_rows.append(rows)
+        all_cols.append(order[np.repeat(lo, counts) + offsets])
+    rows, cols = np.concatenate(all_rows), np.concatenate(all_cols)
+    overlap = ((boxes_b[cols, 0] < boxes_a[rows, 2]) & (boxes_b[cols, 2] > boxes_a[rows, 0]) &
+               (boxes_b[cols, 1] < boxes_a[rows, 3]) & (boxes_b[cols, 3] > boxes_a[rows, 1]))
+    rows, cols = rows[overlap], cols[overlap]
+    by_row = np.argsort(rows, kind="stable")
+    return rows[by_row], cols[by_row]
+
+
+def iou_matrix(boxes_a, boxes_b):
+    """IoU de cada caja de boxes_a (N, 4) con cada caja de boxes_b (M, 4). Devuelve (N, M)."""
+    if len(boxes_a) == 0 or len(boxes_b) == 0:
+        return np.zeros((len(boxes_a), len(boxes_b)), dtype=np.float32)
+    top_left = np.maximum(boxes_a[:, None, :2], boxes_b[None, :, :2])
+    bottom_right = np.minimum(boxes_a[:, None, 2:4], boxes_b[None, :, 2:4])
+    intersection = np.prod(np.clip(bottom_right - top_left, 0, None), axis=2)
+    union = box_area(boxes_a)[:, None] + box_area(boxes_b)[None, :] - intersection
+    return (intersection / np.maximum(union, 1e-9)).astype(np.float32)
+
+
+def nms(boxes, scores, iou_threshold=0.5, class_ids=None):
+    """Non-maximum suppression. Devuelve los índices conservados, de mayor a menor score.
+
+    Con class_ids, solo se suprimen entre sí cajas de la misma clase (se desplazan las cajas de
+    cada clase a una zona distinta del plano, como hace torchvision.ops.batched_nms). Las IoU
+    solo se calculan para las parejas que se solapan (overlapping_pairs), así que el coste
+    crece con el número de solapes y no con N x conservadas.
+    """
+    if len(boxes) == 0:
+        return np.zeros(0, dtype=np.int64)
+    boxes = boxes[:, :4].astype(np.float64)
+    if class_ids is not None:
+        offset = boxes.max() + 1
+        boxes = boxes + (np.asarray(class_ids, dtype=np.float64) * offset)[:, None]
+    order = np.argsort(-np.asarray(scores), kind="stable")
+    rank = np.empty(len(order), dtype=np.int64)
+    rank[order] = np.arange(len(order))
+    rows, cols = overlapping_pairs(boxes, boxes)
+    pairs = rank[rows] < rank[cols] # Cada pareja una vez: la caja de más score puede suprimir a la otra
+    rows, cols = rows[pairs], cols[pairs]
+    suppresses = paired_iou(boxes[rows], boxes[cols]) > iou_threshold
+    rows, cols = rows[suppresses], cols[suppresses]
+    by_row = np.argsort(rows, kind="stable")
+    rows, cols = rows[by_row], cols[by_row]
+    bounds = np.searchsorted(rows, np.arange(len(boxes) + 1))
+    suppressed = np.zeros(len(boxes), dtype=bool)
+    keep = []
+    for best in order:
+        if suppressed[best]:
+            continue
+        keep.append(best)
+        suppressed[cols[bounds[best]:bounds[best + 1]]] = True
+    return np.asarray(keep, dtype=np.int64)
+
+
+def class_aware_iou(boxes_a, boxes_b):
+    """iou_matrix sobre cajas (N, 6) con la IoU anulada entre cajas de clases distintas."""
+    iou = iou_matrix(boxes_a[:, :4], boxes_b[:, :4])
+    if iou.size:
+        iou[boxes_a[:, 5][:, None] != boxes_b[:, 5][None, :]] = 0
+    return iou
+
+
+def greedy_match(iou, min_iou=0.5):
+    """Empareja filas y columnas de una matriz de IoU de mayor a menor. Devuelve (filas, columnas)."""
+    rows, cols = np.nonzero(iou >= min_iou)
+    order = np.argsort(-iou[rows, cols], kind="stable")
+    used_rows, used_cols, matches = set(), set(), []
+    for row, col in zip(rows[order], cols[order]):
+        if row not in used_rows and col not in used_cols:
+            used_rows.add(row)
+            used_cols.add(col)
+            matches.append((row, col))
+    if not matches:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    matched_rows, matched_cols = zip(*matches)
+    return np.asarray(matched_rows, dtype=np.int64), np.asarray(matched_cols, dtype=np.int64)
+
+
+def parse_roi(text):
+    """Región de interés "x1,y1,x2,y2" (píxeles) como tupla de enteros. Lanza ValueError si no tiene ese formato."""
+    values = [int(v) for v in text.replace(" ", "").split(",")]
+    if len(values) != 4:
+        raise ValueError(f"Región de interés no válida: '{text}' (usa x1,y1,x2,y2).")
+    return tuple(values)
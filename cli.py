@@ -0,0 +1,198 @@
+"""Procesamiento por lotes sin GUI.
+
+Ejemplos:
+    python cli.py muestras/ --output-dir salida
+    python cli.py "sesion_*/*.mp4" --workers 4 --batch-size 16
+    python cli.py portaobjetos/*.tif --tile --tile-size 1024
+    python cli.py timelapse.mp4 --stride 8 --motion-threshold 4 --audit-every 20
+    python cli.py muestras/ --annotate none   (solo detecciones; dibujar después con annotator.py)
+    python cli.py sesion.mp4 --codec h265 --quality 28 --scale 0.5 --frame-step 2   (vista previa ligera)
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+
+import detector
+import tiling as tiling_mod
+from frame_skip import DEFAULT_STRIDE
+from annotator import ANNOTATION_STYLES, DEFAULT_STYLE
+from encoder import CODECS, PRESETS, DEFAULT_CODEC, DEFAULT_PRESET, DEFAULT_QUALITY
+from detection_cache import DetectionCache, DEFAULT_CACHE_DIR
+from detection_store import EXPORT_FORMATS
+from worker_pool import WorkerPool, DEFAULT_EXPORT_FORMAT, output_paths, process_file
+from inference_backends import add_backend_arguments, backend_options, select_backend
+from box_ops import parse_roi
+from frame_pool import DEFAULT_MEMORY_CEILING_MB
+
+
+def collect_inputs(patterns):
+    """Expande archivos, directorios y patrones glob en una lista ordenada de imágenes/videos soportados."""
+    paths = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            candidates = [os.path.join(pattern, name) for name in sorted(os.listdir(pattern))]
+        else:
+            candidates = sorted(glob.glob(pattern)) or [pattern]
+        for path in candidates:
+            if os.path.isfile(path) and (detector.is_image(path) or detector.is_video(path)):
+                paths.append(path)
+            elif path == pattern:
+                print(f"Aviso: se ignora '{path}' (no existe o formato no soportado).", file=sys.stderr)
+    # Quitar duplicados manteniendo el orden
+    return list(dict.fromkeys(os.path.abspath(p) for p in paths))
+
+
+def describe(summary):
+    """Línea de progreso de un archivo terminado."""
+    text = f"{os.path.basename(summary['input'])}: {summary['detections']} detecciones"
+    if "tracks" in summary:
+        text += f", {summary['tracks']} células distintas"
+    skip = summary.get("frame_skip")
+    if skip:
+        text += f" ({skip['inferred'] + skip['audited']}/{skip['frames']} frames por el modelo, {skip['speedup']}x"
+        if skip["interpolation_f1"] is not None:
+            text += f", F1 interpolación {skip['interpolation_f1']}"
+        text += ")"
+    return text
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Detector YOLO de células por lotes (sin GUI).")
+    parser.add_argument("inputs", nargs="+", help="Archivos, directorios o patrones glob de imágenes/videos")
+    parser.add_argument("-o", "--output-dir", default="salida", help="Directorio de salida (por defecto: salida)")
+    parser.add_argument("-w", "--workers", type=int, default=1, help="Procesos en paralelo; cada uno carga el modelo una vez")
+    parser.add_argument("-b", "--batch-size", type=int, default=detector.DEFAULT_BATCH_SIZE, help="Frames por lote de inferencia en videos")
+    parser.add_argument("-m", "--model", default=detector.MODEL_NAME, help=f"Pesos YOLO (por defecto: {detector.MODEL_NAME})")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR, help=f"Caché de detecciones (por defecto: {DEFAULT_CACHE_DIR})")
+    parser.add_argument("--no-cache", action="store_true", help="No leer ni escribir la caché de detecciones")
+    parser.add_argument("-f", "--format", choices=EXPORT_FORMATS + ("none",), default=DEFAULT_EXPORT_FORMAT,
+                        help="Exportación del almacén de detecciones de cada archivo (por defecto: csv)")
+    parser.add_argument("--tile", action="store_true",
+                        help="Inferencia por teselas a resolución nativa (imágenes grandes). Solo los TIFF sin "
+                             f"comprimir se leen por regiones; el resto se decodifica completo (hasta "
+                             f"{tiling_mod.MAX_DECODED_MB} MB)")
+    parser.add_argument("--tile-size", type=int, default=tiling_mod.DEFAULT_TILE_SIZE,
+                        help=f"Lado de cada tesela en píxeles (por defecto: {tiling_mod.DEFAULT_TILE_SIZE})")
+    parser.add_argument("--tile-overlap", type=float, default=tiling_mod.DEFAULT_TILE_OVERLAP,
+                        help=f"Solape entre teselas, 0-0.9 (por defecto: {tiling_mod.DEFAULT_TILE_OVERLAP})")
+    parser.add_argument("--stride", type=int, default=DEFAULT_STRIDE,
+                        help="Videos: detectar uno de cada N frames e interpolar el resto (por defecto: todos)")
+    parser.add_argument("--motion-threshold", type=float, default=None,
+                        help="Videos: detectar también cuando la diferencia media de gris (0-255) con la última detección lo supera")
+    parser.add_argument("--audit-every", type=int, default=0,
+                        help="Videos con salto: detectar además 1 de cada N frames interpolados para medir su F1")
+    parser.add_argument("--track", action="store_true",
+                        help="Videos: seguir cada célula entre frames (track_id) y guardar estadísticas por trayectoria")
+    parser.add_argument("-a", "--annotate", choices=ANNOTATION_STYLES, default=DEFAULT_STYLE,
+                        help="Estilo de la salida anotada; 'none' solo guarda las detecciones (por defecto: labels)")
+    parser.add_argument("--codec", choices=tuple(CODECS), default=DEFAULT_CODEC,
+                        help=f"Códec de los videos de salida (por defecto: {DEFAULT_CODEC}; sin ffmpeg puede caer a mp4v)")
+    parser.add_argument("--quality", type=int, default=DEFAULT_QUALITY,
+                        help=f"Calidad CRF 0-51, menor = mejor y más pesado (por defecto: {DEFAULT_QUALITY})")
+    parser.add_argument("--preset", choices=PRESETS, default=DEFAULT_PRESET,
+                        help=f"Preset de velocidad de ffmpeg para h264/h265 (por defecto: {DEFAULT_PRESET})")
+    parser.add_argument("--encoder", choices=("auto", "ffmpeg", "opencv"), default="auto",
+                        help="Backend de codificación; auto usa ffmpeg si está instalado (por defecto: auto)")
+    parser.add_argument("--scale", type=float, default=1.0,
+                        help="Escala de resolución de los videos de salida, p. ej. 0.5 para vistas previas (por defecto: 1)")
+    parser.add_argument("--frame-step", type=int, default=1,
+                        help="Escribir solo 1 de cada N frames en los videos de salida (por defecto: todos)")
+    parser.add_argument("--roi", default=None, metavar="X1,Y1,X2,Y2",
+                        help="Detectar solo en esta región (píxeles del frame); las cajas se guardan en coordenadas completas")
+    parser.add_argument("--roi-output", action="store_true", help="Con --roi, anotar y codificar solo la región")
+    parser.add_argument("--max-memory", type=float, default=DEFAULT_MEMORY_CEILING_MB, metavar="MB",
+                        help=f"Memoria máxima de frames en vuelo por video y proceso (por defecto: {DEFAULT_MEMORY_CEILING_MB} MB)")
+    add_backend_arguments(parser)
+    args = parser.parse_args(argv)
+    if not 0 <= args.tile_overlap < 0.9:
+        parser.error("--tile-overlap debe estar entre 0 y 0.9")
+    tiling = {"tile_size": args.tile_size, "overlap": args.tile_overlap} if args.tile else None
+    if args.stride < 1:
+        parser.error("--stride debe ser al menos 1")
+    if not 0 <= args.quality <= 51:
+        parser.error("--quality debe estar entre 0 y 51")
+    if not 0 < args.scale <= 1:
+        parser.error("--scale debe estar entre 0 (excluido) y 1")
+    if args.frame_step < 1:
+        parser.error("--frame-step debe ser al menos 1")
+    if args.max_memory <= 0:
+        parser.error("--max-memory debe ser mayor que 0")
+    roi = None
+    if args.roi:
+        try:
+            roi = {"box": parse_roi(args.roi), "crop_output": args.roi_output}
+        except ValueError as e:
+            parser.error(str(e))
+    encoder_options = {"codec": args.codec, "quality": args.quality, "preset": args.preset, "backend": args.encoder,
+                       "scale": args.scale, "frame_step": args.frame_step}
+    frame_skip = {"stride": args.stride, "motion_threshold": args.motion_threshold, "audit_interval": args.audit_every}
+    cache_dir = None if args.no_cache else args.cache_dir
+    export_format = None if args.format == "none" else args.format
+
+    inputs = collect_inputs(args.inputs)
+    if not inputs:
+        print("Error: no se encontraron imágenes ni videos para procesar.", file=sys.stderr)
+        return 1
+    if not os.path.exists(args.model):
+        print(f"Error: el archivo del modelo '{args.model}' no se encuentra.", file=sys.stderr)
+        return 1
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    used_stems = set()
+    jobs = [(path, *output_paths(path, args.output_dir, used_stems)) for path in inputs]
+    summaries = []
+    failed = 0
+    print(f"Procesando {len(jobs)} archivo(s) con {args.workers} proceso(s)...")
+
+    if args.workers <= 1:
+        model = detector.load_model(args.model, **backend_options(args))
+        cache = DetectionCache(cache_dir) if cache_dir else None
+        for input_path, media_path, store_dir in jobs:
+            try:
+                summary = process_file(input_path, media_path, store_dir, args.batch_size, model=model, cache=cache,
+                                       export_format=export_format, tiling=tiling, frame_skip=frame_skip,
+                                       track=args.track, annotation=args.annotate, encoder_options=encoder_options,
+                                       roi=roi, max_memory_mb=args.max_memory)
+                summaries.append(summary)
+                print(f"[{len(summaries)}/{len(jobs)}] {describe(summary)}")
+            except Exception as e:
+                failed += 1
+                print(f"Error procesando {input_path}: {e}", file=sys.stderr)
+    else:
+        model_options = backend_options(args)
+        if args.backend == "auto": # Se elige una vez aquí y no en cada trabajador
+            model_options["backend"] = select_backend(args.model, args.imgsz, args.threads, args.quantization,
+                                                     args.samples, calibration_data=args.calibration_data)
+            if model_options["backend"] == "pytorch":
+                model_options["quantization"] = None
+        pool = WorkerPool(args.model, args.output_dir, workers=args.workers, batch_size=args.batch_size,
+                          cache_dir=cache_dir, export_format=export_format, tiling=tiling,
+                          frame_skip=frame_skip, track=args.track, annotation=args.annotate,
+                          encoder_options=encoder_options, model_options=model_options, roi=roi,
+                          max_memory_mb=args.max_memory)
+        for input_path, media_path, store_dir in jobs:
+            pool.submit(input_path, media_path, store_dir)
+        while pool.pending or len(summaries) + failed < len(jobs):
+            for event in pool.poll(timeout=0.5):
+                kind, input_path = event[0], event[1]
+                if kind == "done":
+                    summary = event[2]
+                    summaries.append(summary)
+                    print(f"[{len(summaries)}/{len(jobs)}] {describe(summary)}")
+                elif kind == "error":
+                    failed += 1
+                    print(f"Error procesando {input_path}: {event[2]}", file=sys.stderr)
+        pool.shutdown()
+
+    summaries.sort(key=lambda s: s["input"])
+    summary_path = os.path.join(args.output_dir, "resumen.json")
+    with open(summary_path, "w", encoding="utf-8") as f:
+        json.dump({"model": args.model, "files": summaries}, f, indent=2, ensure_ascii=False)
+    print(f"Resumen guardado en: {summary_path}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,234 @@
+"""Caché en disco de detecciones por frame.
+
+Cada entrada guarda las cajas (x1, y1, x2, y2, conf, cls) de todos los frames de un archivo y se
+identifica por el hash del contenido del archivo, el hash de los pesos del modelo y los
+parámetros de inferencia. Si nada de eso cambió, se puede volver a dibujar el resultado sin
+ejecutar el modelo.
+
+Las entradas son archivos .npz independientes que se escriben de forma atómica, así que varios
+procesos pueden compartir la misma carpeta. La fecha de modificación de cada archivo hace de
+"último acceso" para la política LRU que mantiene la carpeta por debajo de max_bytes.
+
+Un video se guarda frame a frame con writer() (CacheWriter): las cajas van a un archivo
+temporal en disco y la entrada se crea al final, sin acumular todas las detecciones en RAM.
+
+El nombre de cada entrada lleva los hashes de la entrada y de los pesos. El memo de hashes
+(hashes.json) se actualiza bajo un cerrojo entre procesos, y al desalojar entradas se olvidan
+los hashes que ya no usa ninguna.
+"""
+import glob
+import hashlib
+import json
+import os
+import time
+from array import array
+import numpy as np
+from file_lock import file_lock
+
+DEFAULT_CACHE_DIR = ".cache_detecciones"
+DEFAULT_CACHE_MAX_BYTES = 2 * 1024 ** 3 # 2 GB
+CACHE_VERSION = 1 # Cambiarlo invalida todas las entradas si cambia el formato
+
+_HASH_CHUNK = 1024 * 1024
+_HASH_MEMO_FILE = "hashes.json"
+_LOCK_FILE = ".lock"
+_STALE_TMP_S = 24 * 3600 # Temporales de procesos que murieron a medias: se borran tras un día
+
+
+def boxes_array(result):
+    """Cajas de un resultado de YOLO como array float32 (N, 6): x1, y1, x2, y2, conf, cls."""
+    return result.boxes.data.cpu().numpy().astype(np.float32, copy=False)
+
+
+def _model_weights_path(model):
+    path = getattr(model, "ckpt_path", None) or getattr(model, "model_name", None) or ""
+    if path and os.path.isdir(path): # Modelo OpenVINO exportado: los pesos están en el .bin
+        path = next(iter(sorted(glob.glob(os.path.join(path, "*.bin")))), path)
+    return path
+
+
+class DetectionCache:
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    # --- Claves ---
+    def file_hash(self, path):
+        """Hash del contenido de un archivo. Se memoriza por (ruta, tamaño, mtime) para no releer videos grandes."""
+        stat = os.stat(path)
+        memo_key = os.path.abspath(path)
+        signature = [stat.st_size, stat.st_mtime_ns]
+        memo = self._load_hash_memo()
+        entry = memo.get(memo_key)
+        if entry and entry[:2] == signature:
+            return entry[2]
+
+        digest = hashlib.blake2b(digest_size=16)
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(_HASH_CHUNK), b""):
+                digest.update(chunk)
+        content_hash = digest.hexdigest()
+        with self._lock():
+            memo = self._load_hash_memo() # Releer: otro proceso pudo añadir hashes mientras se calculaba
+            memo[memo_key] = signature + [content_hash]
+            self._save_hash_memo(memo)
+        return content_hash
+
+    def key_for(self, input_path, model, params=None):
+        """Clave de caché: contenido de la entrada + pesos del modelo + parámetros de inferencia.
+
+        Es "<hash entrada>-<hash pesos>-<hash parámetros>", para saber qué hashes del memo siguen en uso.
+        """
+        weights_path = _model_weights_path(model)
+        if weights_path and os.path.exists(weights_path):
+            weights_hash = self.file_hash(weights_path)
+        else:
+            weights_hash = hashlib.blake2b(str(weights_path).encode("utf-8"), digest_size=16).hexdigest()
+        imgsz = (getattr(model, "backend_options", None) or {}).get("imgsz")
+        if imgsz: # El tamaño de entrada cambia las detecciones
+            params = dict(params or {}, imgsz=imgsz)
+        payload = json.dumps({"version": CACHE_VERSION, "params": params or {}}, sort_keys=True, default=str)
+        params_hash = hashlib.blake2b(payload.encode("utf-8"), digest_size=16).hexdigest()
+        return f"{self.file_hash(input_path)}-{weights_hash}-{params_hash}"
+
+    # --- Lectura / escritura ---
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.npz")
+
+    def get(self, key):
+        """Devuelve la lista de arrays (N, 6) por frame, o None si no hay entrada."""
+        path = self._entry_path(key)
+        try:
+            with np.load(path) as data:
+                boxes, offsets = data["boxes"], data["offsets"]
+        except (OSError, KeyError, ValueError):
+            return None
+        try:
+            os.utime(path) # Marca de último acceso para la política LRU
+        except OSError:
+            pass
+        return [boxes[offsets[i]:offsets[i + 1]] for i in range(len(offsets) - 1)]
+
+    def put(self, key, frame_boxes):
+        """Guarda las cajas de todos los frames (lista de arrays (N, 6)) y aplica el límite de tamaño."""
+        counts = np.fromiter((len(b) for b in frame_boxes), dtype=np.int64, count=len(frame_boxes))
+        boxes = np.concatenate(frame_boxes).astype(np.float32) if frame_boxes else np.zeros((0, 6), np.float32)
+        self._write_entry(key, boxes, counts)
+
+    def writer(self, key):
+        """CacheWriter para guardar la entrada key frame a frame."""
+        return CacheWriter(self, key)
+
+    def _write_entry(self, key, boxes, counts):
+        offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        path = self._entry_path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, boxes=boxes, offsets=offsets)
+        os.replace(tmp_path, path) # Escritura atómica: nunca se lee una entrada a medias
+        self.evict()
+
+    def evict(self):
+        """Borra las entradas menos usadas recientemente hasta quedar por debajo de max_bytes.
+
+        Después olvida del memo los hashes que ya no aparecen en ninguna entrada.
+        """
+        entries = []
+        total = 0
+        now = time.time()
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if name.endswith(".tmp"):
+                try:
+                    if now - os.stat(path).st_mtime > _STALE_TMP_S:
+                        os.remove(path)
+                except OSError:
+                    pass
+                continue
+            if not name.endswith(".npz"):
+                continue
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime_ns, stat.st_size, name))
+            total += stat.st_size
+        entries.sort()
+        kept = []
+        for _, size, name in entries:
+            if total > self.max_bytes:
+                try:
+                    os.remove(os.path.join(self.cache_dir, name))
+                    total -= size
+                    continue
+                except OSError:
+                    pass
+            kept.append(name)
+        self._prune_hash_memo(kept)
+
+    # --- Memo de hashes ---
+    def _lock(self):
+        return file_lock(os.path.join(self.cache_dir, _LOCK_FILE))
+
+    def _prune_hash_memo(self, entry_names):
+        used = {part for name in entry_names for part in name[:-len(".npz")].split("-")}
+        with self._lock():
+            memo = self._load_hash_memo()
+            pruned = {path: entry for path, entry in memo.items() if entry[2] in used}
+            if len(pruned) != len(memo):
+                self._save_hash_memo(pruned)
+
+    def _load_hash_memo(self):
+        try:
+            with open(os.path.join(self.cache_dir, _HASH_MEMO_FILE), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_hash_memo(self, memo):
+        """Escritura atómica; quien llama debe tener el cerrojo (_lock) para no pisar a otro proceso."""
+        path = os.path.join(self.cache_dir, _HASH_MEMO_FILE)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(memo, f)
+        os.replace(tmp_path, path)
+
+
+class CacheWriter:
+    """Entrada de caché escrita frame a frame: append() por frame y commit() al final (o discard())."""
+
+    def __init__(self, cache, key):
+        self.cache = cache
+        self.key = key
+        self._path = f"{cache._entry_path(key)}.{os.getpid()}.{id(self)}.boxes.tmp"
+        self._file = open(self._path, "wb")
+        self._counts = array("q") # Detecciones por frame (8 bytes por frame)
+
+    def append(self, boxes):
+        boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 6)
+        self._file.write(boxes.tobytes())
+        self._counts.append(len(boxes))
+
+    def commit(self):
+        """Crea la entrada .npz a partir del archivo temporal, leído por mapa de memoria."""
+        self._file.close()
+        counts = np.frombuffer(self._counts, dtype=np.int64) if len(self._counts) else np.zeros(0, np.int64)
+        total = int(counts.sum())
+        boxes = np.memmap(self._path, dtype=np.float32, mode="r", shape=(total, 6)) if total else np.zeros((0, 6), np.float32)
+        try:
+            self.cache._write_entry(self.key, boxes, counts)
+        finally:
+            del boxes
+            self._remove()
+
+    def discard(self):
+        self._file.close()
+        self._remove()
+
+    def _remove(self):
+        try:
+            os.remove(self._path)
+        except OSError:
+            pass
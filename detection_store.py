@@ -0,0 +1,210 @@
+"""Almacén columnar de detecciones respaldado por archivos memory-mapped.
+
+Cada columna (frame_idx, class_id, conf, xyxy, track_id) es un archivo binario plano dentro de un
+directorio, más un meta.json con la longitud, el número de frames y los nombres de clase.
+Añadir detecciones escribe directamente sobre el mapa de memoria; cuando se llena, los archivos
+se agrandan al doble (truncate) y se vuelven a mapear, sin copiar los datos ya escritos.
+Así se pueden guardar millones de frames sin mantener objetos Boxes ni filas de Python en RAM.
+"""
+import csv
+import json
+import os
+import numpy as np
+
+INITIAL_CAPACITY = 4096 # Detecciones reservadas al crear el almacén
+EXPORT_CHUNK = 1_000_000 # Filas por bloque al exportar a CSV
+META_FILE = "meta.json"
+
+# nombre -> (dtype, ancho); ancho None significa columna 1D
+COLUMNS = {
+    "frame_idx": (np.int32, None),
+    "class_id": (np.int16, None),
+    "conf": (np.float32, None),
+    "xyxy": (np.float32, 4),
+    "track_id": (np.int32, None), # -1 si la detección no se siguió entre frames
+}
+EXPORT_FORMATS = ("csv", "parquet", "npz")
+
+
+class DetectionStore:
+    def __init__(self, directory, names=None, capacity=INITIAL_CAPACITY):
+        """Crea un almacén vacío en directory (se sobrescribe si ya existía)."""
+        self.directory = directory
+        self.names = dict(names or {})
+        self.num_frames = 0
+        self.readonly = False
+        self._length = 0
+        self._capacity = 0
+        self._cols = {}
+        os.makedirs(directory, exist_ok=True)
+        for name in COLUMNS:
+            open(self._column_path(name), "wb").close()
+        self._reserve(max(1, int(capacity)))
+
+    @classmethod
+    def open(cls, directory):
+        """Abre un almacén existente en modo solo lectura."""
+        with open(os.path.join(directory, META_FILE), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        store = cls.__new__(cls)
+        store.directory = directory
+        store.names = {int(k): v for k, v in meta["names"].items()}
+        store.num_frames = meta["num_frames"]
+        store.readonly = True
+        store._length = store._capacity = meta["length"]
+        store._cols = {}
+        for name, (dtype, width) in COLUMNS.items():
+            if os.path.exists(store._column_path(name)):
+                store._cols[name] = store._map(name, store._length, "r")
+            else: # Almacén anterior a la columna track_id
+                store._cols[name] = np.full(store._length, -1, dtype=dtype)
+        return store
+
+    def __len__(self):
+        return self._length
+
+    def _column_path(self, name):
+        return os.path.join(self.directory, f"{name}.bin")
+
+    def _map(self, name, rows, mode):
+        dtype, width = COLUMNS[name]
+        shape = (rows,) if width is None else (rows, width)
+        if rows == 0:
+            return np.zeros(shape, dtype=dtype) # np.memmap no admite archivos vacíos
+        return np.memmap(self._column_path(name), dtype=dtype, mode=mode, shape=shape)
+
+    def _reserve(self, needed):
+        if needed <= self._capacity:
+            return
+        capacity = max(needed, self._capacity * 2)
+        for name, (dtype, width) in COLUMNS.items():
+            column = self._cols.pop(name, None)
+            if isinstance(column, np.memmap):
+                column.flush()
+            del column
+            with open(self._column_path(name), "r+b") as f:
+                f.truncate(capacity * np.dtype(dtype).itemsize * (width or 1))
+            self._cols[name] = self._map(name, capacity, "r+")
+        self._capacity = capacity
+
+    # --- Escritura ---
+    def append(self, frame_idx, boxes, track_ids=None):
+        """Añade las detecciones de un frame. boxes es un array (N, 6): x1, y1, x2, y2, conf, cls.
+
+        track_ids (N,) es opcional; sin él las detecciones se guardan con track_id -1.
+        """
+        if self.readonly:
+            raise IOError("El almacén de detecciones está abierto en modo solo lectura.")
+        self.num_frames = max(self.num_frames, frame_idx + 1)
+        n = len(boxes)
+        if n == 0:
+            return
+        self._reserve(self._length + n)
+        rows = slice(self._length, self._length + n)
+        self._cols["frame_idx"][rows] = frame_idx
+        self._cols["class_id"][rows] = boxes[:, 5]
+        self._cols["conf"][rows] = boxes[:, 4]
+        self._cols["xyxy"][rows] = boxes[:, :4]
+        self._cols["track_id"][rows] = -1 if track_ids is None else track_ids
+        self._length += n
+
+    def flush(self):
+        for column in self._cols.values():
+            if isinstance(column, np.memmap) and not self.readonly:
+                column.flush()
+        if not self.readonly:
+            self._write_meta()
+
+    def close(self):
+        """Vuelca los datos, recorta los archivos a la longitud real y deja el almacén en solo lectura."""
+        if self.readonly:
+            return
+        self.flush()
+        self._cols = {}
+        for name, (dtype, width) in COLUMNS.items():
+            with open(self._column_path(name), "r+b") as f:
+                f.truncate(self._length * np.dtype(dtype).itemsize * (width or 1))
+        self._capacity = self._length
+        self.readonly = True
+        self._cols = {name: self._map(name, self._length, "r") for name in COLUMNS}
+
+    def _write_meta(self):
+        meta = {"length": self._length, "num_frames": self.num_frames,
+                "names": {str(k): v for k, v in self.names.items()},
+                "columns": {name: [np.dtype(dtype).str, width] for name, (dtype, width) in COLUMNS.items()}}
+        tmp_path = os.path.join(self.directory, META_FILE + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, os.path.join(self.directory, META_FILE))
+
+    # --- Lectura ---
+    def column(self, name):
+        """Vista (sin copia) de una columna con las detecciones guardadas."""
+        return self._cols[name][:self._length]
+
+    @property
+    def has_tracks(self):
+        return bool(self._length) and bool((self.column("track_id") >= 0).any())
+
+    def num_tracks(self):
+        track_ids = self.column("track_id")
+        return len(np.unique(track_ids[track_ids >= 0]))
+
+    def class_names_found(self):
+        ids = np.unique(self.column("class_id"))
+        return sorted(self.names.get(int(i), str(int(i))) for i in ids)
+
+    def frame_counts(self, per_class=False):
+        """Detecciones por frame (num_frames,), o por frame y clase (num_frames, num_clases) con per_class=True."""
+        frames = self.column("frame_idx")
+        if not per_class:
+            return np.bincount(frames, minlength=self.num_frames)
+        num_classes = max(len(self.names), int(self.column("class_id").max()) + 1 if self._length else 0)
+        flat = frames.astype(np.int64) * num_classes + self.column("class_id")
+        return np.bincount(flat, minlength=self.num_frames * num_classes).reshape(self.num_frames, num_classes)
+
+    # --- Exportación ---
+    def export(self, path):
+        """Exporta según la extensión de path: .csv, .parquet o .npz."""
+        ext = os.path.splitext(path)[1].lower().lstrip(".")
+        if ext == "csv":
+            self.to_csv(path)
+        elif ext == "parquet":
+            self.to_parquet(path)
+        elif ext == "npz":
+            self.to_npz(path)
+        else:
+            raise ValueError(f"Formato de exportación no soportado: '{ext}' (usa {', '.join(EXPORT_FORMATS)}).")
+
+    def to_npz(self, path):
+        np.savez_compressed(path, frame_idx=self.column("frame_idx"), class_id=self.column("class_id"),
+                            conf=self.column("conf"), xyxy=self.column("xyxy"), track_id=self.column("track_id"),
+                            names=np.array(json.dumps(self.names, ensure_ascii=False)))
+
+    def to_csv(self, path):
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(("frame", "class_id", "class_name", "conf", "x1", "y1", "x2", "y2", "track_id"))
+            for start in range(0, self._length, EXPORT_CHUNK):
+                rows = slice(start, start + EXPORT_CHUNK)
+                class_ids = self.column("class_id")[rows].tolist()
+                # float64 antes de redondear para que el CSV no arrastre el ruido de float32
+                xyxy = np.round(self.column("xyxy")[rows].astype(np.float64), 1).tolist()
+                writer.writerows(
+                    (frame, cls, self.names.get(cls, str(cls)), conf, *box, track)
+                    for frame, cls, conf, box, track in zip(self.column("frame_idx")[rows].tolist(), class_ids,
+                                                            np.round(self.column("conf")[rows].astype(np.float64), 4).tolist(),
+                                                            xyxy, self.column("track_id")[rows].tolist()))
+
+    def to_dataframe(self):
+        import pandas as pd # Import diferido: solo hace falta para Parquet
+        xyxy = self.column("xyxy")
+        class_ids = self.column("class_id")
+        categories = [self.names.get(i, str(i)) for i in range(int(class_ids.max()) + 1)] if self._length else []
+        names = pd.Categorical.from_codes(class_ids, categories=categories)
+        return pd.DataFrame({"frame": self.column("frame_idx"), "class_id": class_ids, "class_name": names,
+                             "conf": self.column("conf"), "x1": xyxy[:, 0], "y1": xyxy[:, 1],
+                             "x2": xyxy[:, 2], "y2": xyxy[:, 3], "track_id": self.column("track_id")})
+
+    def to_parquet(self, path):
+        self.to_dataframe().to_parquet(path, index=False)
@@ -0,0 +1,220 @@
+"""Núcleo de detección independiente de la GUI.
+
+Este módulo no importa tkinter ni PIL.ImageTk, de modo que puede usarse en servidores sin
+pantalla (ver cli.py). ultralytics/torch se importan solo al cargar el modelo.
+"""
+import os
+import time
+import cv2
+import numpy as np
+from pipeline import VideoPipeline, DEFAULT_BATCH_SIZE
+from frame_pool import DEFAULT_MEMORY_CEILING_MB
+from detection_cache import DetectionCache, boxes_array
+from annotator import Annotator
+from detection_store import DetectionStore
+from box_ops import scale_boxes, translate_boxes, clamp_roi
+from tracking import CellTracker, track_statistics
+from tiling import detect_tiled, read_overview, OVERVIEW_MAX_SIDE
+from inference_backends import load_backend, select_backend
+
+# --- Configuración del Modelo YOLO ---
+MODEL_NAME = 'modelo_celulas_entrenado_yolo_v8.pt' # Asegúrate que este archivo exista
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff')
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.mkv')
+
+WARMUP_SIZE = 640 # Lado de la imagen negra usada para calentar el modelo
+
+
+def load_model(model_path=MODEL_NAME, warmup=False, timings=None, backend="pytorch", imgsz=None, threads=None,
+               quantization=None, samples=None, calibration_data=None):
+    """Carga los pesos YOLO. Lanza FileNotFoundError si el archivo no existe.
+
+    Con warmup=True se hace una inferencia de prueba para que torch inicialice todo lo que
+    carga de forma perezosa. Si timings es un dict, se anotan en él los segundos de cada fase.
+    backend, imgsz, threads y quantization se describen en inference_backends; con "auto" se
+    usa el backend más rápido de los instalados que pase la comprobación de precisión sobre
+    samples (sin samples ni elección guardada, PyTorch; la cuantización solo si no es PyTorch).
+    calibration_data es el dataset YAML que necesita OpenVINO int8.
+    """
+    if not os.path.exists(model_path):
+        raise FileNotFoundError(f"El archivo del modelo '{model_path}' no se encuentra. Por favor, verifica la ruta.")
+    timings = timings if timings is not None else {}
+    start = time.perf_counter()
+    import ultralytics # Import diferido: ultralytics arrastra torch; se mide aparte de la carga de pesos
+    timings["import ultralytics/torch"] = time.perf_counter() - start
+
+    if backend == "auto":
+        start = time.perf_counter()
+        backend = select_backend(model_path, imgsz, threads, quantization, samples,
+                                 calibration_data=calibration_data)
+        timings["selección de backend"] = time.perf_counter() - start
+        if backend == "pytorch":
+            quantization = None
+
+    start = time.perf_counter()
+    model = load_backend(model_path, backend, imgsz, threads, quantization, calibration_data)
+    timings["carga de pesos"] = time.perf_counter() - start
+
+    if warmup:
+        start = time.perf_counter()
+        warmup_model(model)
+        timings["warmup"] = time.perf_counter() - start
+    return model
+
+
+def warmup_model(model, size=WARMUP_SIZE):
+    """Inferencia sobre una imagen negra para disparar la inicialización perezosa del modelo."""
+    dummy = np.zeros((size, size, 3), dtype=np.uint8)
+    model.predict(source=dummy, verbose=False)
+
+
+def is_image(path):
+    return os.path.splitext(path)[1].lower() in IMAGE_EXTENSIONS
+
+
+def is_video(path):
+    return os.path.splitext(path)[1].lower() in VIDEO_EXTENSIONS
+
+
+def class_counts(boxes, num_classes=0):
+    """Detecciones por clase de un array de cajas (N, 6), con np.bincount. Devuelve (max(num_classes, cls+1),)."""
+    return np.bincount(boxes[:, 5].astype(np.int64), minlength=num_classes)
+
+
+def counts_by_name(counts, names):
+    """{nombre: detecciones} de las clases con alguna detección en un vector de class_counts."""
+    return {names.get(int(i), str(int(i))): int(counts[i]) for i in np.flatnonzero(counts)}
+
+
+def class_names(result, names):
+    """Conjunto de nombres de clase presentes en un resultado de YOLO o en un array de cajas (N, 6)."""
+    boxes = result if isinstance(result, np.ndarray) else boxes_array(result)
+    return set(counts_by_name(class_counts(boxes), names))
+
+
+def store_dir_for(output_path):
+    """Directorio del almacén de detecciones que acompaña a un archivo de salida."""
+    return os.path.splitext(output_path)[0] + "_detecciones"
+
+
+def detect_image(model, image_path, cache=None, tiling=None, annotator=None, predict_args=None, roi=None):
+    """Ejecuta el modelo sobre una imagen. Devuelve (frame_anotado, cajas, desde_cache).
+
+    Con una DetectionCache, si la imagen ya se procesó con los mismos pesos solo se redibuja.
+    tiling es un dict con las opciones de tiling.detect_tiled (puede estar vacío) para imágenes
+    grandes; en ese caso el frame anotado es una vista general reducida. cajas (N, 6) está
+    siempre en coordenadas de la imagen original. Con un Annotator de estilo "none" no se
+    dibuja nada y frame_anotado es None.
+    predict_args son argumentos extra de model.predict (p. ej. imgsz). roi (dict con box y
+    crop_output, ver pipeline.VideoPipeline) limita la detección a una región; con crop_output
+    el frame anotado es solo esa región. Con tiling se ignoran ambos.
+    """
+    annotator = annotator or Annotator(model.names)
+    predict_args = dict(predict_args or {})
+    if tiling is not None:
+        predict_args, roi = {}, None
+    boxes = None
+    from_cache = False
+    image = None
+    roi_box = None
+    if roi is not None:
+        image = _read_image(image_path)
+        roi_box = clamp_roi(roi["box"], image.shape[1], image.shape[0])
+    if cache is not None:
+        params = dict(predict_args, tiling=tiling) if tiling is not None else dict(predict_args)
+        if roi_box is not None:
+            params["roi"] = list(roi_box)
+        key = cache.key_for(image_path, model, params or None)
+        cached = cache.get(key)
+        if cached:
+            boxes, from_cache = cached[0], True
+    overview = scale = None
+    if boxes is None:
+        if tiling is not None:
+            boxes, overview, scale = detect_tiled(model, image_path, **tiling)
+        elif roi_box is not None:
+            x1, y1, x2, y2 = roi_box
+            result = model.predict(source=image[y1:y2, x1:x2], verbose=False, **predict_args)[0]
+            boxes = translate_boxes(boxes_array(result), x1, y1)
+        else:
+            boxes = boxes_array(model.predict(source=image_path, verbose=False, **predict_args)[0])
+        if cache is not None:
+            cache.put(key, [boxes])
+    if not annotator.enabled:
+        return None, boxes, from_cache
+    if tiling is not None:
+        if overview is None:
+            overview, scale = read_overview(image_path, tiling.get("overview_max_side", OVERVIEW_MAX_SIDE))
+        return annotator.draw(overview, scale_boxes(boxes, scale)), boxes, from_cache
+    if image is None:
+        image = _read_image(image_path)
+    if roi is not None and roi.get("crop_output"):
+        x1, y1, x2, y2 = roi_box
+        return annotator.draw(image[y1:y2, x1:x2], translate_boxes(boxes, -x1, -y1)), boxes, from_cache
+    return annotator.draw(image, boxes), boxes, from_cache
+
+
+def _read_image(image_path):
+    image = cv2.imread(image_path)
+    if image is None:
+        raise IOError(f"No se pudo leer la imagen: {image_path}")
+    return image
+
+
+def process_image_file(model, image_path, output_path, cache=None, store_dir=None, tiling=None, annotator=None,
+                       predict_args=None, roi=None):
+    """Procesa una imagen y guarda la versión anotada. Devuelve el DetectionStore (cerrado) con sus detecciones.
+
+    Con tiling (ver detect_image) la imagen guardada es la vista general, pero el almacén
+    conserva las cajas a resolución completa. Con un Annotator de estilo "none" solo se guarda
+    el almacén. predict_args y roi se describen en detect_image.
+    """
+    annotated_frame, boxes, _ = detect_image(model, image_path, cache=cache, tiling=tiling, annotator=annotator,
+                                             predict_args=predict_args, roi=roi)
+    if annotated_frame is not None and not cv2.imwrite(output_path, annotated_frame):
+        raise IOError(f"No se pudo guardar la imagen procesada: {output_path}")
+    store = DetectionStore(store_dir or store_dir_for(output_path), names=model.names)
+    store.append(0, boxes)
+    store.close()
+    return store
+
+
+def process_video_file(model, video_path, output_path, batch_size=DEFAULT_BATCH_SIZE, on_frame=None, on_progress=None,
+                       cache=None, store_dir=None, frame_skip=None, skip_stats=None, track=False, track_stats=None,
+                       annotator=None, encoder_options=None, predict_args=None, roi=None, max_memory_mb=DEFAULT_MEMORY_CEILING_MB):
+    """Procesa un video con el pipeline por etapas. Devuelve el DetectionStore (cerrado) con todas las detecciones.
+
+    on_frame(frame_idx, annotated_frame, boxes) se llama opcionalmente por cada frame, en orden;
+    boxes es el array (N, 6) de detecciones del frame.
+    on_progress(frames_hechos, total_frames) permite informar el avance; si lanza una excepción
+    el procesamiento se detiene y la excepción se propaga.
+    frame_skip activa el salto de frames (ver frame_skip.py); si skip_stats es un dict, se
+    anotan en él la aceleración y la precisión de la interpolación.
+    Con track=True las células se siguen entre frames (columna track_id del store); si
+    track_stats es un dict, se rellena con tracking.track_statistics.
+    encoder_options configura la codificación de la salida (códec, calidad, escala...; ver encoder.py).
+    predict_args (p. ej. imgsz) y roi (región de interés) se pasan a VideoPipeline, igual que
+    max_memory_mb (techo de memoria de los buffers de frame).
+    """
+    def report(frame_idx, annotated_frame, boxes):
+        if on_frame:
+            on_frame(frame_idx, annotated_frame, boxes)
+        if on_progress:
+            on_progress(frame_idx + 1, pipeline.total_frames)
+
+    store = DetectionStore(store_dir or store_dir_for(output_path), names=model.names)
+    pipeline = VideoPipeline(model, video_path, output_path, batch_size=batch_size, on_frame=report,
+                             cache=cache, store=store, frame_skip=frame_skip,
+                             tracker=CellTracker() if track else None, annotator=annotator,
+                             encoder_options=encoder_options, predict_args=predict_args, roi=roi,
+                             max_memory_mb=max_memory_mb)
+    try:
+        pipeline.run()
+    finally:
+        store.close()
+    if skip_stats is not None and pipeline.skip_stats is not None and not pipeline.cache_hit:
+        skip_stats.update(pipeline.skip_stats.as_dict())
+    if track and track_stats is not None:
+        track_stats.update(track_statistics(store, pipeline.fps))
+    return store
@@ -0,0 +1,227 @@
+"""Codificación de video en su propio hilo.
+
+VideoEncoder recibe frames con write() en una cola acotada y los codifica en un hilo aparte,
+así que la escritura no frena la inferencia salvo cuando la cola se llena (backpressure).
+
+Backends:
+- "ffmpeg": un proceso ffmpeg al que se pasan los frames crudos por una tubería. Permite
+  H.264/H.265 por software con presets rápidos (ultrafast, veryfast...) y calidad CRF, con
+  archivos mucho más pequeños que mp4v.
+- "opencv": cv2.VideoWriter. Si el fourcc pedido no está disponible se usa mp4v.
+Con backend "auto" se usa ffmpeg si está instalado y, si no, OpenCV.
+
+Para vistas previas se puede codificar a menor resolución (scale) o escribir solo uno de cada
+frame_step frames (el video resultante tiene fps / frame_step).
+
+Con un frame_pool.FramePool, write() retiene el buffer del frame encolado y lo devuelve al pool
+en cuanto está codificado, así que quien escribe puede soltar su referencia al volver.
+"""
+import os
+import queue
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import cv2
+from instrumentation import NULL_INSTRUMENTATION
+
+# codec -> (codificador de ffmpeg, fourcc de OpenCV)
+CODECS = {
+    "h264": ("libx264", "avc1"),
+    "h265": ("libx265", "hvc1"),
+    "mpeg4": ("mpeg4", "mp4v"),
+    "mjpeg": ("mjpeg", "MJPG"),
+}
+PRESETS = ("ultrafast", "superfast", "veryfast", "faster", "fast", "medium")
+DEFAULT_CODEC = "h264"
+DEFAULT_PRESET = "veryfast"
+DEFAULT_QUALITY = 23 # CRF para h264/h265 (menor = mejor); en mpeg4/mjpeg se traduce a q:v
+DEFAULT_ENCODER_QUEUE = 16 # Frames pendientes de codificar antes de bloquear a quien escribe
+FALLBACK_FOURCC = "mp4v"
+
+_FIN = object()
+
+
+def ffmpeg_available():
+    return shutil.which("ffmpeg") is not None
+
+
+def unique_output_path(directory, stem, ext=".mp4"):
+    """Ruta nueva en directory del tipo <stem>_<fecha-hora>.mp4, sin pisar archivos de ejecuciones anteriores."""
+    os.makedirs(directory, exist_ok=True)
+    base = f"{stem}_{time.strftime('%Y%m%d-%H%M%S')}"
+    path = os.path.join(directory, base + ext)
+    n = 1
+    while os.path.exists(path):
+        n += 1
+        path = os.path.join(directory, f"{base}_{n}{ext}")
+    return path
+
+
+class _FFmpegBackend:
+    name = "ffmpeg"
+
+    def __init__(self, path, fps, size, codec, quality, preset):
+        ffmpeg_codec = CODECS[codec][0]
+        width, height = size
+        command = [shutil.which("ffmpeg"), "-y", "-loglevel", "error",
+                   "-f", "rawvideo", "-pix_fmt", "bgr24", "-s", f"{width}x{height}", "-r", f"{fps:.6g}", "-i", "-",
+                   "-c:v", ffmpeg_codec]
+        if ffmpeg_codec in ("libx264", "libx265"):
+            command += ["-preset", preset, "-crf", str(quality), "-pix_fmt", "yuv420p",
+                        "-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2"] # yuv420p necesita lados pares
+            if ffmpeg_codec == "libx265":
+                command += ["-tag:v", "hvc1", "-x265-params", "log-level=error"]
+        else:
+            command += ["-q:v", str(max(1, min(31, round(quality / 51 * 31))))]
+        command.append(path)
+        self._stderr = tempfile.TemporaryFile() # Archivo y no PIPE: una tubería llena bloquearía a ffmpeg
+        self._process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=self._stderr)
+
+    def write(self, frame):
+        try:
+            self._process.stdin.write(frame.tobytes())
+        except BrokenPipeError:
+            self._process.wait()
+            raise IOError(f"ffmpeg terminó con error: {self._error_text()}")
+
+    def close(self):
+        try:
+            self._process.stdin.close()
+        except BrokenPipeError:
+            pass
+        code = self._process.wait()
+        error = self._error_text()
+        self._stderr.close()
+        if code != 0:
+            raise IOError(f"ffmpeg terminó con código {code}: {error}")
+
+    def _error_text(self):
+        self._stderr.seek(0)
+        return self._stderr.read().decode(errors="replace").strip()
+
+
+class _OpenCVBackend:
+    name = "opencv"
+
+    def __init__(self, path, fps, size, codec, quality, preset):
+        fourcc = CODECS[codec][1]
+        self._writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*fourcc), fps, size)
+        if not self._writer.isOpened() and fourcc != FALLBACK_FOURCC:
+            print(f"OpenCV no puede codificar '{codec}' ({fourcc}); se usa {FALLBACK_FOURCC}.")
+            self._writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*FALLBACK_FOURCC), fps, size)
+        if not self._writer.isOpened():
+            raise IOError(f"No se pudo crear el archivo de video de salida: {path}")
+
+    def write(self, frame):
+        self._writer.write(frame)
+
+    def close(self):
+        self._writer.release()
+
+
+def open_writer(path, fps, frame_size, codec=DEFAULT_CODEC, quality=DEFAULT_QUALITY, preset=DEFAULT_PRESET, backend="auto"):
+    """Escritor síncrono (write/close) del backend elegido; VideoEncoder lo usa desde su hilo."""
+    if codec not in CODECS:
+        raise ValueError(f"Códec no soportado: '{codec}' (usa {', '.join(CODECS)}).")
+    if backend == "auto":
+        backend = "ffmpeg" if ffmpeg_available() else "opencv"
+    if backend == "ffmpeg":
+        return _FFmpegBackend(path, fps, frame_size, codec, quality, preset)
+    if backend == "opencv":
+        return _OpenCVBackend(path, fps, frame_size, codec, quality, preset)
+    raise ValueError(f"Backend de codificación no soportado: '{backend}' (usa auto, ffmpeg u opencv).")
+
+
+class VideoEncoder:
+    """Escritor de video asíncrono. write() encola; close() espera a que se escriba todo."""
+
+    def __init__(self, path, fps, frame_size, codec=DEFAULT_CODEC, quality=DEFAULT_QUALITY, preset=DEFAULT_PRESET,
+                 backend="auto", scale=1.0, frame_step=1, queue_size=DEFAULT_ENCODER_QUEUE, instrumentation=None,
+                 frame_pool=None):
+        self.path = path
+        self.frame_step = max(1, int(frame_step))
+        self.fps = (fps if fps > 0 else 30) / self.frame_step
+        self.scale = scale if 0 < scale < 1 else 1.0
+        width, height = frame_size
+        self.output_size = (max(2, round(width * self.scale)), max(2, round(height * self.scale)))
+        self._backend = open_writer(path, self.fps, self.output_size, codec, quality, preset, backend)
+        self.backend = self._backend.name
+        self.instrumentation = instrumentation or NULL_INSTRUMENTATION
+        self.frame_pool = frame_pool
+        self.frames_in = 0
+        self.frames_written = 0
+        self.error = None
+        self._queue = queue.Queue(maxsize=max(1, int(queue_size)))
+        self._thread = threading.Thread(target=self._run, name="video-encoder", daemon=True)
+        self._thread.start()
+
+    def write(self, frame):
+        """Encola un frame (bloquea si la cola está llena). El frame no debe modificarse después."""
+        if self.error is not None:
+            raise self.error
+        index = self.frames_in
+        self.frames_in += 1
+        if index % self.frame_step == 0:
+            if self.frame_pool is not None:
+                self.frame_pool.retain(frame) # Se devuelve al pool tras codificarlo
+            self._queue.put(frame)
+
+    @property
+    def pending(self):
+        """Frames encolados que aún no se han codificado."""
+        return self._queue.qsize()
+
+    def close(self):
+        """Escribe lo pendiente y cierra el archivo. Relanza el primer error de codificación."""
+        if self._thread.is_alive():
+            self._queue.put(_FIN)
+            self._thread.join()
+        if self.error is not None:
+            raise self.error
+
+    def _run(self):
+        try:
+            with self.instrumentation.profile(self._thread.name):
+                self._encode_loop()
+        except Exception as e:
+            self.error = e
+            self._drain() # Que write() no quede bloqueado con la cola llena
+        finally:
+            try:
+                self._backend.close()
+            except Exception as e:
+                if self.error is None:
+                    self.error = e
+
+    def _encode_loop(self):
+        while True:
+            frame = self._queue.get()
+            if frame is _FIN:
+                return
+            try:
+                with self.instrumentation.stage("encode", self.frame_step):
+                    if (frame.shape[1], frame.shape[0]) != self.output_size:
+                        self._backend.write(cv2.resize(frame, self.output_size, interpolation=cv2.INTER_AREA))
+                    else:
+                        self._backend.write(frame)
+            finally:
+                self._release(frame)
+            self.frames_written += 1
+
+    def _drain(self):
+        while True:
+            try:
+                frame = self._queue.get(timeout=0.1)
+            except queue.Empty:
+                if self.error is None:
+                    return
+                continue
+            if frame is _FIN:
+                return
+            self._release(frame)
+
+    def _release(self, frame):
+        if self.frame_pool is not None:
+            self.frame_pool.release(frame)
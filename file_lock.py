@@ -0,0 +1,39 @@
+"""Cerrojo exclusivo entre procesos sobre un archivo (flock en POSIX, msvcrt en Windows).
+
+Lo usan la caché de detecciones (memo de hashes) y la exportación de modelos, que pueden
+ejecutar a la vez varios procesos del pool sobre los mismos archivos.
+"""
+import contextlib
+import time
+
+try:
+    import fcntl
+except ImportError: # Windows
+    fcntl = None
+    import msvcrt
+
+_RETRY_S = 0.05
+
+
+@contextlib.contextmanager
+def file_lock(path):
+    """Bloquea hasta tener el cerrojo de path (se crea si no existe) y lo suelta al salir."""
+    with open(path, "a+b") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        else:
+            while True:
+                try:
+                    f.seek(0)
+                    msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+                    break
+                except OSError:
+                    time.sleep(_RETRY_S)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
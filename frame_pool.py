@@ -0,0 +1,118 @@
+"""Buffers de frame preasignados y reutilizados, con un techo de memoria.
+
+Sin pool, cada cap.read() crea un array nuevo y la memoria en uso depende de cuántos frames
+retengan a la vez las colas, el codificador y la GUI. FramePool reserva `count` buffers del
+tamaño del frame y los presta: la decodificación escribe en ellos (cap.read(image=buf)), las
+etapas se los pasan y, cuando el último consumidor los suelta, vuelven a la lista libre.
+
+Cada buffer lleva un contador de referencias: acquire() lo entrega con 1, retain() suma un
+consumidor (p. ej. la cola del codificador) y release() lo resta. Las vistas de un buffer (el
+recorte de un ROI) cuentan como el buffer. release() de un array que no es del pool no hace
+nada, así que los frames que no caben en el pool (otro tamaño) siguen funcionando.
+
+Como el número de buffers es fijo, acquire() bloquea cuando todos están prestados: así el
+pipeline nunca retiene más de count frames, sea cual sea la duración del video.
+"""
+import threading
+import numpy as np
+
+DEFAULT_MEMORY_CEILING_MB = 1024 # Memoria máxima para frames en vuelo de un pipeline
+
+
+def frames_for_budget(frame_shape, memory_mb, minimum, maximum):
+    """Cuántos frames de frame_shape caben en memory_mb, entre minimum y maximum.
+
+    Lanza ValueError si ni siquiera caben minimum (el pipeline no podría avanzar).
+    """
+    frame_bytes = int(np.prod(frame_shape))
+    count = int(memory_mb * 2 ** 20 // max(frame_bytes, 1))
+    if count < minimum:
+        raise ValueError(f"El techo de memoria de {memory_mb:g} MB no alcanza para los {minimum} frames de "
+                         f"{frame_bytes / 2 ** 20:.1f} MB que necesita el pipeline "
+                         f"(mínimo {minimum * frame_bytes / 2 ** 20:.0f} MB).")
+    return min(count, maximum)
+
+
+def plan_frame_pool(frame_shape, memory_mb, batch_size, stride=1, queued=0):
+    """(buffers del pool, lote de inferencia) para un pipeline que no pase de memory_mb.
+
+    Con salto de frames la inferencia retiene hasta batch frames clave y los stride - 1 que
+    preceden a cada uno (con stride 1, solo el lote); hacen falta 2 más para decodificar y
+    anotar. Si el lote completo no cabe se reduce, como mucho hasta 1 frame clave: el techo
+    limita el rendimiento, no los ajustes. Solo lanza ValueError (frames_for_budget) si no
+    caben ni los frames entre dos detecciones. queued son los frames extra que llenarían las
+    colas entre etapas.
+    """
+    count = frames_for_budget(frame_shape, memory_mb, minimum=stride + 2, maximum=batch_size * stride + 2 + queued)
+    return count, max(1, min(batch_size, (count - 2) // stride))
+
+
+class FramePool:
+    """Pool de count buffers (shape, dtype) con contador de referencias. Seguro entre hilos."""
+
+    def __init__(self, shape, count, dtype=np.uint8):
+        self.shape = tuple(shape)
+        self.count = max(1, int(count))
+        self._buffers = [np.empty(self.shape, dtype=dtype) for _ in range(self.count)]
+        self._index = {id(buffer): buffer for buffer in self._buffers}
+        self._refs = {} # id(buffer) -> referencias de los buffers prestados
+        self._free = list(self._buffers)
+        self._available = threading.Condition()
+        self._closed = False
+
+    @property
+    def nbytes(self):
+        return sum(buffer.nbytes for buffer in self._buffers)
+
+    @property
+    def in_use(self):
+        with self._available:
+            return len(self._refs)
+
+    def acquire(self, timeout=None):
+        """Presta un buffer libre, esperando si no hay. Devuelve None si vence timeout o se cierra el pool."""
+        with self._available:
+            if not self._available.wait_for(lambda: self._free or self._closed, timeout):
+                return None
+            if self._closed:
+                return None
+            buffer = self._free.pop()
+            self._refs[id(buffer)] = 1
+            return buffer
+
+    def retain(self, frame):
+        """Suma un consumidor al buffer de frame (o a aquel del que frame es una vista)."""
+        key = self._key(frame)
+        if key is not None:
+            with self._available:
+                self._refs[key] += 1
+
+    def release(self, frame):
+        """Resta un consumidor; con 0 el buffer vuelve a estar libre. Ignora arrays ajenos al pool."""
+        key = self._key(frame)
+        if key is None:
+            return
+        with self._available:
+            refs = self._refs[key] - 1
+            if refs:
+                self._refs[key] = refs
+                return
+            del self._refs[key]
+            self._free.append(self._index[key])
+            self._available.notify()
+
+    def owns(self, frame):
+        return self._key(frame) is not None
+
+    def close(self):
+        """Despierta a quien espere en acquire(); los buffers se liberan con el pool."""
+        with self._available:
+            self._closed = True
+            self._available.notify_all()
+
+    def _key(self, frame):
+        if frame is None:
+            return None
+        base = frame if frame.base is None else frame.base # Vistas (ROI) -> buffer del pool
+        key = id(base)
+        return key if key in self._index and self._index[key] is base else None
@@ -0,0 +1,115 @@
+"""Análisis de video con salto de frames.
+
+A 30 fps las células apenas se mueven entre frames consecutivos, así que no hace falta pasar
+todos por el modelo. KeyframeSelector elige qué frames se detectan: uno de cada `stride` o,
+en modo adaptativo, también cuando una diferencia barata entre miniaturas en gris supera un
+umbral. Las cajas de los frames intermedios se interpolan entre las dos detecciones vecinas,
+de modo que la salida sigue cubriendo todos los frames.
+
+Para medir lo que se pierde, opcionalmente se detecta también uno de cada `audit_interval`
+frames interpolados y se compara con la interpolación (F1 con IoU >= 0.5). SkipStats resume
+la aceleración de la inferencia y esa precisión.
+"""
+import cv2
+import numpy as np
+from box_ops import class_aware_iou, greedy_match
+
+DEFAULT_STRIDE = 1 # 1 = detectar todos los frames (sin salto)
+DEFAULT_MOTION_THRESHOLD = 4.0 # Diferencia media de gris (0-255) que fuerza una detección en modo adaptativo
+THUMB_SIZE = (64, 36) # Miniatura sobre la que se mide el cambio entre frames
+MATCH_IOU = 0.3 # IoU mínima para considerar la misma célula en dos detecciones vecinas
+AUDIT_IOU = 0.5 # IoU mínima para contar una caja interpolada como acierto en la auditoría
+
+
+def frame_skip_enabled(options):
+    """True si las opciones de salto de frames (dict o None) implican no detectar todos los frames."""
+    return bool(options) and (options.get("stride", DEFAULT_STRIDE) > 1 or options.get("motion_threshold") is not None)
+
+
+class KeyframeSelector:
+    """Decide qué frames pasan por el modelo.
+
+    Un frame es de detección si han pasado `stride` frames desde la última, o (con
+    motion_threshold) si la diferencia media absoluta en gris, de 0 a 255, entre su miniatura
+    y la de la última detección supera el umbral. En modo adaptativo stride actúa como máximo.
+    """
+
+    def __init__(self, stride=DEFAULT_STRIDE, motion_threshold=None, thumb_size=THUMB_SIZE):
+        self.stride = max(1, int(stride))
+        self.motion_threshold = motion_threshold
+        self.thumb_size = thumb_size
+        self._last_thumb = None
+        self._since_key = None # Frames desde la última detección (None antes del primer frame)
+
+    def is_key(self, frame):
+        thumb = None
+        if self.motion_threshold is not None:
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+            thumb = cv2.resize(gray, self.thumb_size, interpolation=cv2.INTER_AREA)
+        key = self._since_key is None or self._since_key + 1 >= self.stride
+        if not key and thumb is not None:
+            key = float(cv2.absdiff(thumb, self._last_thumb).mean()) > self.motion_threshold
+        if key:
+            self._last_thumb = thumb
+            self._since_key = 0
+        else:
+            self._since_key += 1
+        return key
+
+
+def interpolate_boxes(start, end, t, min_iou=MATCH_IOU):
+    """Cajas (N, 6) en la posición t (0-1) entre dos detecciones.
+
+    Las cajas emparejadas por IoU (misma clase) se interpolan linealmente en coordenadas y
+    confianza. Las que solo están en una de las dos detecciones se muestran en la mitad del
+    intervalo más cercana a ella.
+    """
+    rows, cols = greedy_match(class_aware_iou(start, end), min_iou)
+    moved = start[rows].copy()
+    moved[:, :5] = (1 - t) * start[rows, :5] + t * end[cols, :5]
+    if t < 0.5:
+        unmatched = np.delete(start, rows, axis=0)
+    else:
+        unmatched = np.delete(end, cols, axis=0)
+    return np.concatenate([moved, unmatched]).astype(np.float32)
+
+
+def match_f1(predicted, truth, min_iou=AUDIT_IOU):
+    """F1 de unas cajas frente a las de referencia (1.0 si ambas están vacías)."""
+    if len(predicted) == 0 and len(truth) == 0:
+        return 1.0
+    matched = len(greedy_match(class_aware_iou(predicted, truth), min_iou)[0])
+    return 2 * matched / (len(predicted) + len(truth))
+
+
+class SkipStats:
+    """Frames procesados, frames que pasaron por el modelo y precisión de la interpolación."""
+
+    def __init__(self):
+        self.frames = 0
+        self.inferred = 0 # Frames de detección (sin contar los de auditoría)
+        self.audited = 0
+        self.f1_total = 0.0
+
+    @property
+    def speedup(self):
+        """Reducción de inferencias respecto a detectar todos los frames (las auditorías también cuentan)."""
+        calls = self.inferred + self.audited
+        return self.frames / calls if calls else 1.0
+
+    @property
+    def mean_f1(self):
+        return self.f1_total / self.audited if self.audited else None
+
+    def summary(self):
+        text = f"{self.frames} frames, {self.inferred} detectados"
+        if self.audited:
+            text += f" y {self.audited} auditados"
+        text += f" (inferencia {self.speedup:.1f}x menor)"
+        if self.audited:
+            text += f", F1 de la interpolación {self.mean_f1:.3f}"
+        return text
+
+    def as_dict(self):
+        return {"frames": self.frames, "inferred": self.inferred, "speedup": round(self.speedup, 2),
+                "audited": self.audited, "interpolation_f1": None if self.mean_f1 is None else round(self.mean_f1, 4)}
@@ -0,0 +1,433 @@
+"""Backends de inferencia para CPU: PyTorch, ONNX Runtime y OpenVINO.
+
+Los pesos .pt se exportan una sola vez con ultralytics y el resultado se guarda junto a ellos
+(p. ej. modelo_640.onnx o modelo_640_int8_openvino_model/); solo se vuelve a exportar si los
+pesos son más recientes. ultralytics carga el archivo exportado con YOLO(...) y lo ejecuta con
+ONNX Runtime u OpenVINO, así que el resto del código sigue usando model.predict y model.names.
+
+- quantization: "int8" (ONNX: cuantización dinámica de ONNX Runtime; OpenVINO: NNCF, que
+  necesita un dataset YAML de calibración, calibration_data / --calibration-data; sin él se
+  rechaza en lugar de calibrar con datos que no son células) o "fp16" (solo OpenVINO: en CPU ultralytics no
+  exporta ONNX en FP16).
+- threads: hilos intra-op (torch.set_num_threads, intra_op_num_threads de ONNX Runtime o
+  INFERENCE_NUM_THREADS de OpenVINO). None = lo que decida cada runtime.
+- imgsz: tamaño de entrada; queda como valor por defecto de model.predict.
+
+Con backend "auto" se mide cada backend instalado sobre frames reales (samples: carpeta de
+imágenes, imagen o video), se descartan los que no pasan la comprobación de precisión frente a
+PyTorch (F1 de las cajas) y se elige el más rápido. La comprobación falla cerrada: sin muestras,
+o si PyTorch no detecta nada en ellas, no hay con qué comparar y se queda PyTorch. La elección
+se guarda en <pesos>_backends.json para no repetir la medición en cada arranque.
+
+Como script:
+    python inference_backends.py --compare --samples muestras/
+    python inference_backends.py --export openvino --quantization int8 --calibration-data celulas.yaml
+"""
+import argparse
+import glob
+import importlib.util
+import json
+import os
+import shutil
+import sys
+import time
+import cv2
+import numpy as np
+from box_ops import class_aware_iou, greedy_match
+from detection_cache import boxes_array
+from file_lock import file_lock
+
+BACKENDS = ("pytorch", "onnx", "openvino")
+QUANTIZATIONS = ("fp16", "int8")
+DEFAULT_IMGSZ = 640 # Tamaño de exportación cuando no se indica imgsz
+ACCURACY_IOU = 0.5 # IoU mínima para que una caja coincida con la de PyTorch
+ACCURACY_MIN_F1 = 0.95 # F1 mínimo frente a PyTorch para que "auto" acepte un backend
+SAMPLE_FRAMES = 8 # Frames de muestra por medición (un lote)
+SELECTION_RUNS = 5 # Lotes cronometrados por backend al elegir el más rápido
+SELECTION_VERSION = 2 # Cambiarlo invalida las elecciones guardadas en <pesos>_backends.json
+
+EXPORT_LOCK_SUFFIX = ".export.lock" # Cerrojo junto a los pesos mientras se exporta
+
+_RUNTIME_MODULES = {"onnx": "onnxruntime", "openvino": "openvino"}
+
+
+def available_backends():
+    """Backends cuyo runtime está instalado. PyTorch siempre (lo necesita ultralytics)."""
+    return ["pytorch"] + [backend for backend, module in _RUNTIME_MODULES.items() if importlib.util.find_spec(module)]
+
+
+def export_path(weights, backend, imgsz=DEFAULT_IMGSZ, quantization=None):
+    """Ruta del modelo exportado que acompaña a los pesos."""
+    stem = f"{os.path.splitext(weights)[0]}_{imgsz}" + (f"_{quantization}" if quantization else "")
+    if backend == "onnx":
+        return stem + ".onnx"
+    if backend == "openvino":
+        return stem + "_openvino_model"
+    raise ValueError(f"El backend '{backend}' no se exporta (usa onnx u openvino).")
+
+
+def _check_options(backend, quantization):
+    if backend not in BACKENDS:
+        raise ValueError(f"Backend de inferencia no soportado: '{backend}' (usa auto, {', '.join(BACKENDS)}).")
+    if quantization is None:
+        return
+    if quantization not in QUANTIZATIONS:
+        raise ValueError(f"Cuantización no soportada: '{quantization}' (usa {', '.join(QUANTIZATIONS)}).")
+    if backend == "pytorch":
+        raise ValueError("La cuantización solo se aplica a los backends onnx y openvino.")
+    if backend == "onnx" and quantization == "fp16":
+        raise ValueError("ultralytics solo exporta ONNX en FP16 con GPU; en CPU usa int8 u openvino con fp16.")
+
+
+def _export_is_current(path, weights):
+    return os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(weights)
+
+
+def export_model(weights, backend, imgsz=DEFAULT_IMGSZ, quantization=None, calibration_data=None):
+    """Exporta los pesos si no hay una exportación al día y devuelve su ruta.
+
+    ultralytics escribe siempre en la misma ruta intermedia (<pesos>.onnx, <pesos>_openvino_model),
+    así que la exportación se hace bajo un cerrojo de archivo: si varios procesos del pool la
+    piden a la vez, exporta el primero y los demás reutilizan su resultado.
+    """
+    _check_options(backend, quantization)
+    path = export_path(weights, backend, imgsz, quantization)
+    if _export_is_current(path, weights):
+        return path
+    with file_lock(os.path.splitext(weights)[0] + EXPORT_LOCK_SUFFIX):
+        if _export_is_current(path, weights): # Lo exportó otro proceso mientras se esperaba el cerrojo
+            return path
+        return _export(weights, backend, path, imgsz, quantization, calibration_data)
+
+
+def _export(weights, backend, path, imgsz, quantization, calibration_data):
+    if backend == "openvino" and quantization == "int8" and not calibration_data:
+        raise ValueError("OpenVINO int8 necesita un dataset YAML de calibración con imágenes de células "
+                         "(--calibration-data celulas.yaml).")
+    from ultralytics import YOLO # Import diferido: ultralytics arrastra torch
+    label = backend + (f" {quantization}" if quantization else "")
+    print(f"Exportando {weights} a {label} ({imgsz}px). Solo se hace una vez...")
+    start = time.perf_counter()
+    options = {"imgsz": imgsz, "dynamic": True} # Lote variable: el pipeline pasa lotes de distinto tamaño
+    if backend == "openvino":
+        options["half"] = quantization == "fp16"
+        options["int8"] = quantization == "int8"
+        if calibration_data:
+            options["data"] = calibration_data
+    exported = YOLO(weights).export(format=backend, **options)
+    if backend == "onnx" and quantization == "int8":
+        try:
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+            quantize_dynamic(exported, path, weight_type=QuantType.QUInt8)
+        finally:
+            os.remove(exported)
+    else:
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        os.replace(exported, path)
+    print(f"Modelo exportado en {time.perf_counter() - start:.1f} s: {path}")
+    return path
+
+
+def load_backend(weights, backend="pytorch", imgsz=None, threads=None, quantization=None, calibration_data=None):
+    """YOLO listo para predict con un backend concreto (no "auto"), exportando si hace falta.
+
+    model.backend_options guarda las opciones con las que se cargó, para que otros procesos
+    (WorkerPool) carguen lo mismo sin repetir la selección.
+    """
+    _check_options(backend, quantization)
+    from ultralytics import YOLO
+    if backend == "pytorch":
+        model = YOLO(weights)
+        path = weights
+    else:
+        path = export_model(weights, backend, imgsz or DEFAULT_IMGSZ, quantization, calibration_data)
+        model = YOLO(path, task="detect")
+    if imgsz:
+        model.overrides["imgsz"] = imgsz
+    if threads:
+        set_threads(model, backend, threads, path)
+    model.backend_options = {"backend": backend, "imgsz": imgsz, "threads": threads, "quantization": quantization,
+                             "calibration_data": calibration_data}
+    return model
+
+
+def set_threads(model, backend, threads, path):
+    """Fija los hilos intra-op del runtime.
+
+    ONNX Runtime y OpenVINO crean su sesión en el primer predict (AutoBackend de ultralytics),
+    así que se hace uno con una imagen negra y se recrea la sesión con esos hilos.
+    """
+    if backend == "pytorch":
+        import torch
+        torch.set_num_threads(threads)
+        return
+    if model.predictor is None:
+        size = model.overrides.get("imgsz") or DEFAULT_IMGSZ
+        model.predict(source=np.zeros((size, size, 3), dtype=np.uint8), verbose=False)
+    runtime = model.predictor.model # AutoBackend de ultralytics
+    if backend == "onnx":
+        import onnxruntime
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+        runtime.session = onnxruntime.InferenceSession(path, options, providers=runtime.session.get_providers())
+    else:
+        import openvino
+        core = openvino.Core()
+        xml_path = glob.glob(os.path.join(path, "*.xml"))[0]
+        config = {"PERFORMANCE_HINT": getattr(runtime, "inference_mode", "LATENCY"), "INFERENCE_NUM_THREADS": threads}
+        runtime.ov_compiled_model = core.compile_model(core.read_model(xml_path), "CPU", config)
+
+
+def sample_frames(samples=None, count=SAMPLE_FRAMES, size=(DEFAULT_IMGSZ, DEFAULT_IMGSZ)):
+    """Frames BGR para medir y comparar backends.
+
+    samples puede ser una carpeta de imágenes, una imagen o un video (se toman frames
+    repartidos); sin samples se usan frames sintéticos (streaming.SyntheticSource), que sirven
+    para medir velocidades pero no para validar la precisión.
+    """
+    from detector import IMAGE_EXTENSIONS
+    if samples is None:
+        from streaming import SyntheticSource
+        source = SyntheticSource(size, frames=count, realtime=False)
+        return [source.read() for _ in range(count)]
+    if os.path.isdir(samples):
+        paths = sorted(p for p in glob.glob(os.path.join(samples, "*")) if p.lower().endswith(IMAGE_EXTENSIONS))
+        frames = [cv2.imread(p) for p in paths[:count]]
+    elif samples.lower().endswith(IMAGE_EXTENSIONS):
+        frames = [cv2.imread(samples)]
+    else:
+        cap = cv2.VideoCapture(samples)
+        total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        frames = []
+        for index in np.linspace(0, max(total - 1, 0), count).astype(int):
+            cap.set(cv2.CAP_PROP_POS_FRAMES, int(index))
+            ok, frame = cap.read()
+            if ok:
+                frames.append(frame)
+        cap.release()
+    frames = [f for f in frames if f is not None]
+    if not frames:
+        raise IOError(f"No se pudieron leer frames de muestra de: {samples}")
+    return frames
+
+
+def detection_agreement(reference, candidate, min_iou=ACCURACY_IOU):
+    """Concordancia de las cajas (N, 6) de un backend con las de referencia, frame a frame.
+
+    Devuelve precisión, recall y F1 sobre todas las cajas (misma clase e IoU >= min_iou) y la
+    diferencia media de confianza de las cajas emparejadas.
+    """
+    matched = reference_total = candidate_total = 0
+    conf_deltas = []
+    for truth, predicted in zip(reference, candidate):
+        rows, cols = greedy_match(class_aware_iou(truth, predicted), min_iou)
+        matched += len(rows)
+        reference_total += len(truth)
+        candidate_total += len(predicted)
+        conf_deltas.extend(np.abs(truth[rows, 4] - predicted[cols, 4]).tolist())
+    precision = matched / candidate_total if candidate_total else 1.0
+    recall = matched / reference_total if reference_total else 1.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    return {"precision": round(precision, 4), "recall": round(recall, 4), "f1": round(f1, 4),
+            "conf_delta": round(float(np.mean(conf_deltas)), 4) if conf_deltas else 0.0,
+            "reference_boxes": reference_total}
+
+
+def _ms_per_frame(model, frames, runs=SELECTION_RUNS):
+    """Mediana de ms por frame de model.predict sobre el lote de frames, tras un lote de calentamiento."""
+    model.predict(source=frames, verbose=False)
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        model.predict(source=frames, verbose=False)
+        times.append(time.perf_counter() - start)
+    return float(np.median(times)) / len(frames) * 1000
+
+
+def compare_backends(weights, backends=None, imgsz=None, threads=None, quantization=None, samples=None,
+                     calibration_data=None, min_f1=ACCURACY_MIN_F1):
+    """Mide ms por frame de cada backend y compara sus detecciones con las de PyTorch.
+
+    La cuantización se aplica a onnx/openvino; un backend que no se puede cargar o exportar
+    aparece con "error". Devuelve una lista de dicts (PyTorch primero). Si PyTorch no detecta
+    nada en las muestras, ningún otro backend pasa la comprobación (no hay con qué comparar).
+    """
+    size = imgsz or DEFAULT_IMGSZ
+    frames = sample_frames(samples, size=(size, size))
+    backends = [b for b in (backends or available_backends()) if b != "pytorch"]
+    rows = []
+    reference = None
+    informative = False # Hay cajas de referencia con las que comparar
+    for backend in ["pytorch"] + backends:
+        row = {"backend": backend, "quantization": None if backend == "pytorch" else quantization}
+        try:
+            model = load_backend(weights, backend, imgsz, threads, row["quantization"], calibration_data)
+            row["ms_per_frame"] = round(_ms_per_frame(model, frames), 3)
+            boxes = [boxes_array(result) for result in model.predict(source=frames, verbose=False)]
+        except Exception as e:
+            print(f"Backend {backend} descartado: {e}")
+            row["error"] = str(e)
+            rows.append(row)
+            continue
+        if reference is None:
+            reference = boxes
+            informative = any(len(b) for b in reference)
+            if not informative:
+                print("Aviso: PyTorch no detecta nada en las muestras; sin referencia ningún otro backend pasa la "
+                      "comprobación de precisión (usa muestras reales con células).")
+        row["accuracy"] = detection_agreement(reference, boxes)
+        row["passed"] = backend == "pytorch" or (informative and row["accuracy"]["f1"] >= min_f1)
+        rows.append(row)
+    return rows
+
+
+def print_backend_comparison(rows):
+    print(f"{'backend':<10}{'cuant.':<8}{'ms/frame':>10}{'F1':>8}{'recall':>8}{'Δconf':>8}")
+    for row in rows:
+        label = f"{row['backend']:<10}{row['quantization'] or '-':<8}"
+        if "error" in row:
+            print(f"{label}error: {row['error']}")
+            continue
+        accuracy = row["accuracy"]
+        print(f"{label}{row['ms_per_frame']:>10.2f}{accuracy['f1']:>8.3f}{accuracy['recall']:>8.3f}"
+              f"{accuracy['conf_delta']:>8.3f}  {'ok' if row['passed'] else 'PRECISIÓN INSUFICIENTE'}")
+
+
+def _selection_file(weights):
+    return os.path.splitext(weights)[0] + "_backends.json"
+
+
+def _selection_key(weights, imgsz, threads, quantization, available):
+    return json.dumps({"version": SELECTION_VERSION, "imgsz": imgsz, "threads": threads, "quantization": quantization,
+                       "backends": available, "weights_mtime": os.path.getmtime(weights), "cpus": os.cpu_count()},
+                      sort_keys=True)
+
+
+def _load_selections(weights):
+    try:
+        with open(_selection_file(weights), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_selection(weights, key, entry):
+    """Añade una elección a <pesos>_backends.json sin pisar las que guarde a la vez otro proceso."""
+    selection_file = _selection_file(weights)
+    try:
+        with file_lock(selection_file + ".lock"):
+            selections = _load_selections(weights) # Releer: la medición puede haber durado minutos
+            selections[key] = entry
+            tmp_path = f"{selection_file}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(selections, f, indent=2, ensure_ascii=False)
+            os.replace(tmp_path, selection_file) # Escritura atómica: nunca se lee un JSON a medias
+    except OSError as e:
+        print(f"No se pudo guardar la elección de backend en {selection_file}: {e}")
+
+
+def cached_backend(weights, imgsz=None, threads=None, quantization=None):
+    """La elección guardada de select_backend para estas opciones, o None si no se ha medido todavía."""
+    available = available_backends()
+    if available == ["pytorch"]:
+        return "pytorch"
+    try:
+        key = _selection_key(weights, imgsz, threads, quantization, available)
+    except OSError:
+        return None
+    entry = _load_selections(weights).get(key)
+    return entry["backend"] if entry else None
+
+
+def select_backend(weights, imgsz=None, threads=None, quantization=None, samples=None, refresh=False,
+                   calibration_data=None):
+    """El backend más rápido de los instalados que pasa la comprobación de precisión.
+
+    samples son los frames reales con los que se valida la precisión (ver sample_frames); sin
+    ellos no se mide nada y se usa PyTorch. La elección se guarda por combinación de opciones,
+    pesos y runtimes instalados; refresh=True la repite.
+    """
+    available = available_backends()
+    if available == ["pytorch"]:
+        return "pytorch"
+    key = _selection_key(weights, imgsz, threads, quantization, available)
+    saved = _load_selections(weights).get(key)
+    if saved and not refresh:
+        return saved["backend"]
+    if samples is None:
+        print("Backend auto sin muestras reales (--samples): se usa pytorch. La precisión de los demás "
+              "backends no se puede comprobar con frames sintéticos.")
+        return "pytorch"
+
+    print(f"Eligiendo backend de inferencia entre: {', '.join(available)}...")
+    rows = compare_backends(weights, available, imgsz, threads, quantization, samples, calibration_data)
+    print_backend_comparison(rows)
+    candidates = [row for row in rows if row.get("passed")]
+    best = min(candidates, key=lambda row: row["ms_per_frame"])["backend"] if candidates else "pytorch"
+    print(f"Backend elegido: {best}")
+    _save_selection(weights, key, {"backend": best, "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                                   "samples": os.path.abspath(samples), "results": rows})
+    return best
+
+
+def add_backend_arguments(parser):
+    """Opciones de backend comunes a cli.py, streaming.py y benchmark.py."""
+    parser.add_argument("--backend", choices=("auto",) + BACKENDS, default="auto",
+                        help="Backend de inferencia; auto mide los instalados sobre --samples y usa el más rápido "
+                             "que pase la comprobación de precisión (por defecto: auto)")
+    parser.add_argument("--samples", default=None,
+                        help="Carpeta de imágenes, imagen o video reales para la selección auto; sin ellas auto usa "
+                             "pytorch salvo que ya haya una elección guardada")
+    parser.add_argument("--imgsz", type=int, default=None, help="Tamaño de entrada del modelo (por defecto: el de los pesos)")
+    parser.add_argument("--threads", type=int, default=None, help="Hilos de inferencia (por defecto: los del runtime)")
+    parser.add_argument("--quantization", choices=QUANTIZATIONS, default=None,
+                        help="Cuantización del modelo exportado (onnx: int8; openvino: fp16 o int8)")
+    parser.add_argument("--calibration-data", default=None,
+                        help="Dataset YAML de calibración para openvino int8 (obligatorio para exportarlo)")
+
+
+def backend_options(args):
+    """dict para detector.load_model a partir de las opciones de add_backend_arguments."""
+    return {"backend": args.backend, "imgsz": args.imgsz, "threads": args.threads, "quantization": args.quantization,
+            "samples": args.samples, "calibration_data": args.calibration_data}
+
+
+def main(argv=None):
+    import detector
+    parser = argparse.ArgumentParser(description="Exporta el modelo a ONNX/OpenVINO y compara backends de inferencia.")
+    parser.add_argument("-m", "--model", default=detector.MODEL_NAME, help=f"Pesos YOLO (por defecto: {detector.MODEL_NAME})")
+    parser.add_argument("--export", choices=BACKENDS[1:], default=None, help="Solo exportar a este formato")
+    parser.add_argument("--compare", action="store_true", help="Medir y comparar con PyTorch todos los backends instalados")
+    parser.add_argument("--imgsz", type=int, default=DEFAULT_IMGSZ, help=f"Tamaño de entrada (por defecto: {DEFAULT_IMGSZ})")
+    parser.add_argument("--threads", type=int, default=None, help="Hilos de inferencia")
+    parser.add_argument("--quantization", choices=QUANTIZATIONS, default=None, help="Cuantización de la exportación")
+    parser.add_argument("--calibration-data", "--data", dest="data", default=None,
+                        help="Dataset YAML de calibración para INT8 en OpenVINO (obligatorio para exportarlo)")
+    parser.add_argument("--samples", default=None, help="Carpeta de imágenes, imagen o video para medir y comparar (por defecto: sintéticos, "
+                             "que solo miden velocidad: ningún backend pasa la comprobación de precisión)")
+    parser.add_argument("--min-f1", type=float, default=ACCURACY_MIN_F1,
+                        help=f"F1 mínimo frente a PyTorch (por defecto: {ACCURACY_MIN_F1})")
+    args = parser.parse_args(argv)
+    if not os.path.exists(args.model):
+        print(f"Error: el archivo del modelo '{args.model}' no se encuentra.", file=sys.stderr)
+        return 1
+    if not args.export and not args.compare:
+        parser.error("indica --export o --compare")
+    try:
+        if args.export:
+            export_model(args.model, args.export, args.imgsz, args.quantization, args.data)
+        if args.compare:
+            rows = compare_backends(args.model, [args.export] if args.export else None, args.imgsz, args.threads,
+                                    args.quantization, args.samples, args.data, args.min_f1)
+            print_backend_comparison(rows)
+            return 0 if all(row.get("passed") for row in rows) else 1
+    except (ValueError, IOError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,257 @@
+"""Medición de tiempos por etapa durante el procesamiento, para ver dónde está el cuello de botella.
+
+Instrumentation acumula, sobre una ventana móvil de unos segundos, el tiempo por frame de cada
+etapa (decodificación, inferencia, anotado, encolado para codificar, render de la GUI...), los
+fps, la profundidad de las colas entre etapas, la memoria del proceso y el tiempo restante.
+El pipeline envuelve cada etapa con `with instrumentation.stage("nombre", frames):`.
+
+Desactivada se usa NULL_INSTRUMENTATION, cuyos métodos no hacen nada y cuyo stage() devuelve
+siempre el mismo context manager vacío: el coste es el de una llamada.
+
+Con profile=True cada hilo de etapa corre bajo su propio cProfile; dump_profile() los junta en
+un único archivo .prof (ver con `python -m pstats archivo.prof` o snakeviz). Desde Python 3.12
+cProfile usa sys.monitoring, que es de todo el intérprete: solo puede haber un perfilador activo
+y ese ve todos los hilos, así que los hilos comparten uno mientras alguno lo esté usando. Si otra
+herramienta ya está perfilando (un depurador, coverage...), el perfilado se desactiva con un
+aviso en vez de hacer fallar la etapa.
+"""
+import collections
+import contextlib
+import cProfile
+import os
+import pstats
+import sys
+import threading
+import time
+import psutil
+
+DEFAULT_WINDOW_S = 5.0 # Segundos de historia sobre los que se promedian tiempos y fps
+
+_NULL_CONTEXT = contextlib.nullcontext()
+_PROCESS_WIDE_PROFILER = sys.version_info >= (3, 12) # Un único cProfile por proceso (sys.monitoring)
+
+
+class _Stage:
+    """Context manager que mide un bloque y lo añade a una etapa. Se reutiliza: no es reentrante por etapa."""
+
+    __slots__ = ("_owner", "_name", "_frames", "_start")
+
+    def __init__(self, owner, name):
+        self._owner = owner
+        self._name = name
+        self._frames = 1
+        self._start = 0.0
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        end = time.perf_counter()
+        self._owner.record(self._name, end - self._start, self._frames, end)
+        return False
+
+
+class Instrumentation:
+    enabled = True
+
+    def __init__(self, window_s=DEFAULT_WINDOW_S, profile=False):
+        self.window_s = window_s
+        self.total_frames = 0 # Para la estimación del tiempo restante (0 = desconocido)
+        self.frames_done = 0
+        self._lock = threading.Lock()
+        self._samples = {} # etapa -> deque de (instante, segundos, frames)
+        self._ticks = collections.deque() # Instantes en que se completó un frame
+        self._gauges = {} # nombre -> función sin argumentos (p. ej. tamaño de una cola)
+        self._stages = {} # (hilo, etapa) -> _Stage reutilizable
+        self._process = psutil.Process()
+        self._profiles = [] if profile else None
+        self._profile_lock = threading.Lock()
+        self._profile_error = None # Motivo por el que se desactivó el perfilado
+        self._shared_profiler = None # Con _PROCESS_WIDE_PROFILER: el perfilador común y cuántos hilos lo usan
+        self._shared_users = 0
+
+    # --- Registro ---
+    def stage(self, name, frames=1):
+        """Context manager que mide el bloque como `frames` frames de la etapa `name`."""
+        key = (threading.get_ident(), name)
+        stage = self._stages.get(key)
+        if stage is None:
+            stage = self._stages[key] = _Stage(self, name)
+        stage._frames = frames
+        return stage
+
+    def record(self, name, seconds, frames=1, now=None):
+        now = time.perf_counter() if now is None else now
+        with self._lock:
+            samples = self._samples.get(name)
+            if samples is None:
+                samples = self._samples[name] = collections.deque()
+            samples.append((now, seconds, frames))
+            self._trim(samples, now)
+
+    def tick(self, frames=1):
+        """Marca frames completados (para los fps y el tiempo restante)."""
+        now = time.perf_counter()
+        with self._lock:
+            self.frames_done += frames
+            self._ticks.extend([now] * frames)
+            self._trim_ticks(now)
+
+    def gauge(self, name, function):
+        """Registra un valor que se lee en cada snapshot (p. ej. lambda: cola.qsize())."""
+        self._gauges[name] = function
+
+    def reset(self, total_frames=0):
+        with self._lock:
+            self.total_frames = total_frames
+            self.frames_done = 0
+            self._samples.clear()
+            self._ticks.clear()
+        self._gauges.clear()
+
+    # --- Lectura ---
+    def snapshot(self):
+        """Estado actual: fps, ms por frame de cada etapa, colas, memoria (MB) y tiempo restante (s)."""
+        now = time.perf_counter()
+        with self._lock:
+            self._trim_ticks(now)
+            stages = {}
+            for name, samples in self._samples.items():
+                self._trim(samples, now)
+                frames = sum(f for _, _, f in samples)
+                if frames:
+                    stages[name] = sum(s for _, s, _ in samples) / frames * 1000
+            fps = None
+            if len(self._ticks) >= 2 and self._ticks[-1] > self._ticks[0]:
+                fps = (len(self._ticks) - 1) / (self._ticks[-1] - self._ticks[0])
+            frames_done, total = self.frames_done, self.total_frames
+        queues = {}
+        for name, function in list(self._gauges.items()):
+            try:
+                queues[name] = function()
+            except Exception:
+                queues[name] = None
+        eta = (total - frames_done) / fps if fps and total > frames_done else None
+        return {"fps": fps, "stages_ms": stages, "queues": queues, "frames": frames_done, "total_frames": total,
+                "eta_s": eta, "rss_mb": self._process.memory_info().rss / 2 ** 20}
+
+    def summary(self):
+        """Texto de varias líneas para el panel de rendimiento de la GUI."""
+        snap = self.snapshot()
+        lines = [f"{snap['fps']:.1f} fps" if snap["fps"] else "-- fps"]
+        if snap["eta_s"] is not None:
+            minutes, seconds = divmod(int(snap["eta_s"]), 60)
+            lines[0] += f", quedan {minutes:02d}:{seconds:02d}"
+        lines[0] += f", {snap['rss_mb']:.0f} MB"
+        for name, ms in snap["stages_ms"].items():
+            lines.append(f"{name:<12}{ms:8.2f} ms")
+        if snap["queues"]:
+            lines.append("colas: " + ", ".join(f"{name} {depth}" for name, depth in snap["queues"].items()))
+        return "\n".join(lines)
+
+    # --- Perfilado ---
+    def profile(self, label):
+        """Context manager que perfila el hilo actual (si profile=True) hasta salir del bloque. Nunca falla."""
+        if self._profiles is None or self._profile_error is not None:
+            return _NULL_CONTEXT
+        return self._profile_thread(label)
+
+    @contextlib.contextmanager
+    def _profile_thread(self, label):
+        profiler = self._start_profiler()
+        try:
+            yield
+        finally:
+            if profiler is not None:
+                self._stop_profiler(label, profiler)
+
+    def _start_profiler(self):
+        with self._profile_lock:
+            if self._profile_error is not None:
+                return None
+            if _PROCESS_WIDE_PROFILER and self._shared_users:
+                self._shared_users += 1
+                return self._shared_profiler
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError as e: # "Another profiling tool is already active"
+                self._profile_error = e
+                print(f"[Perfilado] Desactivado: {e}")
+                return None
+            if _PROCESS_WIDE_PROFILER:
+                self._shared_profiler = profiler
+                self._shared_users = 1
+            return profiler
+
+    def _stop_profiler(self, label, profiler):
+        with self._profile_lock:
+            if _PROCESS_WIDE_PROFILER:
+                self._shared_users -= 1
+                if self._shared_users:
+                    return # Otros hilos siguen dentro de profile()
+                self._shared_profiler = None
+                label = "proceso"
+            profiler.disable()
+            self._profiles.append((label, profiler))
+
+    def dump_profile(self, path):
+        """Junta los perfiles de todos los hilos en un .prof. Devuelve la ruta o None si no hay perfiles."""
+        with self._profile_lock:
+            profiles = list(self._profiles or [])
+            if self._profiles is not None:
+                self._profiles.clear()
+        if not profiles:
+            return None
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        stats = pstats.Stats(profiles[0][1])
+        for _, profiler in profiles[1:]:
+            stats.add(profiler)
+        stats.dump_stats(path)
+        return path
+
+    def _trim(self, samples, now):
+        while samples and now - samples[0][0] > self.window_s:
+            samples.popleft()
+
+    def _trim_ticks(self, now):
+        while self._ticks and now - self._ticks[0] > self.window_s:
+            self._ticks.popleft()
+
+
+class NullInstrumentation:
+    """Instrumentación desactivada: la misma interfaz sin hacer nada."""
+    enabled = False
+    total_frames = 0
+    frames_done = 0
+
+    def stage(self, name, frames=1):
+        return _NULL_CONTEXT
+
+    def record(self, name, seconds, frames=1, now=None):
+        pass
+
+    def tick(self, frames=1):
+        pass
+
+    def gauge(self, name, function):
+        pass
+
+    def reset(self, total_frames=0):
+        pass
+
+    def snapshot(self):
+        return None
+
+    def summary(self):
+        return ""
+
+    def profile(self, label):
+        return _NULL_CONTEXT
+
+    def dump_profile(self, path):
+        return None
+
+
+NULL_INSTRUMENTATION = NullInstrumentation()
@@ -1,15 +1,54 @@
+import time # Para controlar el FPS en la reproducción
+_STARTUP_T0 = time.perf_counter() # Referencia para medir las fases de arranque
 import tkinter as tk
-from tkinter import filedialog, messagebox, ttk
+from tkinter import filedialog, messagebox, simpledialog, ttk
 from PIL import Image, ImageTk
 import cv2
-from ultralytics import YOLO
 import threading # Para procesar video sin congelar la GUI
+import contextlib
+import numpy as np
 import os
-import time # Para controlar el FPS en la reproducción
+from pipeline import VideoPipeline
+from worker_pool import WorkerPool
+from preview import LatestFrameMailbox, RateLimiter, RenderTimer, fit_to_size
+from seeking import KeyframeIndex, FrameSeeker
+from replay import ReplayClock, FramePrefetcher, PLAYBACK_SPEEDS, END_OF_VIDEO
+from detection_cache import DetectionCache
+from detection_store import DetectionStore
+from tiling import read_overview
+from frame_skip import DEFAULT_MOTION_THRESHOLD
+from tracking import CellTracker, track_statistics, save_track_statistics
+from annotator import Annotator, ANNOTATION_STYLES, DEFAULT_STYLE
+from encoder import unique_output_path
+from streaming import StreamPipeline, grab_frame, open_source, DEFAULT_STREAM_OUTPUT_DIR
+from instrumentation import Instrumentation, NULL_INSTRUMENTATION
+from inference_backends import available_backends, cached_backend, select_backend
+from detector import MODEL_NAME, IMAGE_EXTENSIONS, VIDEO_EXTENSIONS, load_model, detect_image, class_counts, counts_by_name, store_dir_for
+
+PROCESSED_VIDEO_DIR = "videos_procesados" # Cada procesamiento escribe aquí un archivo nuevo (no se sobrescriben)
+PREVIEW_ENCODER_OPTIONS = {"scale": 0.5, "frame_step": 2} # Salida reducida: mitad de resolución y de frames
+PROFILE_DIR = "perfiles" # Archivos .prof de cProfile cuando se activa "Perfilar"
+BATCH_SIZE = 8 # Frames por lote de inferencia en el pipeline de video
+# Backend de inferencia (ver inference_backends): con "auto" el arranque usa la elección guardada o
+# PyTorch, sin medir nada; "Elegir Backend" mide en segundo plano con el archivo cargado (o samples).
+# calibration_data: dataset YAML de calibración, obligatorio para quantization "int8" en OpenVINO
+MODEL_OPTIONS = {"backend": "auto", "imgsz": None, "threads": None, "quantization": None, "samples": None,
+                 "calibration_data": None}
+BATCH_OUTPUT_DIR = "salida_lote" # Carpeta de salida cuando se procesan varios archivos a la vez
+PREVIEW_HZ = 15 # Refrescos por segundo de la vista previa mientras se procesa un video
+PROGRESS_HZ = 4 # Actualizaciones por segundo de la etiqueta de progreso
+SHUTDOWN_TIMEOUT_S = 10 # Al cerrar, espera máxima a que el procesamiento termine de escribir el video
+SHUTDOWN_POLL_MS = 50
+DEFAULT_DISPLAY_SIZE = (680, 480) # Tamaño de la vista hasta que Tk informe el tamaño real del panel
+MAX_FRAME_STRIDE = 30 # Máximo de "Detectar cada N frames"
+INFERENCE_SIZES = ("auto", "320", "480", "640", "960", "1280") # imgsz de model.predict; "auto" = el del modelo
+ROI_COLOR = (0, 200, 255) # BGR del rectángulo de la región de interés en la vista previa
+FRAME_SKIP_AUDIT_INTERVAL = 20 # Con salto de frames, 1 de cada N frames interpolados se detecta para medir el error
+
+
+def log_startup_phase(phase, seconds):
+    print(f"[Arranque] {phase}: {seconds * 1000:.0f} ms")
 
-# --- Configuración del Modelo YOLO ---
-MODEL_NAME = 'modelo_celulas_entrenado_yolo_v8.pt' # Asegúrate que este archivo exista
-PROCESSED_VIDEO_FILENAME = "processed_video_output.mp4" # Nombre del archivo de video procesado
 
 class YOLOApp:
     def __init__(self, root):
@@ -20,21 +59,65 @@ class YOLOApp:
         # --- Variables ---
         self.model = None
         self.filepath = None
+        self.filepaths = [] # Archivos seleccionados; si hay más de uno se procesan en el pool de procesos
+        self.live_source = None # Fuente en vivo (cámara, URL, carpeta o "synthetic"), ver streaming.open_source
         self.is_video = False
-        self.cap = None # Para VideoCapture durante el procesamiento
+        self.pipeline = None # Pipeline de procesamiento de video (decodificación/inferencia/anotado/codificación)
         self.video_processing_active = False
         self.detected_classes_set = set()
+        self.detected_class_counts = {} # nombre -> detecciones, para la lista de clases
+        self.preview_mailbox = LatestFrameMailbox() # Último frame procesado pendiente de mostrar
+        self.preview_limiter = RateLimiter(PREVIEW_HZ) # Frames que el hilo de anotado reduce y publica
+        self.progress_limiter = RateLimiter(PROGRESS_HZ)
+        self.video_thread = None # Hilo de process_video/process_live; se espera al cerrar la ventana
+        self.shutdown_deadline = None
+        self.class_counts = np.zeros(0, dtype=np.int64) # Detecciones por class_id, acumuladas por el hilo de procesamiento
+        self.frames_done = 0
+        self.display_size = DEFAULT_DISPLAY_SIZE # Tamaño máximo de la imagen mostrada, se actualiza con <Configure>
+        self.display_photo = None # PhotoImage reutilizada mientras no cambie el tamaño del frame mostrado
+        self.display_rgb = None # Buffer RGB de la vista, reutilizado mientras no cambie el tamaño
+        self.render_timer = RenderTimer()
+        self.detection_cache = DetectionCache() # Detecciones guardadas por archivo + pesos + parámetros
+        self.worker_pool = None # Pool de procesos para lotes de archivos
+        self.tiling_var = tk.BooleanVar(value=False) # Inferencia por teselas para imágenes grandes
+        self.stride_var = tk.IntVar(value=1) # Videos: detectar uno de cada N frames e interpolar el resto
+        self.adaptive_skip_var = tk.BooleanVar(value=False) # Videos: detectar también cuando la imagen cambia
+        self.track_var = tk.BooleanVar(value=False) # Videos: seguir cada célula con un ID persistente
+        self.annotation_var = tk.StringVar(value=DEFAULT_STYLE) # Estilo de anotación de la salida
+        self.preview_output_var = tk.BooleanVar(value=False) # Videos: codificar la salida reducida (más rápido y ligero)
+        self.imgsz_var = tk.StringVar(value=INFERENCE_SIZES[0]) # Tamaño de entrada de la inferencia
+        self.roi_output_var = tk.BooleanVar(value=False) # Anotar y codificar solo la región de interés
+        self.roi_box = None # Región de interés (x1, y1, x2, y2) en píxeles del archivo cargado
+        self.roi_preview = None # (frame reducido, factor a píxeles del original) mientras se dibuja el ROI
+        self.roi_drag_start = None # Esquina inicial del rectángulo, en píxeles del frame reducido
+        self.perf_panel_var = tk.BooleanVar(value=False) # Mostrar fps, ms por etapa, colas y memoria
+        self.profile_var = tk.BooleanVar(value=False) # Perfilar con cProfile el próximo procesamiento/reproducción
+        self.instrumentation = NULL_INSTRUMENTATION # Instrumentation del procesamiento o reproducción en curso
+        self.profile_stack = None # Mantiene activo el perfilado del hilo de la GUI
+        self.batch_progress = {} # ruta -> (frames_hechos, total) de los archivos en curso
+        self.batch_finished = 0
+        self.batch_failed = 0
+        self.batch_total = 0
 
         self.processed_video_path = None # Ruta al video procesado guardado
-        self.video_writer = None # Para guardar el video procesado
+        self.detection_store = None # Todas las detecciones del último video procesado (columnar, en disco)
         self.original_video_fps = 30 # FPS por defecto, se intentará obtener del video
 
         self.is_replaying = False # Flag para controlar la reproducción del video procesado
         self.is_paused = False # Flag para pausar la reproducción
-        self.replay_cap = None # VideoCapture para la reproducción
+        self.replay_prefetcher = None # Hilo que decodifica por adelantado para la reproducción
+        self.replay_clock = None # Reloj monotónico que decide qué frame toca mostrar
+        self.replay_job = None # Id del after() programado para el siguiente frame
+        self.replay_held_item = None # Frame decodificado que llegó antes de su plazo
+        self.replay_dropped = 0 # Frames descartados por ir retrasados
+        self.replay_fps = 30
         self.total_frames = 0 # Total de frames del video
         self.current_frame_pos = 0 # Posición actual del frame
         self.timeline_updating = False # Flag para evitar bucles al actualizar timeline
+        self.keyframe_indexes = {} # ruta -> (mtime, KeyframeIndex), se construye una vez por video procesado
+        self.frame_seeker = None # Decodificador en segundo plano para el scrubbing de la timeline
+        self.seek_poll_scheduled = False
+        self.pending_replay_pos = None # Posición a la que saltará la reproducción en el siguiente frame
 
         # --- Estilo ---
         style = ttk.Style()
@@ -54,18 +137,78 @@ class YOLOApp:
         self.btn_load = ttk.Button(control_panel, text="Cargar Imagen/Video", command=self.load_file)
         self.btn_load.pack(pady=10, fill=tk.X)
 
+        self.btn_live = ttk.Button(control_panel, text="Fuente en Vivo...", command=self.load_live_source)
+        self.btn_live.pack(pady=(0, 10), fill=tk.X)
+
         self.lbl_filepath = ttk.Label(control_panel, text="Archivo: Ninguno seleccionado", wraplength=230)
         self.lbl_filepath.pack(pady=5, fill=tk.X)
 
         self.btn_process = ttk.Button(control_panel, text="Procesar", command=self.process_content, state=tk.DISABLED)
         self.btn_process.pack(pady=10, fill=tk.X)
 
+        self.btn_stop_live = ttk.Button(control_panel, text="Detener Captura", command=self.stop_live, state=tk.DISABLED)
+        self.btn_stop_live.pack(pady=(0, 10), fill=tk.X)
+
+        self.chk_tiling = ttk.Checkbutton(control_panel, text="Inferencia por teselas (imágenes grandes)", variable=self.tiling_var)
+        self.chk_tiling.pack(pady=5, anchor='w')
+
+        stride_frame = ttk.Frame(control_panel, padding=0)
+        stride_frame.pack(pady=5, fill=tk.X)
+        ttk.Label(stride_frame, text="Detectar cada", padding=0).pack(side=tk.LEFT)
+        self.spin_stride = ttk.Spinbox(stride_frame, from_=1, to=MAX_FRAME_STRIDE, width=4, textvariable=self.stride_var)
+        self.spin_stride.pack(side=tk.LEFT, padx=5)
+        ttk.Label(stride_frame, text="frames", padding=0).pack(side=tk.LEFT)
+        self.chk_adaptive_skip = ttk.Checkbutton(control_panel, text="Detectar también si hay movimiento", variable=self.adaptive_skip_var)
+        self.chk_adaptive_skip.pack(pady=5, anchor='w')
+        self.chk_track = ttk.Checkbutton(control_panel, text="Seguir células (IDs)", variable=self.track_var)
+        self.chk_track.pack(pady=5, anchor='w')
+
+        annotation_frame = ttk.Frame(control_panel, padding=0)
+        annotation_frame.pack(pady=5, fill=tk.X)
+        ttk.Label(annotation_frame, text="Anotación:", padding=0).pack(side=tk.LEFT)
+        self.combo_annotation = ttk.Combobox(annotation_frame, textvariable=self.annotation_var, values=ANNOTATION_STYLES,
+                                             state="readonly", width=10)
+        self.combo_annotation.pack(side=tk.LEFT, padx=5)
+        self.chk_preview_output = ttk.Checkbutton(control_panel, text="Video de salida reducido (vista previa)",
+                                                  variable=self.preview_output_var)
+        self.chk_preview_output.pack(pady=5, anchor='w')
+
+        imgsz_frame = ttk.Frame(control_panel, padding=0)
+        imgsz_frame.pack(pady=5, fill=tk.X)
+        ttk.Label(imgsz_frame, text="Tamaño de inferencia:", padding=0).pack(side=tk.LEFT)
+        self.combo_imgsz = ttk.Combobox(imgsz_frame, textvariable=self.imgsz_var, values=INFERENCE_SIZES,
+                                        state="readonly", width=6)
+        self.combo_imgsz.pack(side=tk.LEFT, padx=5)
+        self.btn_backend = ttk.Button(control_panel, text="Elegir Backend", command=self.start_backend_selection,
+                                      state=tk.DISABLED)
+        self.btn_backend.pack(pady=5, fill=tk.X)
+        roi_frame = ttk.Frame(control_panel, padding=0)
+        roi_frame.pack(pady=5, fill=tk.X)
+        self.btn_roi = ttk.Button(roi_frame, text="Dibujar ROI", command=self.start_roi_selection)
+        self.btn_roi.pack(side=tk.LEFT, expand=True, fill=tk.X)
+        self.btn_clear_roi = ttk.Button(roi_frame, text="Quitar ROI", command=self.clear_roi, state=tk.DISABLED)
+        self.btn_clear_roi.pack(side=tk.LEFT, expand=True, fill=tk.X, padx=(5, 0))
+        self.chk_roi_output = ttk.Checkbutton(control_panel, text="Codificar solo el ROI", variable=self.roi_output_var)
+        self.chk_roi_output.pack(pady=5, anchor='w')
+        self.lbl_roi = ttk.Label(control_panel, text="ROI: imagen completa", wraplength=230, padding=0)
+        self.lbl_roi.pack(fill=tk.X)
+        self.chk_perf_panel = ttk.Checkbutton(control_panel, text="Panel de rendimiento", variable=self.perf_panel_var)
+        self.chk_perf_panel.pack(pady=5, anchor='w')
+        self.chk_profile = ttk.Checkbutton(control_panel, text="Perfilar (cProfile)", variable=self.profile_var)
+        self.chk_profile.pack(pady=5, anchor='w')
+
         self.btn_play_processed = ttk.Button(control_panel, text="Reproducir Video Procesado", command=self.start_replay_processed_video, state=tk.DISABLED)
         self.btn_play_processed.pack(pady=10, fill=tk.X)
 
-        self.lbl_status = ttk.Label(control_panel, text="Estado: Listo")
+        self.btn_export = ttk.Button(control_panel, text="Exportar Detecciones", command=self.export_detections, state=tk.DISABLED)
+        self.btn_export.pack(pady=10, fill=tk.X)
+
+        self.lbl_status = ttk.Label(control_panel, text="Estado: Listo", wraplength=230)
         self.lbl_status.pack(pady=5, fill=tk.X)
 
+        self.lbl_perf = ttk.Label(control_panel, text="", font=('Courier', 8), justify=tk.LEFT, anchor='w', padding=0)
+        self.lbl_perf.pack(fill=tk.X)
+
         ttk.Separator(control_panel, orient='horizontal').pack(fill='x', pady=10)
 
         self.lbl_classes_title = ttk.Label(control_panel, text="Clases Detectadas:")
@@ -81,6 +224,7 @@ class YOLOApp:
         self.lbl_image_display = ttk.Label(display_panel, text="El contenido procesado se mostrará aquí.", anchor="center")
         self.lbl_image_display.pack(fill=tk.BOTH, expand=True)
         self.lbl_image_display.configure(background='lightgrey')
+        self.lbl_image_display.bind("<Configure>", self.on_display_resize)
 
         # --- Controles de Video ---
         self.video_controls_frame = ttk.Frame(display_panel)
@@ -97,6 +241,13 @@ class YOLOApp:
         self.btn_stop = ttk.Button(controls_buttons_frame, text="⏹️", command=self.stop_replay, width=3)
         self.btn_stop.pack(side=tk.LEFT, padx=5)
 
+        self.speed_var = tk.StringVar(value="1×")
+        self.cmb_speed = ttk.Combobox(controls_buttons_frame, textvariable=self.speed_var, width=6, state="readonly",
+                                      values=[f"{speed:g}×" for speed in PLAYBACK_SPEEDS])
+        self.cmb_speed.pack(side=tk.RIGHT, padx=5)
+        self.cmb_speed.bind("<<ComboboxSelected>>", self.on_speed_change)
+        ttk.Label(controls_buttons_frame, text="Velocidad:").pack(side=tk.RIGHT)
+
         # Timeline (barra de progreso)
         timeline_frame = ttk.Frame(self.video_controls_frame)
         timeline_frame.pack(fill=tk.X, pady=5)
@@ -116,55 +267,141 @@ class YOLOApp:
         self.lbl_total_time = ttk.Label(time_frame, text="00:00", font=('Helvetica', 9))
         self.lbl_total_time.pack(side=tk.RIGHT)
 
-        # --- Cargar modelo YOLO ---
+        # --- Cargar modelo YOLO (en segundo plano, la ventana aparece de inmediato) ---
         self.load_yolo_model()
 
         self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
+        self.root.after_idle(lambda: log_startup_phase("ventana visible", time.perf_counter() - _STARTUP_T0))
 
     def load_yolo_model(self):
+        self.lbl_status.config(text="Estado: Cargando modelo YOLO...")
+        threading.Thread(target=self._load_model_worker, name="model-loader", daemon=True).start()
+
+    def _load_model_worker(self):
+        """Importa ultralytics/torch, carga los pesos y calienta el modelo fuera del hilo de la GUI.
+
+        Con backend "auto" no se exporta ni se mide nada aquí: se usa la elección guardada o PyTorch.
+        """
+        timings = {}
+        options = dict(MODEL_OPTIONS)
+        if options["backend"] == "auto":
+            options["backend"] = cached_backend(MODEL_NAME, options["imgsz"], options["threads"],
+                                                options["quantization"]) or "pytorch"
+            if options["backend"] == "pytorch":
+                options["quantization"] = None
         try:
-            self.lbl_status.config(text="Estado: Cargando modelo YOLO...")
-            self.root.update_idletasks()
-            if not os.path.exists(MODEL_NAME):
-                messagebox.showerror("Error de Modelo", f"El archivo del modelo '{MODEL_NAME}' no se encuentra. Por favor, verifica la ruta.")
-                self.lbl_status.config(text="Error: Modelo no encontrado.")
-                self.root.quit()
-                return
-            self.model = YOLO(MODEL_NAME)
-            self.lbl_status.config(text=f"Estado: Modelo {MODEL_NAME} cargado.")
-            print(f"Modelo YOLO {MODEL_NAME} cargado exitosamente.")
-            self.btn_load.config(state=tk.NORMAL)
+            model = load_model(MODEL_NAME, warmup=True, timings=timings, **options)
+        except FileNotFoundError as e:
+            self.root.after(0, self._on_model_error, "Error: Modelo no encontrado.", str(e))
+            return
+        except Exception as e:
+            self.root.after(0, self._on_model_error, "Error: Fallo al cargar modelo.", f"No se pudo cargar el modelo YOLO: {e}")
+            return
+        self.root.after(0, self._on_model_loaded, model, timings)
+
+    def _on_model_loaded(self, model, timings):
+        self.model = model
+        for phase, seconds in timings.items():
+            log_startup_phase(phase, seconds)
+        log_startup_phase("total hasta modelo listo", time.perf_counter() - _STARTUP_T0)
+        backend = model.backend_options["backend"]
+        print(f"Modelo YOLO {MODEL_NAME} cargado exitosamente (backend: {backend}).")
+        if not self.video_processing_active and not self.is_replaying:
+            self.lbl_status.config(text=f"Estado: Modelo {MODEL_NAME} cargado ({backend}).")
+        self.btn_process.config(state=self._process_button_state())
+        if MODEL_OPTIONS["backend"] == "auto" and available_backends() != ["pytorch"]:
+            self.btn_backend.config(state=tk.NORMAL)
+
+    def start_backend_selection(self):
+        """Mide los backends instalados en segundo plano sobre frames reales y cambia al más rápido que pase."""
+        samples = MODEL_OPTIONS["samples"]
+        if self.filepath and os.path.splitext(self.filepath)[1].lower() in IMAGE_EXTENSIONS + VIDEO_EXTENSIONS:
+            samples = self.filepath
+        if not samples:
+            messagebox.showinfo("Elegir Backend", "Carga primero una imagen o un video con células: la precisión de "
+                                                  "cada backend se comprueba frente a PyTorch sobre esos frames.")
+            return
+        self.btn_backend.config(state=tk.DISABLED)
+        self.lbl_status.config(text="Estado: Midiendo backends de inferencia...")
+        threading.Thread(target=self._select_backend_worker, args=(samples,), name="backend-selection", daemon=True).start()
+
+    def _select_backend_worker(self, samples):
+        options = dict(MODEL_OPTIONS, samples=samples)
+        model = None
+        try:
+            backend = select_backend(MODEL_NAME, options["imgsz"], options["threads"], options["quantization"], samples,
+                                     refresh=True, calibration_data=options["calibration_data"])
+            if backend != self.model.backend_options["backend"]:
+                options["backend"] = backend
+                if backend == "pytorch":
+                    options["quantization"] = None
+                model = load_model(MODEL_NAME, warmup=True, **options)
         except Exception as e:
-            messagebox.showerror("Error de Modelo", f"No se pudo cargar el modelo YOLO: {e}")
-            self.lbl_status.config(text="Error: Fallo al cargar modelo.")
-            self.root.quit()
+            self.root.after(0, self._on_backend_selected, None, None, str(e))
+            return
+        self.root.after(0, self._on_backend_selected, model, backend, None)
+
+    def _on_backend_selected(self, model, backend, error):
+        self.btn_backend.config(state=tk.NORMAL)
+        if error:
+            messagebox.showerror("Elegir Backend", f"No se pudo elegir el backend de inferencia: {error}")
+            self.lbl_status.config(text="Estado: Error al elegir backend.")
+            return
+        if model is not None:
+            self.model = model # Los procesamientos en curso conservan el modelo con el que empezaron
+        print(f"Backend de inferencia: {backend}.")
+        if not self.video_processing_active and not self.is_replaying:
+            self.lbl_status.config(text=f"Estado: Modelo {MODEL_NAME} cargado ({backend}).")
+
+    def _on_model_error(self, status_text, message):
+        messagebox.showerror("Error de Modelo", message)
+        self.lbl_status.config(text=status_text)
+        self.root.quit()
+
+    def _process_button_state(self):
+        """'Procesar' solo se habilita con un archivo o una fuente en vivo cargados y el modelo listo."""
+        return tk.NORMAL if (self.filepath or self.live_source) and self.model else tk.DISABLED
 
     def load_file(self):
-        if self.video_processing_active:
+        if self.video_processing_active or self.worker_pool:
             messagebox.showwarning("Procesando", "Hay un video en proceso. Por favor, espere o cierre la ventana.")
             return
         if self.is_replaying:
             self.stop_replay() # Detener reproducción si se está cargando un nuevo archivo
 
-        self.filepath = filedialog.askopenfilename(
-            title="Seleccionar archivo",
-            filetypes=(("Archivos de Imagen", "*.jpg *.jpeg *.png *.bmp *.tiff"),
+        selected = filedialog.askopenfilenames(
+            title="Seleccionar archivo(s)",
+            filetypes=(("Archivos de Imagen", "*.jpg *.jpeg *.png *.bmp *.tif *.tiff"),
                        ("Archivos de Video", "*.mp4 *.avi *.mov *.mkv"),
                        ("Todos los archivos", "*.*"))
         )
+        self.filepaths = [path for path in selected
+                          if os.path.splitext(path)[1].lower() in IMAGE_EXTENSIONS + VIDEO_EXTENSIONS]
+        if len(selected) > 1 and len(self.filepaths) < len(selected):
+            messagebox.showwarning("Aviso", f"Se ignoraron {len(selected) - len(self.filepaths)} archivo(s) con formato no soportado.")
+        self.filepath = self.filepaths[0] if self.filepaths else (selected[0] if selected else None)
         if self.filepath:
-            self.lbl_filepath.config(text=f"Archivo: {os.path.basename(self.filepath)}")
-            self.btn_process.config(state=tk.NORMAL)
+            self.live_source = None
+            if len(self.filepaths) > 1:
+                self.lbl_filepath.config(text=f"Archivos: {len(self.filepaths)} seleccionados")
+            else:
+                self.lbl_filepath.config(text=f"Archivo: {os.path.basename(self.filepath)}")
+            self.btn_process.config(state=self._process_button_state())
             self.btn_play_processed.config(state=tk.DISABLED) # Deshabilitar al cargar nuevo archivo
             self.listbox_classes.delete(0, tk.END)
             self.detected_classes_set.clear()
+            self.detected_class_counts = {}
             self.processed_video_path = None # Resetear ruta de video procesado
+            self.detection_store = None
+            self.btn_export.config(state=tk.DISABLED)
+            self._end_roi_selection()
+            self._set_roi(None) # El ROI es del archivo anterior
 
             ext = os.path.splitext(self.filepath)[1].lower()
-            if ext in ['.jpg', '.jpeg', '.png', '.bmp', '.tiff']:
+            if ext in IMAGE_EXTENSIONS:
                 self.is_video = False
                 self.display_image_preview(self.filepath)
-            elif ext in ['.mp4', '.avi', '.mov', '.mkv']:
+            elif ext in VIDEO_EXTENSIONS:
                 self.is_video = True
                 self.display_video_preview_frame(self.filepath)
             else:
@@ -177,26 +414,87 @@ class YOLOApp:
             self.btn_process.config(state=tk.DISABLED)
             self.btn_play_processed.config(state=tk.DISABLED)
 
+    def load_live_source(self):
+        if self.video_processing_active or self.worker_pool:
+            messagebox.showwarning("Procesando", "Hay un video en proceso. Por favor, espere o cierre la ventana.")
+            return
+        if self.is_replaying:
+            self.stop_replay()
+        spec = simpledialog.askstring("Fuente en vivo",
+                                      "Cámara (0), /dev/videoN, URL rtsp://..., carpeta vigilada,\n"
+                                      "video (se reproduce en bucle) o 'synthetic' (frames de prueba):",
+                                      initialvalue=self.live_source or "synthetic", parent=self.root)
+        if not spec:
+            return
+        try:
+            open_source(spec) # Solo valida la especificación; la fuente se abre al procesar
+        except ValueError as e:
+            messagebox.showerror("Error", str(e))
+            return
+        self.live_source = spec.strip()
+        self.filepath = None
+        self.filepaths = []
+        self.is_video = True
+        self._end_roi_selection()
+        self._set_roi(None) # El ROI es del archivo o la fuente anterior
+        self.lbl_filepath.config(text=f"Fuente en vivo: {self.live_source}")
+        self.btn_process.config(state=self._process_button_state())
+        self.btn_play_processed.config(state=tk.DISABLED)
+        self.listbox_classes.delete(0, tk.END)
+        self.detected_classes_set.clear()
+        self.detected_class_counts = {}
+        self.processed_video_path = None
+        self.detection_store = None
+        self.btn_export.config(state=tk.DISABLED)
+
+    def stop_live(self):
+        """Detiene la captura en vivo; lo ya procesado se guarda y el último segmento se cierra."""
+        self.btn_stop_live.config(state=tk.DISABLED)
+        if self.pipeline:
+            self.pipeline.stop()
+
+    def on_display_resize(self, event):
+        """Guarda el tamaño del panel para no consultar winfo_width/height en cada frame."""
+        if event.width >= 2 and event.height >= 2:
+            self.display_size = (max(1, event.width - 20), max(1, event.height - 20))
+
+    def fit_to_display(self, frame):
+        """Reduce el frame al tamaño del panel manteniendo la proporción. Seguro desde otros hilos."""
+        return fit_to_size(frame, self.display_size)
+
     def display_image_preview(self, image_data, is_processed_frame=False):
+        start = time.perf_counter()
         try:
             if is_processed_frame:
-                img = Image.fromarray(cv2.cvtColor(image_data, cv2.COLOR_BGR2RGB))
+                frame = image_data
             else:
-                img = Image.open(image_data)
-
-            panel_width = self.lbl_image_display.winfo_width()
-            panel_height = self.lbl_image_display.winfo_height()
-            if panel_width < 2 or panel_height < 2:
-                panel_width, panel_height = 700, 500 # Ajustar si es necesario
-
-            img.thumbnail((panel_width - 20, panel_height - 20), Image.Resampling.LANCZOS)
-            photo = ImageTk.PhotoImage(img)
-            self.lbl_image_display.config(image=photo, text="")
-            self.lbl_image_display.image = photo
+                # Vista general sin decodificar la imagen completa (importa en escaneos de gigapíxeles)
+                frame, _ = read_overview(image_data, max(self.display_size))
+
+            # Reducir una sola vez (como thumbnail: nunca se amplía) y convertir a RGB ya en pequeño
+            frame = self.fit_to_display(frame)
+            target_size = (frame.shape[1], frame.shape[0])
+            if self.display_rgb is None or self.display_rgb.shape != frame.shape:
+                self.display_rgb = np.empty(frame.shape, dtype=np.uint8)
+            # PhotoImage/paste copian los píxeles, así que el mismo buffer sirve para el siguiente frame
+            rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=self.display_rgb)
+            img = Image.frombuffer("RGB", target_size, rgb, "raw", "RGB", 0, 1)
+
+            if self.display_photo is not None and (self.display_photo.width(), self.display_photo.height()) == target_size:
+                self.display_photo.paste(img) # Reutilizar el buffer de Tk en vez de crear otro PhotoImage
+            else:
+                self.display_photo = ImageTk.PhotoImage(img)
+                self.lbl_image_display.config(image=self.display_photo, text="")
+                self.lbl_image_display.image = self.display_photo
         except Exception as e:
             print(f"Error al mostrar imagen/frame: {e}")
             self.lbl_image_display.config(text="Error al mostrar contenido.", image=None)
             self.lbl_image_display.image = None
+            self.display_photo = None
+        finally:
+            elapsed = time.perf_counter() - start
+            self.render_timer.record(elapsed)
+            self.instrumentation.record("display", elapsed)
 
     def display_video_preview_frame(self, path):
         try:
@@ -207,47 +505,82 @@ class YOLOApp:
                 self.display_image_preview(frame, is_processed_frame=True)
             else:
                 self.lbl_image_display.config(text="No se pudo leer el primer frame del video.", image=None)
+                self.display_photo = None
         except Exception as e:
             print(f"Error al mostrar preview de video: {e}")
             self.lbl_image_display.config(text="Error al mostrar preview de video.", image=None)
+            self.display_photo = None
 
     def process_content(self):
-        if not self.filepath or not self.model:
+        if not (self.filepath or self.live_source) or not self.model:
             messagebox.showwarning("Advertencia", "Por favor, carga un archivo y asegúrate que el modelo YOLO esté cargado.")
             return
         if self.is_replaying:
             self.stop_replay()
+        self._end_roi_selection()
 
         self.btn_process.config(state=tk.DISABLED)
         self.btn_load.config(state=tk.DISABLED)
+        self.btn_live.config(state=tk.DISABLED)
         self.btn_play_processed.config(state=tk.DISABLED)
         self.lbl_status.config(text="Estado: Procesando...")
         self.root.update_idletasks()
         self.listbox_classes.delete(0, tk.END)
         self.detected_classes_set.clear()
+        self.detected_class_counts = {}
         self.processed_video_path = None # Resetear
+        self.detection_store = None
+        self.btn_export.config(state=tk.DISABLED)
 
-        if self.is_video:
+        if self.live_source:
+            self.video_processing_active = True
+            self.preview_mailbox.clear()
+            self.render_timer.reset()
+            self.class_counts = np.zeros(len(self.model.names), dtype=np.int64)
+            self.frames_done = 0
+            self.btn_stop_live.config(state=tk.NORMAL)
+            self._start_instrumentation()
+            self.video_thread = threading.Thread(target=self.process_live,
+                                                 args=(self.live_source, self.track_var.get(), self._annotator(),
+                                                       self._encoder_options(), self.instrumentation,
+                                                       self._predict_args(), self._roi_options()),
+                                                 daemon=True)
+            self.video_thread.start()
+            self._preview_tick()
+        elif len(self.filepaths) > 1:
+            self.start_batch_processing()
+        elif self.is_video:
             self.video_processing_active = True
-            self.video_thread = threading.Thread(target=self.process_video, daemon=True)
+            self.preview_mailbox.clear()
+            self.render_timer.reset()
+            self.class_counts = np.zeros(len(self.model.names), dtype=np.int64)
+            self.frames_done = 0
+            # Las variables de Tk se leen aquí: process_video corre en otro hilo
+            self._start_instrumentation()
+            self.video_thread = threading.Thread(target=self.process_video,
+                                                 args=(self._frame_skip_options(), self.track_var.get(), self._annotator(),
+                                                       self._encoder_options(), self.instrumentation,
+                                                       self._predict_args(), self._roi_options()),
+                                                 daemon=True)
             self.video_thread.start()
+            self._preview_tick()
         else:
             self.process_image()
             self.btn_process.config(state=tk.NORMAL) # Para imagen, se reactiva aquí
             self.btn_load.config(state=tk.NORMAL)
+            self.btn_live.config(state=tk.NORMAL)
 
     def process_image(self):
         try:
-            results = self.model.predict(source=self.filepath, verbose=False)
-            annotated_frame = results[0].plot()
-            self.display_image_preview(annotated_frame, is_processed_frame=True)
-            for result in results:
-                for box in result.boxes:
-                    class_id = int(box.cls[0])
-                    class_name = self.model.names[class_id]
-                    self.detected_classes_set.add(class_name)
+            annotated_frame, boxes, from_cache = detect_image(self.model, self.filepath, cache=self.detection_cache,
+                                                             tiling=self._tiling_options(), annotator=self._annotator(),
+                                                             predict_args=self._predict_args(), roi=self._roi_options())
+            if annotated_frame is not None:
+                self.display_image_preview(annotated_frame, is_processed_frame=True)
+            self.detected_class_counts = counts_by_name(class_counts(boxes), self.model.names)
+            self.detected_classes_set.update(self.detected_class_counts)
             self.update_class_list()
-            self.lbl_status.config(text="Estado: Imagen procesada.")
+            self.lbl_status.config(text="Estado: Imagen procesada (desde caché)." if from_cache else "Estado: Imagen procesada.")
         except Exception as e:
             messagebox.showerror("Error de Procesamiento", f"Ocurrió un error al procesar la imagen: {e}")
             self.lbl_status.config(text="Error: Fallo en procesamiento.")
@@ -256,107 +589,438 @@ class YOLOApp:
             pass
 
 
-    def process_video(self):
-        try:
-            self.cap = cv2.VideoCapture(self.filepath)
-            if not self.cap.isOpened():
-                self.root.after(0, lambda: messagebox.showerror("Error", "No se pudo abrir el archivo de video."))
-                self.root.after(0, self._finalize_video_processing)
-                return
-
-            # Obtener propiedades del video para el VideoWriter
-            frame_width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-            frame_height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-            self.original_video_fps = self.cap.get(cv2.CAP_PROP_FPS)
-            if self.original_video_fps <= 0: self.original_video_fps = 30 # Fallback
-
-            # Configurar VideoWriter
-            # Usar un codec común como 'mp4v' para .mp4 o 'XVID' para .avi
-            fourcc = cv2.VideoWriter_fourcc(*'mp4v') # O 'XVID' si guardas como .avi
-            self.processed_video_path = PROCESSED_VIDEO_FILENAME
-            self.video_writer = cv2.VideoWriter(self.processed_video_path, fourcc, self.original_video_fps, (frame_width, frame_height))
-            
-            if not self.video_writer.isOpened():
-                self.root.after(0, lambda: messagebox.showerror("Error", f"No se pudo crear el archivo de video de salida: {self.processed_video_path}"))
-                self.root.after(0, self._finalize_video_processing)
-                return
-
-            print(f"Guardando video procesado en: {self.processed_video_path} con FPS: {self.original_video_fps}")
-
-            total_frames = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
-            processed_frames = 0
+    def _annotator(self):
+        return Annotator(self.model.names, self.annotation_var.get())
 
-            while self.cap.isOpened() and self.video_processing_active:
-                ret, frame = self.cap.read()
-                if not ret:
-                    break
+    def _encoder_options(self):
+        return dict(PREVIEW_ENCODER_OPTIONS) if self.preview_output_var.get() else None
 
-                results = self.model.predict(source=frame, verbose=False, stream=False)
-                annotated_frame = results[0].plot()
-
-                # Escribir frame anotado en el archivo de video de salida
-                if self.video_writer:
-                    self.video_writer.write(annotated_frame)
-
-                current_frame_classes = set()
-                for result in results:
-                    for box in result.boxes:
-                        class_id = int(box.cls[0])
-                        class_name = self.model.names[class_id]
-                        current_frame_classes.add(class_name)
+    def _start_instrumentation(self):
+        """Activa la instrumentación (y el perfilado del hilo de la GUI) según las casillas. Hilo de la GUI."""
+        profile = self.profile_var.get()
+        if self.perf_panel_var.get() or profile:
+            self.instrumentation = Instrumentation(profile=profile)
+        else:
+            self.instrumentation = NULL_INSTRUMENTATION
+        self.lbl_perf.config(text="")
+        if profile:
+            self.profile_stack = contextlib.ExitStack()
+            self.profile_stack.enter_context(self.instrumentation.profile("gui"))
+
+    def _stop_instrumentation(self):
+        """Muestra las últimas métricas y guarda el perfil si se pidió. Devuelve la ruta del .prof o None."""
+        self._update_perf_panel()
+        if self.profile_stack is not None:
+            self.profile_stack.close()
+            self.profile_stack = None
+        path = None
+        if self.profile_var.get():
+            path = self.instrumentation.dump_profile(unique_output_path(PROFILE_DIR, "perfil", ".prof"))
+            if path:
+                print(f"Perfil de cProfile guardado en: {path} (ver con: python -m pstats {path})")
+        self.instrumentation = NULL_INSTRUMENTATION
+        return path
+
+    def _update_perf_panel(self):
+        if self.instrumentation.enabled and self.perf_panel_var.get():
+            self.lbl_perf.config(text=self.instrumentation.summary())
+
+    def _predict_args(self):
+        """Argumentos extra de model.predict elegidos en la GUI (tamaño de inferencia), o None."""
+        size = self.imgsz_var.get()
+        return {"imgsz": int(size)} if size.isdigit() else None
+
+    def _roi_options(self):
+        """Región de interés para el pipeline/detect_image/WorkerPool, o None si se usa el frame completo."""
+        if self.roi_box is None:
+            return None
+        return {"box": self.roi_box, "crop_output": self.roi_output_var.get()}
+
+    # --- Región de interés ---
+    def start_roi_selection(self):
+        """Muestra el archivo cargado (o un frame de la fuente en vivo) y espera a que se arrastre un rectángulo sobre él."""
+        if not (self.filepath or self.live_source) or self.video_processing_active or self.worker_pool:
+            messagebox.showwarning("Advertencia", "Carga una imagen, un video o una fuente en vivo (y espera a que termine "
+                                                  "el procesamiento) para dibujar el ROI.")
+            return
+        if self.is_replaying:
+            self.stop_replay()
+        if self.live_source:
+            # Abrir una cámara o un flujo puede tardar: el frame se captura fuera del hilo de la GUI
+            self.btn_roi.config(state=tk.DISABLED)
+            self.lbl_status.config(text="Estado: Capturando un frame de la fuente en vivo para el ROI...")
+            threading.Thread(target=self._grab_live_roi_frame, args=(self.live_source,), name="roi-grab", daemon=True).start()
+            return
+        if self.is_video:
+            cap = cv2.VideoCapture(self.filepath)
+            ret, frame = cap.read()
+            cap.release()
+            if not ret:
+                messagebox.showerror("Error", "No se pudo leer el primer frame del video.")
+                return
+            source_width = frame.shape[1]
+        else:
+            frame, scale = read_overview(self.filepath, max(self.display_size))
+            source_width = frame.shape[1] / scale
+        self._begin_roi_selection(frame, source_width)
 
-                self.root.after(0, self.update_video_frame_display, annotated_frame, current_frame_classes)
-                processed_frames += 1
-                progress_text = f"Estado: Procesando video ({processed_frames}/{total_frames if total_frames > 0 else '?'})..."
-                self.root.after(0, self.lbl_status.config, {"text": progress_text})
-                # time.sleep(0.001) # Pequeña pausa opcional
+    def _grab_live_roi_frame(self, spec):
+        try:
+            frame = grab_frame(spec)
+            error = None if frame is not None else "La fuente en vivo no entregó ningún frame."
+        except (IOError, ValueError) as e:
+            frame, error = None, str(e)
+        self.root.after(0, self._on_live_roi_frame, spec, frame, error)
+
+    def _on_live_roi_frame(self, spec, frame, error):
+        self.btn_roi.config(state=tk.NORMAL)
+        if spec != self.live_source or self.video_processing_active:
+            return # Se cambió de fuente o se empezó a procesar mientras se capturaba
+        if error:
+            self.lbl_status.config(text="Estado: No se pudo capturar un frame para el ROI.")
+            messagebox.showerror("Error", error)
+            return
+        self._begin_roi_selection(frame, frame.shape[1])
+
+    def _begin_roi_selection(self, frame, source_width):
+        frame = self.fit_to_display(frame)
+        self.roi_preview = (frame, source_width / frame.shape[1])
+        self._show_roi_preview()
+        self.lbl_image_display.config(cursor="crosshair")
+        self.lbl_image_display.bind("<ButtonPress-1>", self._on_roi_press)
+        self.lbl_image_display.bind("<B1-Motion>", self._on_roi_drag)
+        self.lbl_image_display.bind("<ButtonRelease-1>", self._on_roi_release)
+        self.lbl_status.config(text="Estado: Arrastra sobre la imagen para marcar la región de interés.")
+
+    def clear_roi(self):
+        self._set_roi(None)
+        if self.filepath and not self.video_processing_active:
+            if self.is_video:
+                self.display_video_preview_frame(self.filepath)
+            else:
+                self.display_image_preview(self.filepath)
 
-            self.cap.release()
-            if self.video_writer:
-                self.video_writer.release()
-                self.video_writer = None # Importante para evitar errores al cerrar
-                print("Video procesado guardado.")
+    def _set_roi(self, box):
+        self.roi_box = box
+        self.btn_clear_roi.config(state=tk.NORMAL if box else tk.DISABLED)
+        if box is None:
+            self.lbl_roi.config(text="ROI: imagen completa")
+        else:
+            x1, y1, x2, y2 = box
+            self.lbl_roi.config(text=f"ROI: ({x1}, {y1}) - ({x2}, {y2}), {x2 - x1}x{y2 - y1}")
+
+    def _roi_point(self, event):
+        """Posición del ratón en píxeles del frame reducido (la imagen está centrada en la etiqueta)."""
+        frame = self.roi_preview[0]
+        height, width = frame.shape[:2]
+        x = event.x - (self.lbl_image_display.winfo_width() - width) / 2
+        y = event.y - (self.lbl_image_display.winfo_height() - height) / 2
+        return min(max(x, 0), width), min(max(y, 0), height)
+
+    def _show_roi_preview(self, rect=None):
+        frame = self.roi_preview[0].copy()
+        if rect is not None:
+            (x1, y1), (x2, y2) = rect
+            cv2.rectangle(frame, (int(x1), int(y1)), (int(x2), int(y2)), ROI_COLOR, 2)
+        self.display_image_preview(frame, is_processed_frame=True)
+
+    def _on_roi_press(self, event):
+        self.roi_drag_start = self._roi_point(event)
+
+    def _on_roi_drag(self, event):
+        if self.roi_drag_start is not None:
+            self._show_roi_preview((self.roi_drag_start, self._roi_point(event)))
+
+    def _on_roi_release(self, event):
+        start, end = self.roi_drag_start, self._roi_point(event)
+        self._end_roi_selection()
+        if start is None:
+            return
+        factor = self.roi_preview[1]
+        box = tuple(int(round(v * factor)) for v in (min(start[0], end[0]), min(start[1], end[1]),
+                                                     max(start[0], end[0]), max(start[1], end[1])))
+        if box[2] - box[0] < 2 or box[3] - box[1] < 2:
+            self.lbl_status.config(text="Estado: ROI demasiado pequeño; se usa la imagen completa.")
+            self._set_roi(None)
+            self._show_roi_preview()
+            return
+        self._set_roi(box)
+        self._show_roi_preview((start, end))
+        self.lbl_status.config(text="Estado: ROI definido; solo se detectará dentro de la región.")
+
+    def _end_roi_selection(self):
+        self.roi_drag_start = None
+        for sequence in ("<ButtonPress-1>", "<B1-Motion>", "<ButtonRelease-1>"):
+            self.lbl_image_display.unbind(sequence)
+        self.lbl_image_display.config(cursor="")
+
+    def _tiling_options(self):
+        """Opciones de teselado para detect_image/WorkerPool, o None si está desactivado."""
+        return {} if self.tiling_var.get() else None
+
+    def _frame_skip_options(self):
+        """Opciones de salto de frames para el pipeline, o None si se detectan todos los frames."""
+        try:
+            stride = min(max(1, int(self.stride_var.get())), MAX_FRAME_STRIDE)
+        except (tk.TclError, ValueError):
+            stride = 1
+        if stride == 1:
+            return None
+        return {"stride": stride,
+                "motion_threshold": DEFAULT_MOTION_THRESHOLD if self.adaptive_skip_var.get() else None,
+                "audit_interval": FRAME_SKIP_AUDIT_INTERVAL}
+
+    def process_video(self, frame_skip=None, track=False, annotator=None, encoder_options=None, instrumentation=None,
+                      predict_args=None, roi=None):
+        try:
+            stem = os.path.splitext(os.path.basename(self.filepath))[0]
+            self.processed_video_path = unique_output_path(PROCESSED_VIDEO_DIR, f"{stem}_procesado")
+            self.detection_store = DetectionStore(store_dir_for(self.processed_video_path), names=self.model.names)
+            self.pipeline = VideoPipeline(self.model, self.filepath, self.processed_video_path,
+                                          batch_size=BATCH_SIZE, on_frame=self._on_pipeline_frame,
+                                          cache=self.detection_cache, store=self.detection_store,
+                                          frame_skip=frame_skip, tracker=CellTracker() if track else None,
+                                          annotator=annotator, encoder_options=encoder_options,
+                                          instrumentation=instrumentation, predict_args=predict_args, roi=roi)
+            try:
+                self.pipeline.open()
+            except IOError as e:
+                self.root.after(0, lambda e=e: messagebox.showerror("Error", str(e)))
+                return
 
+            self.original_video_fps = self.pipeline.fps
+            if self.pipeline.encoder is not None:
+                encoder = self.pipeline.encoder
+                print(f"Guardando video procesado en: {self.processed_video_path} ({encoder.backend}, "
+                      f"{encoder.output_size[0]}x{encoder.output_size[1]} a {encoder.fps:.3g} FPS)")
+            if self.pipeline.cache_hit:
+                print("Detecciones encontradas en caché: se omite la inferencia y solo se redibuja.")
+
+            # Decodificación, inferencia por lotes, anotado y codificación corren en hilos separados
+            try:
+                self.pipeline.run()
+            finally:
+                self.detection_store.close()
+            if self.video_processing_active:
+                print(f"Video procesado guardado. {len(self.detection_store)} detecciones en '{self.detection_store.directory}'.")
 
         except Exception as e:
             self.root.after(0, lambda e=e: messagebox.showerror("Error de Procesamiento", f"Ocurrió un error durante el procesamiento del video: {e}"))
-            if self.video_writer and self.video_writer.isOpened():
-                self.video_writer.release() # Asegurarse de liberar si hay error
-                self.video_writer = None
         finally:
             self.root.after(0, self._finalize_video_processing)
 
-    def update_video_frame_display(self, annotated_frame, frame_classes):
+    def process_live(self, spec, track=False, annotator=None, encoder_options=None, instrumentation=None,
+                     predict_args=None, roi=None):
+        """Analiza una fuente en vivo hasta que se detiene (botón o fin de la fuente). Corre en su propio hilo."""
+        try:
+            source = open_source(spec)
+            store_dir = unique_output_path(DEFAULT_STREAM_OUTPUT_DIR, f"{source.name}_detecciones", ext="")
+            self.detection_store = DetectionStore(store_dir, names=self.model.names)
+            pipeline = self.pipeline = StreamPipeline(self.model, source, DEFAULT_STREAM_OUTPUT_DIR,
+                                                      on_frame=self._on_pipeline_frame, store=self.detection_store,
+                                                      tracker=CellTracker() if track else None, annotator=annotator,
+                                                      encoder_options=encoder_options, instrumentation=instrumentation,
+                                                      predict_args=predict_args, roi=roi)
+            try:
+                pipeline.open()
+            except IOError as e:
+                self.root.after(0, lambda e=e: messagebox.showerror("Error", str(e)))
+                return
+            self.original_video_fps = pipeline.fps
+            print(f"Analizando en vivo '{spec}'; segmentos y detecciones en '{DEFAULT_STREAM_OUTPUT_DIR}'.")
+            try:
+                pipeline.run()
+            finally:
+                self.detection_store.close()
+            if pipeline.segments:
+                self.processed_video_path = pipeline.segments[-1] # El último segmento se puede reproducir
+        except Exception as e:
+            self.root.after(0, lambda e=e: messagebox.showerror("Error de Procesamiento", f"Ocurrió un error durante la captura en vivo: {e}"))
+        finally:
+            self.root.after(0, self._finalize_video_processing)
+
+    def _on_pipeline_frame(self, frame_idx, annotated_frame, boxes):
+        """Llamado desde el hilo de anotado del pipeline por cada frame, en orden.
+
+        annotated_frame es un buffer del pool del pipeline que se reutiliza al volver: para la
+        vista previa se publica una copia ya reducida al tamaño del panel.
+        """
+        if not self.video_processing_active:
+            self.pipeline.stop()
+            return
+
+        # No se encola nada en Tk: la GUI recoge el último frame con _preview_tick a PREVIEW_HZ
+        counts = class_counts(boxes, len(self.class_counts))
+        if len(counts) > len(self.class_counts): # class_id fuera de model.names
+            counts[:len(self.class_counts)] += self.class_counts
+            self.class_counts = counts
+        else:
+            self.class_counts += counts
+        self.frames_done = frame_idx + 1
+        if self.preview_limiter.ready() or self.frames_done == self.pipeline.total_frames:
+            preview = self.fit_to_display(annotated_frame)
+            self.preview_mailbox.post(preview.copy() if preview is annotated_frame else preview)
+
+    def _preview_tick(self):
+        """Temporizador de la GUI durante el procesamiento: muestra el último frame y el progreso."""
         if not self.video_processing_active:
             return
-        self.display_image_preview(annotated_frame, is_processed_frame=True)
-        new_classes_found = False
-        for cls_name in frame_classes:
-            if cls_name not in self.detected_classes_set:
-                self.detected_classes_set.add(cls_name)
-                new_classes_found = True
-        if new_classes_found:
+        self._refresh_processing_view()
+        self.root.after(int(1000 / PREVIEW_HZ), self._preview_tick)
+
+    def _refresh_processing_view(self):
+        annotated_frame = self.preview_mailbox.take()
+        if annotated_frame is not None:
+            self.display_image_preview(annotated_frame, is_processed_frame=True)
+
+        counts = counts_by_name(self.class_counts.copy(), self.model.names)
+        list_changed = not set(counts) <= self.detected_classes_set # Clase nueva: mostrarla ya
+        self.detected_class_counts = counts
+        self.detected_classes_set.update(counts)
+
+        if self.video_processing_active and self.pipeline and self.progress_limiter.ready():
+            total_frames = self.pipeline.total_frames
+            progress_text = f"Estado: Procesando video ({self.frames_done}/{total_frames if total_frames > 0 else '?'})..."
+            if isinstance(self.pipeline, StreamPipeline):
+                progress_text = f"Estado: En vivo. {self.pipeline.summary()}."
+            self._update_perf_panel()
+            self.lbl_status.config(text=progress_text)
+            list_changed = True # Los recuentos se refrescan al ritmo de la etiqueta de progreso
+        if list_changed:
             self.update_class_list()
 
+    def start_batch_processing(self):
+        """Reparte los archivos seleccionados entre procesos trabajadores (uno por núcleo)."""
+        try:
+            self.worker_pool = WorkerPool(MODEL_NAME, BATCH_OUTPUT_DIR, batch_size=BATCH_SIZE,
+                                          tiling=self._tiling_options(), frame_skip=self._frame_skip_options(),
+                                          track=self.track_var.get(), annotation=self.annotation_var.get(),
+                                          encoder_options=self._encoder_options(),
+                                          model_options=self.model.backend_options,
+                                          predict_args=self._predict_args(), roi=self._roi_options())
+        except Exception as e:
+            messagebox.showerror("Error de Procesamiento", f"No se pudo iniciar el pool de procesos: {e}")
+            self._finalize_batch_processing()
+            return
+        self.batch_progress = {}
+        self.batch_finished = 0
+        self.batch_failed = 0
+        self.batch_total = len(self.filepaths)
+        for path in self.filepaths:
+            self.worker_pool.submit(path)
+        print(f"Procesando {self.batch_total} archivos con {self.worker_pool.workers} procesos en '{BATCH_OUTPUT_DIR}'.")
+        self.lbl_status.config(text=f"Estado: Procesando lote (0/{self.batch_total})...")
+        self.root.after(100, self._poll_batch_progress)
+
+    def _poll_batch_progress(self):
+        if not self.worker_pool:
+            return
+        for event in self.worker_pool.poll():
+            kind, path = event[0], event[1]
+            if kind == "progress":
+                self.batch_progress[path] = (event[2], event[3])
+            elif kind == "done":
+                summary = event[2]
+                self.batch_progress.pop(path, None)
+                self.batch_finished += 1
+                self.detected_classes_set.update(summary["classes"])
+                self.update_class_list()
+                if summary["output"] and summary["output"].endswith(".mp4"):
+                    self.processed_video_path = summary["output"]
+            elif kind == "error":
+                self.batch_progress.pop(path, None)
+                self.batch_finished += 1
+                self.batch_failed += 1
+                print(f"Error procesando {path}: {event[2]}")
+
+        if self.batch_finished >= self.batch_total and not self.worker_pool.pending:
+            self._finalize_batch_processing()
+            return
+
+        progress_text = f"Estado: Procesando lote ({self.batch_finished}/{self.batch_total})..."
+        for path, (done, total) in self.batch_progress.items():
+            progress_text += f"\n{os.path.basename(path)}: {done}/{total if total > 0 else '?'}"
+        self.lbl_status.config(text=progress_text)
+        self.root.after(100, self._poll_batch_progress)
+
+    def _finalize_batch_processing(self):
+        if self.worker_pool:
+            self.worker_pool.shutdown()
+            self.worker_pool = None
+        self.lbl_status.config(text=f"Estado: Lote procesado ({self.batch_finished - self.batch_failed} ok, "
+                                    f"{self.batch_failed} con error) en '{BATCH_OUTPUT_DIR}'.")
+        self.btn_process.config(state=tk.NORMAL)
+        self.btn_load.config(state=tk.NORMAL)
+        self.btn_live.config(state=tk.NORMAL)
+        if self.processed_video_path and os.path.exists(self.processed_video_path):
+            self.btn_play_processed.config(state=tk.NORMAL)
+        self.update_class_list()
+        print("Procesamiento del lote finalizado.")
+
     def _finalize_video_processing(self):
         self.video_processing_active = False
-        if self.cap and self.cap.isOpened():
-            self.cap.release()
-        self.cap = None
-        if self.video_writer and self.video_writer.isOpened(): # Por si acaso no se liberó
-             self.video_writer.release()
-             self.video_writer = None
-
-        self.lbl_status.config(text="Estado: Video procesado (o detenido).")
+        skip_stats = None
+        live_summary = None
+        self.btn_stop_live.config(state=tk.DISABLED)
+        if self.pipeline: # Por si acaso no se liberó
+            self.pipeline.stop()
+            self.pipeline.join()
+            if isinstance(self.pipeline, StreamPipeline):
+                live_summary = self.pipeline.summary()
+            elif not self.pipeline.cache_hit:
+                skip_stats = self.pipeline.skip_stats
+            self.pipeline = None
+        self._refresh_processing_view() # Mostrar el último frame y las últimas clases
+        profile_path = self._stop_instrumentation()
+        print(f"Vista previa: {self.preview_mailbox.posted - self.preview_mailbox.dropped} frames mostrados, "
+              f"{self.preview_mailbox.dropped} descartados. Render: {self.render_timer.summary()}.")
+
+        status = "Estado: Video procesado (o detenido)."
+        if skip_stats is not None and skip_stats.frames:
+            status = f"Estado: Video procesado. {skip_stats.summary()}."
+        if live_summary is not None:
+            status = f"Estado: Captura detenida. {live_summary}."
+        if self.detection_store and self.detection_store.readonly and self.detection_store.has_tracks:
+            status += f" {self.detection_store.num_tracks()} células distintas."
+        if profile_path:
+            status += f" Perfil en {profile_path}."
+        self.lbl_status.config(text=status)
         self.btn_process.config(state=tk.NORMAL)
         self.btn_load.config(state=tk.NORMAL)
+        self.btn_live.config(state=tk.NORMAL)
         if self.processed_video_path and os.path.exists(self.processed_video_path):
              self.btn_play_processed.config(state=tk.NORMAL)
         else:
              self.btn_play_processed.config(state=tk.DISABLED)
+        if self.detection_store and self.detection_store.readonly:
+            self.btn_export.config(state=tk.NORMAL)
         self.update_class_list()
         print("Procesamiento de video finalizado.")
 
+    def export_detections(self):
+        if not self.detection_store:
+            messagebox.showinfo("Información", "No hay detecciones para exportar.")
+            return
+        path = filedialog.asksaveasfilename(
+            title="Exportar detecciones",
+            defaultextension=".csv",
+            initialfile=os.path.basename(self.detection_store.directory),
+            filetypes=(("CSV", "*.csv"), ("Parquet", "*.parquet"), ("NumPy comprimido", "*.npz"))
+        )
+        if not path:
+            return
+        try:
+            self.detection_store.export(path)
+            status = f"Estado: {len(self.detection_store)} detecciones exportadas."
+            if self.detection_store.has_tracks:
+                tracks_path = os.path.splitext(path)[0] + "_trayectorias.csv"
+                stats = track_statistics(self.detection_store, self.original_video_fps)
+                save_track_statistics(stats, tracks_path, self.detection_store.names)
+                status += f" {len(stats['track_id'])} trayectorias en {os.path.basename(tracks_path)}."
+            self.lbl_status.config(text=status)
+        except Exception as e:
+            messagebox.showerror("Error de Exportación", f"No se pudieron exportar las detecciones: {e}")
+
 
     def start_replay_processed_video(self):
         if not self.processed_video_path or not os.path.exists(self.processed_video_path):
@@ -370,20 +1034,38 @@ class YOLOApp:
             return
 
         try:
-            self.replay_cap = cv2.VideoCapture(self.processed_video_path)
-            if not self.replay_cap.isOpened():
+            cap = cv2.VideoCapture(self.processed_video_path)
+            if not cap.isOpened():
                 messagebox.showerror("Error", f"No se pudo abrir el video procesado: {self.processed_video_path}")
-                self.replay_cap = None
                 return
 
             # Obtener propiedades del video
-            replay_fps = self.replay_cap.get(cv2.CAP_PROP_FPS)
+            replay_fps = cap.get(cv2.CAP_PROP_FPS)
             if replay_fps <= 0 : replay_fps = self.original_video_fps
             if replay_fps <= 0 : replay_fps = 30
+            self.total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+            cap.release()
 
-            self.total_frames = int(self.replay_cap.get(cv2.CAP_PROP_FRAME_COUNT))
+            self.replay_fps = replay_fps
             self.current_frame_pos = 0
-            self.frame_delay_ms = int(1000 / replay_fps)
+            self.pending_replay_pos = None
+            self.replay_held_item = None
+            self.replay_dropped = 0
+
+            # Decodificación por adelantado en otro hilo; el reloj decide qué frame toca en cada momento
+            self._start_instrumentation()
+            self.instrumentation.reset(self.total_frames)
+            self.replay_prefetcher = FramePrefetcher(self.processed_video_path, transform=self.fit_to_display,
+                                                     instrumentation=self.instrumentation)
+            self.instrumentation.gauge("prefetch", lambda: self.replay_prefetcher.pending if self.replay_prefetcher else 0)
+            self.replay_clock = ReplayClock(replay_fps, speed=self._selected_speed())
+
+            # Scrubbing: decodificador propio con caché; el índice de keyframes se construye en segundo plano
+            self.frame_seeker = FrameSeeker(self.processed_video_path, self._cached_keyframe_index(replay_fps),
+                                            transform=self.fit_to_display)
+            if not self.frame_seeker.index.has_keyframes:
+                threading.Thread(target=self._build_keyframe_index, args=(self.processed_video_path, replay_fps),
+                                 name="keyframe-index", daemon=True).start()
             
             # Configurar timeline
             self.timeline_var.set(0)
@@ -394,9 +1076,11 @@ class YOLOApp:
             self.lbl_total_time.config(text=self.format_time(total_seconds))
             self.lbl_current_time.config(text="00:00")
             
+            self.render_timer.reset()
             self.is_replaying = True
             self.is_paused = False
             self.btn_load.config(state=tk.DISABLED)
+            self.btn_live.config(state=tk.DISABLED)
             self.btn_process.config(state=tk.DISABLED)
             self.btn_play_processed.config(text="Detener Video")
             self.btn_play_pause.config(text="⏸️")
@@ -412,23 +1096,71 @@ class YOLOApp:
             self.stop_replay()
 
     def replay_frame(self):
-        if not self.is_replaying or not self.replay_cap or not self.replay_cap.isOpened():
+        """Muestra el frame que toca según el reloj y se reprograma para el siguiente plazo.
+
+        Si la reproducción va retrasada, los frames ya vencidos se descartan y el prefetcher salta
+        directamente al que toca. En pausa no se reprograma: toggle_play_pause la reanuda.
+        """
+        self.replay_job = None
+        if not self.is_replaying or not self.replay_prefetcher:
             self.stop_replay()
             return
+        if self.is_paused:
+            return
 
-        if not self.is_paused:
-            ret, frame = self.replay_cap.read()
-            if ret:
-                self.current_frame_pos = int(self.replay_cap.get(cv2.CAP_PROP_POS_FRAMES))
-                self.display_image_preview(frame, is_processed_frame=True)
-                self.update_timeline()
-                self.root.after(self.frame_delay_ms, self.replay_frame)
-            else: # Fin del video
-                self.stop_replay()
-                self.lbl_status.config(text="Estado: Reproducción finalizada.")
+        if self.pending_replay_pos is not None: # Un único salto tras mover la timeline
+            self._seek_replay(self.pending_replay_pos)
+            self.pending_replay_pos = None
+
+        due = self.replay_clock.frame_due()
+        self.replay_prefetcher.min_frame = max(self.replay_prefetcher.min_frame, due)
+        item = self.replay_held_item or self.replay_prefetcher.get()
+        self.replay_held_item = None
+        # Descartar frames vencidos mientras haya uno más reciente disponible
+        while item and item[0] < due:
+            newer = self.replay_prefetcher.get()
+            if newer is False:
+                break
+            self.replay_dropped += 1
+            item = newer
+
+        if item is END_OF_VIDEO: # Fin del video
+            self.stop_replay()
+            self.lbl_status.config(text="Estado: Reproducción finalizada.")
+            return
+        if item is False: # El decodificador aún no tiene el frame: reintentar enseguida
+            self.replay_job = self.root.after(5, self.replay_frame)
+            return
+
+        frame_idx, frame = item
+        if frame_idx > due: # Llegó antes de tiempo: guardarlo hasta su plazo
+            self.replay_held_item = item
+            next_frame = frame_idx
         else:
-            # Si está pausado, seguir verificando pero no avanzar frames
-            self.root.after(100, self.replay_frame)
+            self.current_frame_pos = frame_idx
+            self.display_image_preview(frame, is_processed_frame=True)
+            self.update_timeline()
+            self.instrumentation.tick()
+            if self.progress_limiter.ready():
+                self._update_perf_panel()
+            next_frame = frame_idx + 1
+        delay_ms = max(1, int(self.replay_clock.seconds_until(next_frame) * 1000))
+        self.replay_job = self.root.after(delay_ms, self.replay_frame)
+
+    def _seek_replay(self, frame_pos):
+        self.replay_held_item = None
+        self.replay_prefetcher.seek(frame_pos)
+        self.replay_clock.rebase(frame_pos)
+
+    def _selected_speed(self):
+        try:
+            return float(self.speed_var.get().rstrip("×x"))
+        except ValueError:
+            return 1.0
+
+    def on_speed_change(self, event=None):
+        if self.is_replaying and self.replay_clock:
+            self.replay_clock.set_speed(self._selected_speed(), self.current_frame_pos + 1)
 
     def toggle_play_pause(self):
         if not self.is_replaying:
@@ -436,33 +1168,67 @@ class YOLOApp:
             
         self.is_paused = not self.is_paused
         if self.is_paused:
+            if self.replay_job:
+                self.root.after_cancel(self.replay_job)
+                self.replay_job = None
+            self.replay_prefetcher.pause()
             self.btn_play_pause.config(text="▶️")
             self.lbl_status.config(text="Estado: Video pausado.")
         else:
+            self.replay_prefetcher.resume()
+            self.replay_clock.rebase(self.pending_replay_pos if self.pending_replay_pos is not None else self.current_frame_pos + 1)
             self.btn_play_pause.config(text="⏸️")
             self.lbl_status.config(text="Estado: Reproduciendo video...")
+            self.replay_frame()
 
     def on_timeline_change(self, value):
-        if not self.is_replaying or not self.replay_cap or self.timeline_updating:
+        if not self.is_replaying or not self.replay_prefetcher or self.timeline_updating:
             return
             
         try:
             frame_pos = int(float(value))
-            self.replay_cap.set(cv2.CAP_PROP_POS_FRAMES, frame_pos)
             self.current_frame_pos = frame_pos
-            
-            # Leer y mostrar el frame en la nueva posición
-            ret, frame = self.replay_cap.read()
-            if ret:
-                self.display_image_preview(frame, is_processed_frame=True)
-                # Retroceder un frame para que la reproducción continúe desde la posición correcta
-                self.replay_cap.set(cv2.CAP_PROP_POS_FRAMES, frame_pos)
-            
+            self.pending_replay_pos = frame_pos # La reproducción continuará desde aquí
+            # Los eventos del slider se agrupan: el seeker solo decodifica la última posición pedida
+            if self.frame_seeker:
+                self.frame_seeker.request(frame_pos)
+                if not self.seek_poll_scheduled:
+                    self.seek_poll_scheduled = True
+                    self.root.after(10, self._poll_seek_result)
+
             self.update_time_display()
             
         except Exception as e:
             print(f"Error al cambiar posición del timeline: {e}")
 
+    def _poll_seek_result(self):
+        self.seek_poll_scheduled = False
+        if not self.is_replaying or not self.frame_seeker:
+            return
+        result = self.frame_seeker.poll()
+        if result is not None:
+            self.display_image_preview(result[1], is_processed_frame=True)
+        if self.frame_seeker.pending: # Todavía decodificando la última posición pedida
+            self.seek_poll_scheduled = True
+            self.root.after(15, self._poll_seek_result)
+
+    def _cached_keyframe_index(self, fps):
+        mtime = os.path.getmtime(self.processed_video_path)
+        cached = self.keyframe_indexes.get(self.processed_video_path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        return KeyframeIndex(fps=fps)
+
+    def _build_keyframe_index(self, path, fps):
+        mtime = os.path.getmtime(path)
+        index = KeyframeIndex.build(path, fps)
+        self.keyframe_indexes[path] = (mtime, index)
+        seeker = self.frame_seeker
+        if seeker and seeker.path == path:
+            seeker.index = index
+        if index.has_keyframes:
+            print(f"Índice de keyframes: {len(index.keyframes)} keyframes en {len(index.timestamps)} frames.")
+
     def update_timeline(self):
         if not self.is_replaying or self.timeline_updating:
             return
@@ -475,15 +1241,17 @@ class YOLOApp:
             self.timeline_updating = False
 
     def update_time_display(self):
-        if not self.is_replaying or not self.replay_cap:
+        if not self.is_replaying:
             return
             
         try:
-            fps = self.replay_cap.get(cv2.CAP_PROP_FPS)
+            fps = self.replay_fps
             if fps <= 0:
                 fps = self.original_video_fps if self.original_video_fps > 0 else 30
                 
             current_seconds = self.current_frame_pos / fps
+            if self.frame_seeker and len(self.frame_seeker.index.timestamps):
+                current_seconds = self.frame_seeker.index.time_of(self.current_frame_pos)
             self.lbl_current_time.config(text=self.format_time(current_seconds))
         except Exception as e:
             print(f"Error al actualizar tiempo: {e}")
@@ -495,14 +1263,26 @@ class YOLOApp:
         return f"{minutes:02d}:{seconds:02d}"
 
     def stop_replay(self):
+        if self.is_replaying:
+            print(f"Reproducción: {self.render_timer.summary()}. Frames descartados por retraso: "
+                  f"{self.replay_dropped + (self.replay_prefetcher.skipped if self.replay_prefetcher else 0)}.")
+            self._stop_instrumentation()
         self.is_replaying = False
         self.is_paused = False
-        if self.replay_cap:
-            self.replay_cap.release()
-            self.replay_cap = None
+        if self.replay_job:
+            self.root.after_cancel(self.replay_job)
+            self.replay_job = None
+        if self.replay_prefetcher:
+            self.replay_prefetcher.close()
+            self.replay_prefetcher = None
+        self.replay_held_item = None
+        if self.frame_seeker:
+            self.frame_seeker.close()
+            self.frame_seeker = None
         
         self.btn_load.config(state=tk.NORMAL)
-        self.btn_process.config(state=tk.NORMAL if self.filepath else tk.DISABLED)
+        self.btn_live.config(state=tk.NORMAL)
+        self.btn_process.config(state=self._process_button_state())
         self.btn_play_processed.config(text="Reproducir Video Procesado")
         self.btn_play_pause.config(text="▶️")
         
@@ -515,31 +1295,32 @@ class YOLOApp:
 
     def update_class_list(self):
         self.listbox_classes.delete(0, tk.END)
-        sorted_classes = sorted(list(self.detected_classes_set))
-        for cls_name in sorted_classes:
-            self.listbox_classes.insert(tk.END, cls_name)
+        for cls_name in sorted(self.detected_classes_set):
+            count = self.detected_class_counts.get(cls_name)
+            self.listbox_classes.insert(tk.END, f"{cls_name} ({count})" if count else cls_name)
 
     def on_closing(self):
         print("Cerrando aplicación...")
         if self.video_processing_active:
             self.video_processing_active = False
             print("Deteniendo procesamiento de video activo...")
-            # El hilo es daemon, se cerrará. Esperar un poco puede ser bueno.
-            # Si video_writer está activo, intentar cerrarlo podría ser problemático
-            # desde el hilo principal si el hilo de video aún lo usa.
-            # La bandera video_processing_active debería ser suficiente para que el hilo termine limpiamente.
+            # El pipeline libera el VideoCapture y el VideoWriter cuando sus hilos terminan.
+            if self.pipeline:
+                self.pipeline.stop() # El video de salida se cierra con los frames ya anotados
+
+        if self.worker_pool:
+            print("Cancelando procesamiento del lote...")
+            self.worker_pool.shutdown(cancel=True)
+            self.worker_pool = None
 
         if self.is_replaying:
             self.stop_replay()
             print("Deteniendo reproducción de video activa...")
 
         # Liberar recursos explícitamente
-        if self.cap and self.cap.isOpened():
-            self.cap.release()
-        if self.video_writer and self.video_writer.isOpened():
-            self.video_writer.release() # Importante
-        if self.replay_cap and self.replay_cap.isOpened():
-            self.replay_cap.release()
+        if self.replay_prefetcher:
+            self.replay_prefetcher.close()
+            self.replay_prefetcher = None
 
         # Opcional: eliminar el video procesado temporal al cerrar
         # if self.processed_video_path and os.path.exists(self.processed_video_path):
@@ -549,10 +1330,26 @@ class YOLOApp:
         #     except Exception as e:
         #         print(f"No se pudo eliminar '{self.processed_video_path}': {e}")
 
-        self.root.after(100, self.root.destroy) # Dar un pequeño margen para que los hilos finalicen
+        self.shutdown_deadline = time.monotonic() + SHUTDOWN_TIMEOUT_S
+        self._destroy_when_idle()
+
+    def _destroy_when_idle(self):
+        """Cierra la ventana cuando el hilo de procesamiento ha terminado de escribir la salida.
+
+        Se sondea con after() en vez de join(): el hilo termina llamando a root.after y el bucle
+        de Tk tiene que seguir vivo para atenderlo.
+        """
+        thread = self.video_thread
+        if thread is not None and thread.is_alive():
+            if time.monotonic() < self.shutdown_deadline:
+                self.root.after(SHUTDOWN_POLL_MS, self._destroy_when_idle)
+                return
+            print("El procesamiento no terminó a tiempo; el último video de salida puede quedar incompleto.")
+        self.root.destroy()
 
 
 if __name__ == "__main__":
+    log_startup_phase("imports de la GUI", time.perf_counter() - _STARTUP_T0)
     root = tk.Tk()
     app = YOLOApp(root)
     root.mainloop()
\ No newline at end of file
@@ -0,0 +1,468 @@
+import queue
+import threading
+import cv2
+import numpy as np
+from detection_cache import boxes_array
+from box_ops import clamp_roi, translate_boxes
+from annotator import Annotator
+from encoder import DEFAULT_ENCODER_QUEUE, VideoEncoder
+from frame_pool import DEFAULT_MEMORY_CEILING_MB, FramePool, plan_frame_pool
+from instrumentation import NULL_INSTRUMENTATION
+from frame_skip import DEFAULT_STRIDE, KeyframeSelector, SkipStats, frame_skip_enabled, interpolate_boxes, match_f1
+
+# --- Configuración del pipeline ---
+DEFAULT_BATCH_SIZE = 8 # Frames que se pasan juntos al modelo
+DEFAULT_QUEUE_SIZE = 32 # Capacidad de cada cola entre etapas (backpressure)
+
+_FIN = object() # Centinela que marca el final del flujo de frames
+_POOL_WAIT_S = 0.1 # Espera máxima por un buffer libre antes de volver a mirar si hay que parar
+
+
+class _PendingFrame:
+    """Frame retenido por la inferencia con salto hasta conocer la detección siguiente."""
+
+    def __init__(self, frame_idx, frame, is_key, audit):
+        self.frame_idx = frame_idx
+        self.frame = frame
+        self.is_key = is_key
+        self.audit = audit # Detectar también para medir el error de la interpolación
+        self.boxes = None # Detecciones del modelo, si se ejecutó sobre este frame
+
+
+class VideoPipeline:
+    """Procesa un video en etapas concurrentes: decodificación -> inferencia por lotes -> anotado -> codificación.
+
+    Cada etapa corre en su propio hilo y se comunica con la siguiente mediante una cola acotada,
+    de modo que una etapa rápida se bloquea cuando la siguiente no da abasto (backpressure).
+    Como cada etapa es un único hilo que consume en orden FIFO, el orden de los frames se preserva.
+
+    Si se pasa una DetectionCache y ya hay detecciones guardadas para este video, pesos y
+    parámetros, la etapa de inferencia no ejecuta el modelo: solo se vuelve a dibujar y codificar.
+    Si se pasa un DetectionStore, todas las detecciones de cada frame se añaden a él en orden.
+
+    frame_skip (dict con stride, motion_threshold y audit_interval, ver frame_skip.py) hace que
+    solo los frames clave pasen por el modelo; el resto reciben cajas interpoladas.
+    Con un CellTracker, cada detección recibe un track_id (guardado en el store y dibujado).
+
+    Entre etapas viajan arrays de cajas (N, 6), no objetos Results: el anotado lo hace un
+    annotator.Annotator sobre el propio frame. Con estilo "none" no se anota ni se escribe
+    video; solo se guardan las detecciones.
+
+    La codificación corre en el hilo de un encoder.VideoEncoder con su propia cola, así que un
+    códec lento no frena el anotado ni la inferencia. encoder_options son sus argumentos (codec,
+    quality, preset, backend, scale, frame_step).
+
+    Con una instrumentation.Instrumentation se miden el tiempo por frame de cada etapa, los fps y
+    la ocupación de las colas; con profile=True cada hilo de etapa se perfila con cProfile.
+
+    roi (dict con box = (x1, y1, x2, y2) en píxeles del frame y crop_output) limita la inferencia
+    a esa región: el modelo recibe el recorte y las cajas se devuelven en coordenadas del frame
+    completo (store, caché, seguimiento y on_frame). Con crop_output se anota y codifica solo la
+    región, así que el video de salida tiene el tamaño del recorte.
+
+    Los frames se decodifican en un frame_pool.FramePool de buffers preasignados que se
+    reutilizan durante todo el video: cada buffer vuelve al pool cuando el anotado y el
+    codificador terminan con él. max_memory_mb acota la memoria de esos buffers; si la
+    decodificación se adelanta, espera a que se libere uno, y si el lote (con salto, batch_size
+    frames clave separados hasta stride frames) no cabe, se infieren lotes más pequeños. Por eso el frame que recibe on_frame
+    solo es válido durante la llamada: quien quiera conservarlo debe copiarlo.
+    """
+
+    def __init__(self, model, source_path, output_path, batch_size=DEFAULT_BATCH_SIZE,
+                 queue_size=DEFAULT_QUEUE_SIZE, on_frame=None, predict_args=None, cache=None, store=None,
+                 frame_skip=None, tracker=None, annotator=None, encoder_options=None, instrumentation=None, roi=None,
+                 max_memory_mb=DEFAULT_MEMORY_CEILING_MB):
+        self.model = model
+        self.source_path = source_path
+        self.output_path = output_path
+        self.batch_size = max(1, int(batch_size))
+        self.inference_batch_size = self.batch_size # batch_size recortado a lo que cabe en max_memory_mb (ver open())
+        self.queue_size = max(1, int(queue_size))
+        self.on_frame = on_frame # Callback(frame_idx, annotated_frame, boxes), se llama desde el hilo de anotado
+        self.predict_args = dict(predict_args or {}) # Argumentos extra de model.predict (conf, iou, imgsz...)
+        self.cache = cache
+        self.store = store
+        self.cache_key = None
+        self.cached_boxes = None # Detecciones por frame leídas de la caché (None si no hubo acierto)
+        self._cache_writer = None # detection_cache.CacheWriter: las detecciones de esta ejecución van a disco frame a frame
+        self.frame_skip = dict(frame_skip) if frame_skip_enabled(frame_skip) else None
+        self.skip_stats = SkipStats() if self.frame_skip else None
+        self.tracker = tracker # Se actualiza en el hilo de anotado, que recibe los frames en orden
+        self.annotator = annotator or Annotator(model.names)
+        self.encoder_options = dict(encoder_options or {})
+        self.instrumentation = instrumentation or NULL_INSTRUMENTATION
+        self.roi = dict(roi) if roi else None
+        self.roi_box = None # roi["box"] ajustado al frame; se calcula al conocer su tamaño
+        self.roi_output = bool(self.roi and self.roi.get("crop_output"))
+        self.max_memory_mb = max_memory_mb
+        self.frame_pool = None # Se crea en open() al conocer el tamaño del frame
+
+        self.cap = None
+        self.encoder = None
+        self.fps = 30
+        self.frame_size = (0, 0)
+        self.total_frames = 0
+        self.processed_frames = 0
+        self.error = None
+
+        self._stop_event = threading.Event()
+        self._threads = []
+        self._decoded_queue = queue.Queue(maxsize=self.queue_size)
+        self._inferred_queue = queue.Queue(maxsize=self.queue_size)
+
+    def open(self):
+        """Abre el video de entrada y el codificador de salida. Lanza IOError si alguno falla."""
+        self.cap = cv2.VideoCapture(self.source_path)
+        if not self.cap.isOpened():
+            self.cap.release()
+            self.cap = None
+            raise IOError("No se pudo abrir el archivo de video.")
+
+        frame_width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        frame_height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        self.frame_size = (frame_width, frame_height)
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS)
+        if self.fps <= 0: self.fps = 30 # Fallback
+        self.total_frames = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        output_size = self.frame_size
+        if self.roi is not None:
+            try:
+                self.roi_box = clamp_roi(self.roi["box"], frame_width, frame_height)
+            except ValueError:
+                self._release()
+                raise
+            if self.roi_output:
+                x1, y1, x2, y2 = self.roi_box
+                output_size = (x2 - x1, y2 - y1)
+
+        if frame_width > 0 and frame_height > 0:
+            try:
+                self.frame_pool = self._create_frame_pool((frame_height, frame_width, 3), 2 * self.queue_size)
+            except ValueError:
+                self._release()
+                raise
+
+        if self.annotator.enabled and self.output_path:
+            try:
+                self.encoder = VideoEncoder(self.output_path, self.fps, output_size, instrumentation=self.instrumentation,
+                                            frame_pool=self.frame_pool, **self.encoder_options)
+            except Exception:
+                self._release()
+                raise
+
+        if self.cache is not None:
+            params = dict(self.predict_args, frame_skip=self.frame_skip) if self.frame_skip else self.predict_args
+            if self.roi_box is not None:
+                params = dict(params, roi=list(self.roi_box))
+            self.cache_key = self.cache.key_for(self.source_path, self.model, params)
+            self.cached_boxes = self.cache.get(self.cache_key)
+            if not self.cache_hit:
+                self._cache_writer = self.cache.writer(self.cache_key)
+        self._register_gauges()
+
+    def _create_frame_pool(self, frame_shape, queued):
+        """Pool con los frames que pueden estar en vuelo a la vez, sin pasar de max_memory_mb.
+
+        Lo mínimo es lo que retiene la inferencia (el lote, o con salto los frames pendientes
+        de la siguiente detección) más los que están en decodificación y anotado; por debajo
+        la inferencia esperaría frames que la decodificación no puede leer. Si el lote no cabe
+        se reduce inference_batch_size (ver frame_pool.plan_frame_pool). Más allá de llenar
+        las colas entre etapas (queued frames) y la del codificador no se gana nada.
+        """
+        stride = int(self.frame_skip.get("stride", DEFAULT_STRIDE)) if self.frame_skip else 1
+        encoder_queue = int(self.encoder_options.get("queue_size", DEFAULT_ENCODER_QUEUE))
+        count, self.inference_batch_size = plan_frame_pool(frame_shape, self.max_memory_mb, self.batch_size, stride,
+                                                           queued + encoder_queue)
+        if self.inference_batch_size < self.batch_size:
+            print(f"[Memoria] Lotes de {self.inference_batch_size} en lugar de {self.batch_size} para no pasar de "
+                  f"{self.max_memory_mb:g} MB con frames de {frame_shape[1]}x{frame_shape[0]}.")
+        return FramePool(frame_shape, count)
+
+    def _register_gauges(self):
+        self.instrumentation.reset(self.total_frames)
+        self.instrumentation.gauge("decoded", self._decoded_queue.qsize)
+        self.instrumentation.gauge("inferred", self._inferred_queue.qsize)
+        if self.encoder is not None:
+            self.instrumentation.gauge("encoder", lambda: self.encoder.pending if self.encoder is not None else 0)
+        self.instrumentation.gauge("frame_pool", lambda: self.frame_pool.in_use if self.frame_pool is not None else 0)
+
+    def start(self):
+        if self.cap is None:
+            self.open()
+        self._threads = [
+            threading.Thread(target=self._run_stage, args=(self._decode_stage,), name="pipeline-decode", daemon=True),
+            threading.Thread(target=self._run_stage, args=(self._inference_stage,), name="pipeline-inference", daemon=True),
+            threading.Thread(target=self._run_stage, args=(self._annotate_stage,), name="pipeline-annotate", daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self):
+        """Pide a todas las etapas que terminen lo antes posible."""
+        self._stop_event.set()
+
+    def join(self, timeout=None):
+        for thread in self._threads:
+            thread.join(timeout)
+        if not any(thread.is_alive() for thread in self._threads):
+            self._release()
+
+    def close(self, timeout=None):
+        """Detiene el pipeline y espera a sus hilos; el video de salida se cierra con los frames ya anotados.
+
+        Devuelve False si algún hilo sigue vivo tras timeout (entonces no se libera nada).
+        """
+        self.stop()
+        if self.frame_pool is not None:
+            self.frame_pool.close() # Despierta a la decodificación si espera un buffer
+        self.join(timeout)
+        return not any(thread.is_alive() for thread in self._threads)
+
+    def run(self):
+        """Ejecuta el pipeline completo y bloquea hasta que termina. Relanza el primer error de cualquier etapa."""
+        self.start()
+        self.join()
+        if self.error is not None:
+            raise self.error
+        if self.skip_stats is not None and not self.cache_hit:
+            print(f"[Salto de frames] {self.skip_stats.summary()}")
+
+    @property
+    def stopped(self):
+        return self._stop_event.is_set()
+
+    @property
+    def cache_hit(self):
+        return self.cached_boxes is not None
+
+    # --- Etapas ---
+    def _run_stage(self, stage):
+        try:
+            with self.instrumentation.profile(threading.current_thread().name):
+                stage()
+        except Exception as e:
+            if self.error is None:
+                self.error = e
+            self.stop() # Un fallo en una etapa detiene a las demás
+
+    def _decode_stage(self):
+        frame_idx = 0
+        while not self._stop_event.is_set():
+            buffer = self._acquire_buffer()
+            if buffer is None and self.frame_pool is not None:
+                return # Se pidió parar mientras se esperaba un buffer libre
+            with self.instrumentation.stage("decode"):
+                ret, frame = self.cap.read(image=buffer) # Decodifica en el buffer del pool, sin asignar memoria
+            if buffer is not None and (not ret or frame is not buffer):
+                self.frame_pool.release(buffer) # Sin frame, o OpenCV reasignó (tamaño distinto al anunciado)
+            if not ret:
+                break
+            if not self._put(self._decoded_queue, (frame_idx, frame)):
+                return
+            frame_idx += 1
+        self._put(self._decoded_queue, _FIN)
+
+    def _inference_stage(self):
+        if self.frame_skip is not None and not self.cache_hit:
+            self._sparse_inference_stage()
+            return
+        finished = False
+        while not finished:
+            item = self._get(self._decoded_queue)
+            if item is _FIN:
+                break
+            batch = [item]
+            # Completar el lote; si el decodificador llega al final se procesa el lote parcial
+            while len(batch) < self.inference_batch_size:
+                item = self._get(self._decoded_queue)
+                if item is _FIN:
+                    finished = True
+                    break
+                batch.append(item)
+
+            if self.cache_hit:
+                frame_boxes = [self._cached_frame_boxes(frame_idx) for frame_idx, _ in batch]
+            else:
+                with self.instrumentation.stage("inference", len(batch)):
+                    frame_boxes = self._predict([frame for _, frame in batch])
+            for (frame_idx, frame), boxes in zip(batch, frame_boxes):
+                if not self._put(self._inferred_queue, (frame_idx, frame, boxes)):
+                    return
+        self._put(self._inferred_queue, _FIN)
+
+    def _sparse_inference_stage(self):
+        """Detecta solo en los frames clave (por lotes) e interpola las cajas de los intermedios.
+
+        Los frames posteriores a la última detección esperan a la siguiente, así que se retienen
+        como mucho unos inference_batch_size * stride frames.
+        """
+        selector = KeyframeSelector(self.frame_skip.get("stride", DEFAULT_STRIDE), self.frame_skip.get("motion_threshold"))
+        audit_interval = int(self.frame_skip.get("audit_interval") or 0)
+        pending = []
+        anchor = None # (frame_idx, cajas) de la última detección ya enviada
+        keys = 0
+        skipped = 0
+        while True:
+            item = self._get(self._decoded_queue)
+            if self._stop_event.is_set():
+                return
+            finished = item is _FIN
+            if not finished:
+                frame_idx, frame = item
+                is_key = selector.is_key(self._crop(frame)) # El movimiento que importa es el del ROI
+                audit = False
+                if not is_key:
+                    skipped += 1
+                    audit = audit_interval > 0 and skipped % audit_interval == 0
+                pending.append(_PendingFrame(frame_idx, frame, is_key, audit))
+                keys += is_key
+            elif pending and not pending[-1].is_key:
+                pending[-1].is_key = True # El último frame se detecta para poder interpolar hasta el final
+                keys += 1
+            if keys >= self.inference_batch_size or (finished and pending):
+                flushed = self._flush_sparse(pending, anchor)
+                if flushed is None:
+                    return
+                pending, anchor = flushed
+                keys = 0
+            if finished:
+                break
+        self._put(self._inferred_queue, _FIN)
+
+    def _flush_sparse(self, pending, anchor):
+        """Detecta los frames clave retenidos y envía todo hasta el último. Devuelve (retenidos, ancla) o None si se detuvo."""
+        to_detect = [p for p in pending if (p.is_key or p.audit) and p.boxes is None]
+        if to_detect:
+            with self.instrumentation.stage("inference", len(to_detect)):
+                for p, boxes in zip(to_detect, self._predict([p.frame for p in to_detect])):
+                    p.boxes = boxes
+            self.skip_stats.inferred += sum(p.is_key for p in to_detect)
+
+        last_key = max(i for i, p in enumerate(pending) if p.is_key)
+        gap_start = 0
+        for i in range(last_key + 1):
+            key = pending[i]
+            if not key.is_key:
+                continue
+            for p in pending[gap_start:i]:
+                anchor_idx, anchor_boxes = anchor
+                boxes = interpolate_boxes(anchor_boxes, key.boxes, (p.frame_idx - anchor_idx) / (key.frame_idx - anchor_idx))
+                if p.audit:
+                    self.skip_stats.audited += 1
+                    self.skip_stats.f1_total += match_f1(boxes, p.boxes)
+                if not self._put_sparse(p, boxes):
+                    return None
+            if not self._put_sparse(key, key.boxes):
+                return None
+            anchor = (key.frame_idx, key.boxes)
+            gap_start = i + 1
+        return pending[last_key + 1:], anchor
+
+    def _put_sparse(self, pending_frame, boxes):
+        self.skip_stats.frames += 1
+        return self._put(self._inferred_queue, (pending_frame.frame_idx, pending_frame.frame, boxes))
+
+    def _acquire_buffer(self):
+        """Buffer libre del pool (None si no hay pool o se pidió parar)."""
+        if self.frame_pool is None:
+            return None
+        while not self._stop_event.is_set():
+            buffer = self.frame_pool.acquire(timeout=_POOL_WAIT_S)
+            if buffer is not None:
+                return buffer
+        return None
+
+    def _annotate_stage(self):
+        instrumentation = self.instrumentation
+        while True:
+            item = self._get(self._inferred_queue)
+            if item is _FIN:
+                break
+            frame_idx, frame, boxes = item
+            track_ids = None
+            if self.tracker is not None:
+                with instrumentation.stage("track"):
+                    track_ids = self.tracker.update(boxes)
+            if self.store is not None:
+                self.store.append(frame_idx, boxes, track_ids)
+            if self._cache_writer is not None:
+                self._cache_writer.append(boxes)
+            with instrumentation.stage("annotate"):
+                if self.roi_output:
+                    x1, y1, x2, y2 = self._roi(frame)
+                    annotated_frame = self.annotator.draw(frame[y1:y2, x1:x2], translate_boxes(boxes, -x1, -y1), track_ids)
+                else:
+                    annotated_frame = self.annotator.draw(frame, boxes, track_ids) # En el propio buffer decodificado
+            if self.encoder is not None:
+                self.encoder.write(annotated_frame) # Solo encola; se codifica en el hilo del encoder
+            self.processed_frames += 1
+            if self.on_frame:
+                self.on_frame(frame_idx, annotated_frame, boxes)
+            if self.frame_pool is not None:
+                self.frame_pool.release(frame) # El codificador retiene su propia referencia si lo encoló
+            instrumentation.tick()
+        if self._cache_writer is not None and not self.stopped: # Video completo: se guarda en la caché
+            writer, self._cache_writer = self._cache_writer, None
+            writer.commit()
+        if self.encoder is not None:
+            encoder, self.encoder = self.encoder, None
+            encoder.close() # Espera a que se escriban los frames encolados
+
+    def _predict(self, frames):
+        """model.predict sobre un lote de frames (recortados al ROI si lo hay). Devuelve cajas (N, 6) del frame completo."""
+        results = self.model.predict(source=[self._crop(frame) for frame in frames], verbose=False, stream=False,
+                                     **self.predict_args)
+        frame_boxes = [boxes_array(result) for result in results] # Una sola copia a NumPy por frame
+        if self.roi is not None:
+            x1, y1, _, _ = self._roi(frames[0])
+            frame_boxes = [translate_boxes(boxes, x1, y1) for boxes in frame_boxes]
+        return frame_boxes
+
+    def _roi(self, frame):
+        if self.roi_box is None: # Fuentes en vivo: el tamaño del frame se conoce con el primero
+            self.roi_box = clamp_roi(self.roi["box"], frame.shape[1], frame.shape[0])
+        return self.roi_box
+
+    def _crop(self, frame):
+        """Vista del frame limitada al ROI (sin copiar), o el frame si no hay ROI."""
+        if self.roi is None:
+            return frame
+        x1, y1, x2, y2 = self._roi(frame)
+        return frame[y1:y2, x1:x2]
+
+    def _cached_frame_boxes(self, frame_idx):
+        if frame_idx < len(self.cached_boxes):
+            return self.cached_boxes[frame_idx]
+        return np.zeros((0, 6), dtype=np.float32)
+
+    # --- Utilidades de colas con cancelación ---
+    def _put(self, q, item):
+        while not self._stop_event.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q):
+        while not self._stop_event.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _FIN
+
+    def _release(self):
+        if self._cache_writer is not None: # Ejecución detenida o fallida: no se guarda una entrada incompleta
+            self._cache_writer.discard()
+            self._cache_writer = None
+        if self.cap is not None:
+            self.cap.release()
+            self.cap = None
+        if self.encoder is not None:
+            try:
+                self.encoder.close()
+            except Exception as e:
+                print(f"Error cerrando el video de salida: {e}")
+            self.encoder = None
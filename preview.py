@@ -0,0 +1,88 @@
+"""Utilidades para desacoplar la vista previa de la GUI del ritmo de procesamiento.
+
+El hilo de procesamiento deja cada frame en un buzón de una sola plaza y la GUI lo recoge con
+un temporizador a su propio ritmo; los frames que nadie llegó a mostrar se descartan en lugar
+de acumularse en la cola de eventos de Tk.
+"""
+import threading
+import time
+import cv2
+
+
+class LatestFrameMailbox:
+    """Buzón de una sola plaza: post() sobrescribe lo que hubiera, take() se lleva lo último."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._item = None
+        self.posted = 0
+        self.dropped = 0 # Frames sobrescritos antes de que la GUI los recogiera
+
+    def post(self, item):
+        with self._lock:
+            if self._item is not None:
+                self.dropped += 1
+            self._item = item
+            self.posted += 1
+
+    def take(self):
+        """Devuelve el último elemento publicado (o None) y vacía el buzón."""
+        with self._lock:
+            item, self._item = self._item, None
+            return item
+
+    def clear(self):
+        with self._lock:
+            self._item = None
+            self.posted = 0
+            self.dropped = 0
+
+
+class RateLimiter:
+    """Deja pasar como mucho rate_hz eventos por segundo."""
+
+    def __init__(self, rate_hz):
+        self.interval = 1.0 / rate_hz if rate_hz > 0 else 0.0
+        self._next = 0.0
+
+    def ready(self):
+        now = time.monotonic()
+        if now >= self._next:
+            self._next = now + self.interval
+            return True
+        return False
+
+
+class RenderTimer:
+    """Acumula el tiempo que tarda en dibujarse cada frame en la GUI."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.total = 0.0
+        self.last = 0.0
+
+    def record(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.last = seconds
+
+    @property
+    def mean_ms(self):
+        return self.total / self.count * 1000 if self.count else 0.0
+
+    def summary(self):
+        return f"{self.count} frames dibujados, {self.mean_ms:.2f} ms/frame de media (último {self.last * 1000:.2f} ms)"
+
+
+def fit_to_size(frame, max_size):
+    """Reduce frame para que quepa en max_size (ancho, alto) manteniendo la proporción; nunca amplía."""
+    frame_height, frame_width = frame.shape[:2]
+    max_width, max_height = max_size
+    scale = min(max_width / frame_width, max_height / frame_height, 1.0)
+    target_size = (max(1, int(frame_width * scale)), max(1, int(frame_height * scale)))
+    if target_size == (frame_width, frame_height):
+        return frame
+    return cv2.resize(frame, target_size, interpolation=cv2.INTER_AREA)
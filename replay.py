@@ -0,0 +1,152 @@
+"""Reproducción en tiempo real del video procesado.
+
+- ReplayClock: calcula qué frame toca mostrar a partir de un instante de inicio monotónico,
+  de modo que el tiempo de decodificar y dibujar no se acumula como deriva.
+- FramePrefetcher: hilo que decodifica por adelantado en una cola acotada. Cuando la
+  reproducción va retrasada, salta frames con grab() (sin convertirlos) hasta el que toca.
+  La pausa bloquea el hilo con un Event en lugar de sondear.
+"""
+import queue
+import threading
+import time
+import cv2
+from instrumentation import NULL_INSTRUMENTATION
+
+PREFETCH_QUEUE_SIZE = 8 # Frames decodificados por adelantado
+PLAYBACK_SPEEDS = (0.25, 0.5, 1.0, 1.5, 2.0, 4.0, 8.0)
+
+END_OF_VIDEO = None # Elemento que el prefetcher encola al llegar al final
+
+
+class ReplayClock:
+    """Reloj de reproducción: frame que toca mostrar = frame base + tiempo transcurrido * fps * velocidad."""
+
+    def __init__(self, fps, speed=1.0):
+        self.fps = fps if fps > 0 else 30
+        self.speed = speed
+        self._base_frame = 0
+        self._base_time = time.monotonic()
+
+    def rebase(self, frame_idx):
+        """Reinicia el reloj para que frame_idx sea el que toca ahora (tras pausa, salto o cambio de velocidad)."""
+        self._base_frame = frame_idx
+        self._base_time = time.monotonic()
+
+    def set_speed(self, speed, current_frame):
+        self.speed = speed
+        self.rebase(current_frame)
+
+    def frame_due(self):
+        return self._base_frame + int((time.monotonic() - self._base_time) * self.fps * self.speed)
+
+    def seconds_until(self, frame_idx):
+        deadline = self._base_time + (frame_idx - self._base_frame) / (self.fps * self.speed)
+        return deadline - time.monotonic()
+
+
+class FramePrefetcher:
+    """Decodifica el video en segundo plano. Los frames se leen con get() como (frame_idx, frame)."""
+
+    def __init__(self, path, transform=None, queue_size=PREFETCH_QUEUE_SIZE, instrumentation=None):
+        self.path = path
+        self.transform = transform
+        self.instrumentation = instrumentation or NULL_INSTRUMENTATION
+        self.min_frame = 0 # Primer frame que todavía interesa; los anteriores se saltan sin decodificar
+        self.skipped = 0
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._running = threading.Event() # Despejado = en pausa
+        self._running.set()
+        self._wakeup = threading.Event() # Despierta al hilo detenido al final del video
+        self._lock = threading.Lock()
+        self._seek_to = None
+        self._generation = 0 # Cambia con cada salto para descartar frames de la posición anterior
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="replay-prefetch", daemon=True)
+        self._thread.start()
+
+    def get(self):
+        """Siguiente frame decodificado sin bloquear: (frame_idx, frame), END_OF_VIDEO, o False si aún no hay."""
+        while True:
+            try:
+                generation, item = self._queue.get_nowait()
+            except queue.Empty:
+                return False
+            if generation == self._generation:
+                return item
+
+    @property
+    def pending(self):
+        return self._queue.qsize()
+
+    def seek(self, frame_idx):
+        with self._lock:
+            self._generation += 1
+            self._seek_to = frame_idx
+            self.min_frame = frame_idx
+        self._drain()
+        self._wakeup.set()
+
+    def pause(self):
+        self._running.clear()
+
+    def resume(self):
+        self._running.set()
+
+    def close(self):
+        self._closed = True
+        self._running.set()
+        self._wakeup.set()
+        self._drain()
+        self._thread.join(timeout=1.0)
+
+    def _drain(self):
+        try:
+            while True:
+                self._queue.get_nowait()
+        except queue.Empty:
+            pass
+
+    def _run(self):
+        cap = cv2.VideoCapture(self.path)
+        position = 0
+        try:
+            while not self._closed:
+                self._running.wait() # Pausa sin sondeo
+                with self._lock:
+                    generation = self._generation
+                    if self._seek_to is not None:
+                        cap.set(cv2.CAP_PROP_POS_FRAMES, self._seek_to)
+                        position = self._seek_to
+                        self._seek_to = None
+                if position < self.min_frame: # Vamos retrasados: saltar sin decodificar a imagen
+                    if cap.grab():
+                        position += 1
+                        self.skipped += 1
+                        continue
+                    item = END_OF_VIDEO
+                else:
+                    with self.instrumentation.stage("decode"):
+                        ret, frame = cap.read()
+                        if ret and self.transform:
+                            frame = self.transform(frame)
+                    if ret:
+                        item = (position, frame)
+                        position += 1
+                    else:
+                        item = END_OF_VIDEO
+                self._put(generation, item)
+                if item is END_OF_VIDEO:
+                    # Esperar a un salto (o al cierre) antes de seguir leyendo
+                    while not self._closed and self._seek_to is None:
+                        self._wakeup.wait()
+                        self._wakeup.clear()
+        finally:
+            cap.release()
+
+    def _put(self, generation, item):
+        while not self._closed and generation == self._generation:
+            try:
+                self._queue.put((generation, item), timeout=0.05)
+                return
+            except queue.Full:
+                continue
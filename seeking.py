@@ -0,0 +1,206 @@
+"""Búsqueda rápida y exacta de frames para la línea de tiempo.
+
+- KeyframeIndex: posiciones de los keyframes y marcas de tiempo de cada frame, obtenidas una
+  vez por video con ffprobe (si está instalado).
+- FrameCache: caché LRU acotada de frames ya decodificados (y reducidos al tamaño de la vista).
+- FrameSeeker: hilo con su propio VideoCapture que atiende solo la última posición pedida
+  (las peticiones intermedias del slider se descartan) y, mientras no llegan otras, decodifica
+  por adelantado los frames siguientes a la posición actual.
+"""
+import shutil
+import subprocess
+import threading
+from collections import OrderedDict
+import cv2
+import numpy as np
+from preview import LatestFrameMailbox
+
+FRAME_CACHE_SIZE = 90 # Frames reducidos que se guardan alrededor del cabezal
+PREFETCH_FRAMES = 30 # Frames que se decodifican por adelantado tras cada búsqueda
+MAX_FORWARD_GRAB = 48 # Sin índice de keyframes: distancia máxima a la que se avanza decodificando en vez de saltar
+
+
+class KeyframeIndex:
+    def __init__(self, keyframes=None, timestamps=None, fps=30):
+        self.keyframes = np.asarray(keyframes if keyframes is not None else [], dtype=np.int64)
+        self.timestamps = np.asarray(timestamps if timestamps is not None else [], dtype=np.float64)
+        self.fps = fps if fps > 0 else 30
+
+    @classmethod
+    def build(cls, path, fps=30):
+        """Lee los paquetes del video con ffprobe. Sin ffprobe devuelve un índice vacío (modo heurístico)."""
+        ffprobe = shutil.which("ffprobe")
+        if not ffprobe:
+            return cls(fps=fps)
+        try:
+            output = subprocess.run(
+                [ffprobe, "-v", "error", "-select_streams", "v:0",
+                 "-show_entries", "packet=pts_time,flags", "-of", "csv=p=0", path],
+                capture_output=True, text=True, check=True, timeout=120).stdout
+        except (OSError, subprocess.SubprocessError) as e:
+            print(f"No se pudo indexar '{path}' con ffprobe: {e}")
+            return cls(fps=fps)
+
+        pts, is_key = [], []
+        for line in output.splitlines():
+            fields = line.strip().split(",")
+            if len(fields) < 2 or fields[0] in ("", "N/A"):
+                continue
+            pts.append(float(fields[0]))
+            is_key.append("K" in fields[1])
+        if not pts:
+            return cls(fps=fps)
+        # Los paquetes vienen en orden de decodificación; el índice de frame es el orden por pts
+        order = np.argsort(pts, kind="stable")
+        timestamps = np.asarray(pts)[order]
+        keyframes = np.flatnonzero(np.asarray(is_key)[order])
+        return cls(keyframes, timestamps - timestamps[0], fps)
+
+    @property
+    def has_keyframes(self):
+        return len(self.keyframes) > 0
+
+    def keyframe_before(self, frame_idx):
+        if not self.has_keyframes:
+            return 0
+        i = np.searchsorted(self.keyframes, frame_idx, side="right") - 1
+        return int(self.keyframes[max(i, 0)])
+
+    def decode_forward_is_cheaper(self, position, target):
+        """True si es más barato avanzar decodificando desde position que saltar a target."""
+        if target < position:
+            return False
+        if self.has_keyframes:
+            # Saltar obligaría al decodificador a empezar desde el keyframe anterior al destino
+            return self.keyframe_before(target) <= position
+        return target - position <= MAX_FORWARD_GRAB
+
+    def time_of(self, frame_idx):
+        if 0 <= frame_idx < len(self.timestamps):
+            return float(self.timestamps[frame_idx])
+        return frame_idx / self.fps
+
+
+class FrameCache:
+    """Caché LRU de frames decodificados, por índice de frame."""
+
+    def __init__(self, max_frames=FRAME_CACHE_SIZE):
+        self.max_frames = max_frames
+        self._frames = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, frame_idx):
+        with self._lock:
+            frame = self._frames.get(frame_idx)
+            if frame is not None:
+                self._frames.move_to_end(frame_idx)
+            return frame
+
+    def put(self, frame_idx, frame):
+        with self._lock:
+            self._frames[frame_idx] = frame
+            self._frames.move_to_end(frame_idx)
+            while len(self._frames) > self.max_frames:
+                self._frames.popitem(last=False)
+
+    def __contains__(self, frame_idx):
+        with self._lock:
+            return frame_idx in self._frames
+
+    def clear(self):
+        with self._lock:
+            self._frames.clear()
+
+
+class FrameSeeker:
+    """Decodifica en segundo plano el frame pedido más reciente y precarga los siguientes.
+
+    transform(frame) se aplica a cada frame decodificado antes de guardarlo (p. ej. reducirlo al
+    tamaño de la vista). Los resultados se recogen con poll() como (frame_idx, frame).
+    """
+
+    def __init__(self, path, index=None, transform=None, cache_size=FRAME_CACHE_SIZE, prefetch=PREFETCH_FRAMES):
+        self.path = path
+        self.index = index or KeyframeIndex()
+        self.transform = transform
+        self.cache = FrameCache(cache_size)
+        self.prefetch = prefetch
+        self._requests = LatestFrameMailbox()
+        self._results = LatestFrameMailbox()
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._closed = False
+        self._latest = None # Última posición pedida
+        self.pending = False # Hay una petición cuyo frame todavía no se ha publicado
+        self._cap = None
+        self._position = 0 # Próximo frame que devolverá self._cap.read()
+        self._thread = threading.Thread(target=self._run, name="frame-seeker", daemon=True)
+        self._thread.start()
+
+    def request(self, frame_idx):
+        """Pide un frame. Si llegan varias peticiones antes de atenderlas, solo se decodifica la última."""
+        with self._lock:
+            self._latest = frame_idx
+            cached = self.cache.get(frame_idx)
+            if cached is not None:
+                self._results.post((frame_idx, cached))
+                return
+            self.pending = True
+            self._requests.post(frame_idx)
+            self._wake.set()
+
+    def poll(self):
+        return self._results.take()
+
+    def close(self):
+        self._closed = True
+        self._wake.set()
+        self._thread.join(timeout=1.0)
+
+    def _run(self):
+        self._cap = cv2.VideoCapture(self.path)
+        try:
+            while not self._closed:
+                self._wake.wait()
+                self._wake.clear()
+                target = self._requests.take()
+                if target is None or self._closed:
+                    continue
+                frame = self.cache.get(target)
+                if frame is None:
+                    frame = self._decode(target)
+                with self._lock:
+                    if frame is not None and target == self._latest: # Descartar posiciones ya superadas
+                        self._results.post((target, frame))
+                    if self._wake.is_set(): # Llegó otra petición mientras se decodificaba
+                        continue
+                    self.pending = False
+                self._prefetch_after(target)
+        finally:
+            self._cap.release()
+
+    def _decode(self, target):
+        if not self.index.decode_forward_is_cheaper(self._position, target):
+            self._cap.set(cv2.CAP_PROP_POS_FRAMES, target)
+            self._position = target
+        while self._position < target: # Avanzar sin convertir los frames intermedios
+            if not self._cap.grab():
+                return None
+            self._position += 1
+        ret, frame = self._cap.read()
+        if not ret:
+            return None
+        self._position += 1
+        if self.transform:
+            frame = self.transform(frame)
+        self.cache.put(target, frame)
+        return frame
+
+    def _prefetch_after(self, target):
+        for frame_idx in range(target + 1, target + 1 + self.prefetch):
+            if self._closed or self._wake.is_set(): # Llegó otra petición: atenderla primero
+                return
+            if frame_idx in self.cache:
+                continue
+            if self._decode(frame_idx) is None:
+                return
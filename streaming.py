@@ -0,0 +1,640 @@
+"""Análisis en vivo: cámaras, flujos RTSP/V4L2 y carpetas que se van llenando.
+
+A diferencia de un archivo, una fuente en vivo no espera: si la inferencia se queda atrás, no
+se puede frenar la captura (backpressure) sin que la latencia crezca sin límite. Por eso la
+captura deja los frames en un RingBuffer acotado que, lleno, descarta el frame más antiguo;
+la inferencia toma los frames que haya (hasta batch_size) sin esperar a completar un lote.
+
+StreamPipeline reutiliza las etapas de anotado y codificación de VideoPipeline y mide la
+latencia de cada frame por etapas: espera en el buffer, inferencia, salida (seguimiento,
+almacén, anotado y encolado para codificar) y total desde la captura. La salida se escribe en
+segmentos consecutivos de segment_seconds (SegmentedWriter). Como en VideoPipeline, la captura
+escribe en buffers de un frame_pool.FramePool (max_memory_mb); los frames que descarta el
+RingBuffer vuelven al pool en el momento.
+
+Fuentes (open_source): índice de cámara ("0"), dispositivo V4L2 ("/dev/video0"), URL
+("rtsp://..."), carpeta vigilada, "synthetic[:WxH@fps]" (generador de prueba) o un archivo de
+video, que se reproduce en bucle a su ritmo para sustituir a la cámara.
+
+Como script:
+    python streaming.py synthetic --duration 30
+    python streaming.py rtsp://127.0.0.1:8554/microscopio --track --segment 300
+    python streaming.py /datos/adquisicion --dir-fps 2
+"""
+import argparse
+import collections
+import os
+import queue
+import sys
+import threading
+import time
+import cv2
+import numpy as np
+from annotator import Annotator, ANNOTATION_STYLES, DEFAULT_STYLE
+from encoder import VideoEncoder, unique_output_path
+from frame_pool import DEFAULT_MEMORY_CEILING_MB
+from pipeline import VideoPipeline, _FIN
+
+DEFAULT_BUFFER_SIZE = 8 # Frames capturados pendientes de inferencia antes de descartar los más antiguos
+DEFAULT_STREAM_BATCH = 4 # Máximo de frames por lote; nunca se espera a completarlo
+DEFAULT_SEGMENT_SECONDS = 60 # Duración de cada archivo de salida (0 = un solo archivo)
+DEFAULT_DIRECTORY_FPS = 5.0 # FPS nominal de una carpeta vigilada (para el video de salida y las velocidades)
+DEFAULT_SYNTHETIC_SIZE = (640, 480)
+DEFAULT_SYNTHETIC_FPS = 30
+DEFAULT_STREAM_OUTPUT_DIR = "capturas"
+DIRECTORY_POLL_S = 0.2 # Intervalo de sondeo de la carpeta vigilada
+LATENCY_WINDOW = 1000 # Últimos frames sobre los que se calculan los percentiles de latencia
+LATENCY_STAGES = ("queue", "inference", "output", "total")
+MAX_CAMERA_FPS = 240 # FPS por encima de esto (o <= 0) se consideran un valor inválido del driver
+GRAB_TIMEOUT_S = 5.0 # Espera máxima de grab_frame a que la fuente entregue un frame
+
+
+class RingBuffer:
+    """Cola acotada que nunca bloquea al productor: si está llena descarta el elemento más antiguo.
+
+    get()/get_nowait() lanzan queue.Empty como queue.Queue, para usarla igual entre etapas.
+    on_drop(item) se llama con cada elemento descartado (p. ej. para devolver su buffer al pool).
+    """
+
+    def __init__(self, capacity=DEFAULT_BUFFER_SIZE, on_drop=None):
+        self.capacity = max(1, int(capacity))
+        self.on_drop = on_drop
+        self.dropped = 0
+        self._items = collections.deque()
+        self._cond = threading.Condition()
+
+    def __len__(self):
+        return len(self._items)
+
+    def put(self, item):
+        dropped = None
+        with self._cond:
+            if len(self._items) >= self.capacity:
+                dropped = self._items.popleft()
+                self.dropped += 1
+            self._items.append(item)
+            self._cond.notify()
+        if dropped is not None and self.on_drop is not None:
+            self.on_drop(dropped)
+
+    def get(self, timeout=None):
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._items, timeout):
+                raise queue.Empty
+            return self._items.popleft()
+
+    def qsize(self):
+        return len(self._items)
+
+    def get_nowait(self):
+        with self._cond:
+            if not self._items:
+                raise queue.Empty
+            return self._items.popleft()
+
+
+class LatencyStats:
+    """Latencias por frame de cada etapa (en segundos), sobre una ventana de los últimos frames."""
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self._lock = threading.Lock()
+        self._samples = {stage: collections.deque(maxlen=window) for stage in LATENCY_STAGES}
+
+    def record(self, **seconds):
+        with self._lock:
+            for stage, value in seconds.items():
+                self._samples[stage].append(value)
+
+    def percentile(self, stage, q):
+        """Percentil q (0-100) de una etapa en milisegundos, o None sin muestras."""
+        with self._lock:
+            samples = np.fromiter(self._samples[stage], dtype=np.float64)
+        return float(np.percentile(samples, q)) * 1000 if len(samples) else None
+
+    def summary(self):
+        if self.percentile("total", 50) is None:
+            return "sin frames procesados"
+        text = f"latencia total p50 {self.percentile('total', 50):.0f} ms, p95 {self.percentile('total', 95):.0f} ms"
+        stages = ", ".join(f"{name} {self.percentile(stage, 50):.0f}" for stage, name in
+                           (("queue", "espera"), ("inference", "inferencia"), ("output", "salida")))
+        return f"{text} (p50 por etapa en ms: {stages})"
+
+    def as_dict(self):
+        stats = {}
+        for stage in LATENCY_STAGES:
+            values = [self.percentile(stage, q) for q in (50, 95, 99)]
+            stats[stage] = {f"p{q}_ms": None if v is None else round(v, 2) for q, v in zip((50, 95, 99), values)}
+        return stats
+
+
+class SegmentedWriter:
+    """Escribe el flujo anotado en archivos consecutivos de segment_seconds (tiempo real) cada uno.
+
+    Tiene la misma interfaz que encoder.VideoEncoder (write/close). Cada segmento se abre con el
+    tamaño del primer frame que recibe, así que no hace falta conocerlo de antemano.
+    frame_pool se pasa a cada VideoEncoder; puede asignarse después de crear el escritor.
+    """
+
+    def __init__(self, directory, stem, fps, segment_seconds=DEFAULT_SEGMENT_SECONDS, encoder_options=None, frame_pool=None):
+        self.directory = directory
+        self.stem = stem
+        self.fps = fps
+        self.segment_seconds = segment_seconds
+        self.encoder_options = dict(encoder_options or {})
+        self.frame_pool = frame_pool
+        self.segments = [] # Rutas de los segmentos escritos, en orden
+        self._encoder = None
+        self._segment_start = 0.0
+
+    def write(self, frame):
+        now = time.monotonic()
+        if self._encoder is None or (self.segment_seconds and now - self._segment_start >= self.segment_seconds):
+            self._roll(frame, now)
+        self._encoder.write(frame)
+
+    @property
+    def pending(self):
+        return self._encoder.pending if self._encoder is not None else 0
+
+    def close(self):
+        encoder, self._encoder = self._encoder, None
+        if encoder is not None:
+            encoder.close()
+
+    def _roll(self, frame, now):
+        self.close()
+        path = unique_output_path(self.directory, self.stem)
+        self._encoder = VideoEncoder(path, self.fps, (frame.shape[1], frame.shape[0]), frame_pool=self.frame_pool,
+                                     **self.encoder_options)
+        self._segment_start = now
+        self.segments.append(path)
+        print(f"[En vivo] Nuevo segmento: {path}")
+
+
+# --- Fuentes ---
+class _Source:
+    """Interfaz común: open(), read(buffer) -> frame BGR o None al terminar, stop() (desde otro hilo) y close().
+
+    read() decodifica en buffer (un array del tamaño del frame) si puede; si no, devuelve un array nuevo.
+    """
+    name = "fuente"
+    fps = 30.0
+
+    def __init__(self):
+        self._stop_event = threading.Event()
+
+    def open(self):
+        pass
+
+    def read(self, buffer=None):
+        raise NotImplementedError
+
+    def stop(self):
+        """Interrumpe un read() bloqueado en espera; los siguientes devuelven None."""
+        self._stop_event.set()
+
+    def close(self):
+        pass
+
+    def _wait_until(self, deadline):
+        """Espera hasta deadline (time.monotonic). Devuelve False si se pidió parar."""
+        delay = deadline - time.monotonic()
+        if delay > 0:
+            return not self._stop_event.wait(delay)
+        return not self._stop_event.is_set()
+
+
+class _Pacer:
+    """Marca el ritmo de una fuente no en vivo para que entregue frames a fps, como una cámara."""
+
+    def __init__(self, fps):
+        self.interval = 1.0 / fps
+        self._next = None
+
+    def next_deadline(self):
+        now = time.monotonic()
+        if self._next is None or now - self._next > self.interval: # Muy retrasado: no acumular ráfagas
+            self._next = now
+        deadline = self._next
+        self._next += self.interval
+        return deadline
+
+
+class CaptureSource(_Source):
+    """Cámara local, dispositivo V4L2, URL RTSP/HTTP o archivo de video (con loop, en bucle)."""
+
+    def __init__(self, uri, loop=False, name=None):
+        super().__init__()
+        self.uri = uri
+        self.loop = loop
+        self.is_file = isinstance(uri, str) and os.path.isfile(uri)
+        self.name = name or _source_name(uri)
+        self.cap = None
+        self._pacer = None
+
+    def open(self):
+        self.cap = cv2.VideoCapture(self.uri)
+        if not self.cap.isOpened():
+            self.cap.release()
+            self.cap = None
+            raise IOError(f"No se pudo abrir la fuente de video: {self.uri}")
+        fps = self.cap.get(cv2.CAP_PROP_FPS)
+        self.fps = fps if 0 < fps <= MAX_CAMERA_FPS else 30.0
+        if self.is_file:
+            self._pacer = _Pacer(self.fps) # Un archivo se lee a su ritmo para simular una cámara
+        else:
+            self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1) # Que el driver no acumule frames viejos
+
+    def read(self, buffer=None):
+        if self._stop_event.is_set():
+            return None
+        ret, frame = self.cap.read(image=buffer)
+        if not ret and self.loop and self.is_file:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ret, frame = self.cap.read(image=buffer)
+        if not ret:
+            return None
+        if self._pacer is not None and not self._wait_until(self._pacer.next_deadline()):
+            return None
+        return frame
+
+    def close(self):
+        if self.cap is not None:
+            self.cap.release()
+            self.cap = None
+
+
+class SyntheticSource(_Source):
+    """Generador de frames de prueba: células (círculos) que se desplazan sobre un fondo claro, a fps."""
+    name = "sintetico"
+
+    def __init__(self, size=DEFAULT_SYNTHETIC_SIZE, fps=DEFAULT_SYNTHETIC_FPS, cells=40, frames=None, seed=0, realtime=True):
+        super().__init__()
+        self.size = size
+        self.fps = float(fps)
+        self.frames = frames # None = infinito
+        rng = np.random.default_rng(seed)
+        width, height = size
+        self._positions = rng.uniform((0, 0), (width, height), (cells, 2))
+        self._velocities = rng.normal(0, 1.5, (cells, 2))
+        self._radii = rng.integers(6, 16, cells).tolist()
+        self._colors = rng.integers(40, 160, (cells, 3)).tolist()
+        self._background = np.full((height, width, 3), 215, dtype=np.uint8)
+        self._pacer = _Pacer(self.fps) if realtime else None # Sin realtime, tan rápido como se pida
+        self._count = 0
+
+    def read(self, buffer=None):
+        if self.frames is not None and self._count >= self.frames:
+            return None
+        if self._pacer is not None and not self._wait_until(self._pacer.next_deadline()):
+            return None
+        self._positions = (self._positions + self._velocities) % self.size
+        if buffer is not None and buffer.shape == self._background.shape:
+            np.copyto(buffer, self._background)
+            frame = buffer
+        else:
+            frame = self._background.copy()
+        for (x, y), radius, color in zip(self._positions.astype(int).tolist(), self._radii, self._colors):
+            cv2.circle(frame, (x, y), radius, color, -1, cv2.LINE_AA)
+        self._count += 1
+        return frame
+
+
+class DirectoryWatchSource(_Source):
+    """Carpeta que el software de adquisición va llenando: entrega cada imagen nueva, en orden.
+
+    Un archivo se lee cuando su tamaño deja de cambiar entre dos sondeos, para no leer imágenes
+    a medio escribir. Las imágenes con otro tamaño se redimensionan al de la primera. cv2.imread
+    no decodifica en un buffer dado, así que read() ignora buffer salvo al redimensionar.
+    """
+
+    def __init__(self, directory, fps=DEFAULT_DIRECTORY_FPS, include_existing=False, poll_interval=DIRECTORY_POLL_S):
+        super().__init__()
+        from detector import IMAGE_EXTENSIONS
+        self.directory = directory
+        self.fps = float(fps)
+        self.name = _source_name(directory)
+        self.poll_interval = poll_interval
+        self._extensions = IMAGE_EXTENSIONS
+        self._seen = set() if include_existing else set(self._list_images())
+        self._sizes = {} # ruta -> tamaño en el sondeo anterior
+        self._ready = collections.deque()
+        self._frame_size = None
+
+    def open(self):
+        if not os.path.isdir(self.directory):
+            raise IOError(f"No existe la carpeta a vigilar: {self.directory}")
+
+    def read(self, buffer=None):
+        while True:
+            while self._ready:
+                path = self._ready.popleft()
+                frame = cv2.imread(path, cv2.IMREAD_COLOR)
+                if frame is None:
+                    print(f"[En vivo] No se pudo leer '{path}', se omite.")
+                    continue
+                if self._frame_size is None:
+                    self._frame_size = (frame.shape[1], frame.shape[0])
+                elif (frame.shape[1], frame.shape[0]) != self._frame_size:
+                    if buffer is not None and (buffer.shape[1], buffer.shape[0]) == self._frame_size:
+                        frame = cv2.resize(frame, self._frame_size, dst=buffer, interpolation=cv2.INTER_AREA)
+                    else:
+                        frame = cv2.resize(frame, self._frame_size, interpolation=cv2.INTER_AREA)
+                return frame
+            if not self._wait_until(time.monotonic() + self.poll_interval):
+                return None
+            self._poll()
+
+    def _list_images(self):
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return []
+        return [os.path.join(self.directory, name) for name in names if os.path.splitext(name)[1].lower() in self._extensions]
+
+    def _poll(self):
+        stable = []
+        for path in self._list_images():
+            if path in self._seen:
+                continue
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            if self._sizes.get(path) == stat.st_size and stat.st_size > 0:
+                stable.append((stat.st_mtime, path))
+            else:
+                self._sizes[path] = stat.st_size
+        for _, path in sorted(stable):
+            self._seen.add(path)
+            self._sizes.pop(path, None)
+            self._ready.append(path)
+
+
+def _source_name(uri):
+    """Nombre corto para los archivos de salida de una fuente."""
+    if isinstance(uri, int):
+        return f"camara{uri}"
+    if "://" in uri:
+        return uri.split("://", 1)[0] # rtsp, http...
+    if uri.startswith("/dev/video"):
+        return "camara" + uri[len("/dev/video"):]
+    return os.path.splitext(os.path.basename(os.path.normpath(uri)))[0] or "fuente"
+
+
+def open_source(spec, directory_fps=DEFAULT_DIRECTORY_FPS, loop=True):
+    """Crea la fuente descrita por spec (ver el docstring del módulo). Lanza ValueError si no se reconoce."""
+    spec = str(spec).strip()
+    if spec == "synthetic" or spec.startswith("synthetic:"):
+        size, fps = DEFAULT_SYNTHETIC_SIZE, DEFAULT_SYNTHETIC_FPS
+        if ":" in spec: # synthetic:WxH@fps
+            geometry = spec.split(":", 1)[1]
+            if "@" in geometry:
+                geometry, fps = geometry.split("@", 1)
+                fps = float(fps)
+            if geometry:
+                width, height = geometry.lower().split("x")
+                size = (int(width), int(height))
+        return SyntheticSource(size, fps)
+    if spec.isdigit():
+        return CaptureSource(int(spec))
+    if "://" in spec or spec.startswith("/dev/video"):
+        return CaptureSource(spec)
+    if os.path.isdir(spec):
+        return DirectoryWatchSource(spec, fps=directory_fps)
+    if os.path.isfile(spec):
+        return CaptureSource(spec, loop=loop)
+    raise ValueError(f"Fuente no reconocida: '{spec}' (usa un índice de cámara, una URL, una carpeta, un video o 'synthetic').")
+
+
+def grab_frame(spec, timeout=GRAB_TIMEOUT_S, directory_fps=DEFAULT_DIRECTORY_FPS):
+    """Un frame de la fuente spec (p. ej. para dibujar el ROI), o None si no llega en timeout segundos.
+
+    De una carpeta vigilada se toma la primera imagen que ya contenga. Lanza IOError si la fuente
+    no se puede abrir.
+    """
+    source = open_source(spec, directory_fps=directory_fps)
+    if isinstance(source, DirectoryWatchSource):
+        source = DirectoryWatchSource(source.directory, fps=directory_fps, include_existing=True)
+    source.open()
+    timer = threading.Timer(timeout, source.stop) # Interrumpe las esperas de read()
+    timer.start()
+    try:
+        return source.read()
+    finally:
+        timer.cancel()
+        source.close()
+
+
+class StreamPipeline(VideoPipeline):
+    """VideoPipeline para fuentes en vivo: captura -> RingBuffer (descarta lo más antiguo) -> inferencia -> anotado -> segmentos.
+
+    No usa caché ni salto de frames (ambos retienen frames y suben la latencia). Los frame_idx
+    son los de captura, así que los frames descartados dejan huecos en el almacén. roi funciona
+    como en VideoPipeline; se ajusta al tamaño del primer frame capturado, igual que el pool de
+    buffers de la captura (max_memory_mb).
+    """
+
+    def __init__(self, model, source, output_dir=None, buffer_size=DEFAULT_BUFFER_SIZE, batch_size=DEFAULT_STREAM_BATCH,
+                 segment_seconds=DEFAULT_SEGMENT_SECONDS, on_frame=None, predict_args=None, store=None, tracker=None,
+                 annotator=None, encoder_options=None, max_frames=None, instrumentation=None, roi=None,
+                 max_memory_mb=DEFAULT_MEMORY_CEILING_MB):
+        # Cola corta entre inferencia y anotado: lo que espere ahí también es latencia
+        super().__init__(model, source.name, None, batch_size=batch_size, queue_size=max(2, batch_size),
+                         on_frame=self._frame_done, predict_args=predict_args, store=store, tracker=tracker,
+                         annotator=annotator, encoder_options=encoder_options, instrumentation=instrumentation,
+                         roi=roi, max_memory_mb=max_memory_mb)
+        self.source = source
+        self.output_dir = output_dir
+        self.segment_seconds = segment_seconds
+        self.max_frames = max_frames
+        self.user_on_frame = on_frame
+        self.latency = LatencyStats()
+        self.writer = None # SegmentedWriter; self.encoder apunta a él hasta que la etapa de anotado lo cierra
+        self.captured_frames = 0
+        self._decoded_queue = RingBuffer(buffer_size, on_drop=self._release_dropped)
+        self._timings = {} # frame_idx -> (captura, inicio de inferencia, fin de inferencia)
+
+    @property
+    def dropped_frames(self):
+        return self._decoded_queue.dropped
+
+    @property
+    def running(self):
+        return any(thread.is_alive() for thread in self._threads)
+
+    @property
+    def segments(self):
+        return self.writer.segments if self.writer is not None else []
+
+    def open(self):
+        self.source.open()
+        self.fps = self.source.fps
+        if self.annotator.enabled and self.output_dir:
+            self.writer = self.encoder = SegmentedWriter(self.output_dir, self.source.name, self.fps, self.segment_seconds,
+                                                         dict(self.encoder_options, instrumentation=self.instrumentation))
+        self.cap = self.source # start() solo abre si cap es None
+        self._register_gauges()
+
+    def stop(self):
+        super().stop()
+        self.source.stop()
+
+    def run(self):
+        try:
+            super().run()
+        finally:
+            print(f"[En vivo] {self.summary()}")
+
+    def summary(self):
+        return (f"{self.captured_frames} frames capturados, {self.processed_frames} procesados, "
+                f"{self.dropped_frames} descartados; {self.latency.summary()}")
+
+    def as_dict(self):
+        return {"captured": self.captured_frames, "processed": self.processed_frames, "dropped": self.dropped_frames,
+                "latency": self.latency.as_dict(), "segments": list(self.segments)}
+
+    # --- Etapas ---
+    def _decode_stage(self):
+        frame_idx = 0
+        while not self._stop_event.is_set() and (self.max_frames is None or frame_idx < self.max_frames):
+            buffer = self._acquire_buffer()
+            if buffer is None and self.frame_pool is not None:
+                break # Se pidió parar mientras se esperaba un buffer libre
+            with self.instrumentation.stage("capture"): # Incluye la espera a la cámara
+                frame = self.source.read(buffer)
+            if buffer is not None and frame is not buffer:
+                self.frame_pool.release(buffer)
+            if frame is None:
+                break
+            if self.frame_pool is None: # El primer frame fija el tamaño de los buffers
+                self.frame_pool = self._create_frame_pool(frame.shape, self._decoded_queue.capacity + self.queue_size)
+                if self.writer is not None:
+                    self.writer.frame_pool = self.frame_pool
+            self._decoded_queue.put((frame_idx, frame, time.perf_counter()))
+            self.captured_frames += 1
+            frame_idx += 1
+        self._decoded_queue.put(_FIN) # Es lo más reciente: nunca se descarta
+
+    def _inference_stage(self):
+        finished = False
+        while not finished:
+            item = self._get(self._decoded_queue)
+            if item is _FIN:
+                break
+            batch = [item]
+            # Solo lo que ya esté capturado: esperar a completar el lote añadiría latencia
+            while len(batch) < self.inference_batch_size:
+                try:
+                    item = self._decoded_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _FIN:
+                    finished = True
+                    break
+                batch.append(item)
+            start = time.perf_counter()
+            frame_boxes = self._predict([frame for _, frame, _ in batch])
+            end = time.perf_counter()
+            self.instrumentation.record("inference", end - start, len(batch), end)
+            for (frame_idx, frame, captured), boxes in zip(batch, frame_boxes):
+                self._timings[frame_idx] = (captured, start, end)
+                if not self._put(self._inferred_queue, (frame_idx, frame, boxes)):
+                    return
+        self._put(self._inferred_queue, _FIN)
+
+    def _release_dropped(self, item):
+        if item is not _FIN and self.frame_pool is not None:
+            self.frame_pool.release(item[1])
+
+    def _frame_done(self, frame_idx, annotated_frame, boxes):
+        captured, start, end = self._timings.pop(frame_idx)
+        now = time.perf_counter()
+        self.latency.record(queue=start - captured, inference=end - start, output=now - end, total=now - captured)
+        if self.user_on_frame:
+            self.user_on_frame(frame_idx, annotated_frame, boxes)
+
+    def _release(self):
+        self.cap = None # Es la fuente, no un VideoCapture: se cierra aparte
+        super()._release()
+        self.source.close()
+
+
+def main(argv=None):
+    import detector
+    from detection_store import DetectionStore
+    from encoder import CODECS, DEFAULT_CODEC
+    from tracking import CellTracker, track_statistics, save_track_statistics
+    from inference_backends import add_backend_arguments, backend_options
+    from box_ops import parse_roi
+    parser = argparse.ArgumentParser(description="Detección en vivo sobre una cámara, un flujo RTSP, una carpeta o una fuente de prueba.")
+    parser.add_argument("source", help="Índice de cámara, /dev/videoN, URL rtsp://, carpeta, video (en bucle) o synthetic[:WxH@fps]")
+    parser.add_argument("-o", "--output-dir", default=DEFAULT_STREAM_OUTPUT_DIR,
+                        help=f"Directorio de segmentos y detecciones (por defecto: {DEFAULT_STREAM_OUTPUT_DIR})")
+    parser.add_argument("-m", "--model", default=detector.MODEL_NAME, help=f"Pesos YOLO (por defecto: {detector.MODEL_NAME})")
+    parser.add_argument("-b", "--batch-size", type=int, default=DEFAULT_STREAM_BATCH, help="Máximo de frames por lote de inferencia")
+    parser.add_argument("--buffer", type=int, default=DEFAULT_BUFFER_SIZE,
+                        help=f"Frames en espera antes de descartar los más antiguos (por defecto: {DEFAULT_BUFFER_SIZE})")
+    parser.add_argument("--segment", type=float, default=DEFAULT_SEGMENT_SECONDS,
+                        help=f"Segundos por archivo de salida; 0 = un solo archivo (por defecto: {DEFAULT_SEGMENT_SECONDS})")
+    parser.add_argument("--duration", type=float, default=None, help="Detener tras N segundos (por defecto: hasta Ctrl+C)")
+    parser.add_argument("--max-frames", type=int, default=None, help="Detener tras capturar N frames")
+    parser.add_argument("--dir-fps", type=float, default=DEFAULT_DIRECTORY_FPS,
+                        help=f"FPS nominal de una carpeta vigilada (por defecto: {DEFAULT_DIRECTORY_FPS})")
+    parser.add_argument("--track", action="store_true", help="Seguir cada célula entre frames (track_id)")
+    parser.add_argument("-a", "--annotate", choices=ANNOTATION_STYLES, default=DEFAULT_STYLE,
+                        help="Estilo de la salida anotada; 'none' solo guarda las detecciones (por defecto: labels)")
+    parser.add_argument("--codec", choices=tuple(CODECS), default=DEFAULT_CODEC, help=f"Códec de los segmentos (por defecto: {DEFAULT_CODEC})")
+    parser.add_argument("--scale", type=float, default=1.0, help="Escala de resolución de los segmentos (por defecto: 1)")
+    parser.add_argument("--roi", default=None, metavar="X1,Y1,X2,Y2", help="Detectar solo en esta región (píxeles del frame)")
+    parser.add_argument("--roi-output", action="store_true", help="Con --roi, anotar y codificar solo la región")
+    parser.add_argument("--max-memory", type=float, default=DEFAULT_MEMORY_CEILING_MB, metavar="MB",
+                        help=f"Memoria máxima de frames en vuelo (por defecto: {DEFAULT_MEMORY_CEILING_MB} MB)")
+    add_backend_arguments(parser)
+    args = parser.parse_args(argv)
+    roi = None
+    if args.roi:
+        try:
+            roi = {"box": parse_roi(args.roi), "crop_output": args.roi_output}
+        except ValueError as e:
+            parser.error(str(e))
+
+    try:
+        source = open_source(args.source, directory_fps=args.dir_fps)
+    except ValueError as e:
+        parser.error(str(e))
+    model = detector.load_model(args.model, warmup=True, **backend_options(args))
+    store = DetectionStore(unique_output_path(args.output_dir, f"{source.name}_detecciones", ext=""), names=model.names)
+    pipeline = StreamPipeline(model, source, args.output_dir, buffer_size=args.buffer, batch_size=args.batch_size,
+                              segment_seconds=args.segment, store=store, tracker=CellTracker() if args.track else None,
+                              annotator=Annotator(model.names, args.annotate), max_frames=args.max_frames,
+                              encoder_options={"codec": args.codec, "scale": args.scale}, roi=roi,
+                              max_memory_mb=args.max_memory)
+    print(f"Analizando '{args.source}' ({source.name}). Ctrl+C para detener.")
+    started = time.monotonic()
+    try:
+        pipeline.start()
+        while pipeline.running:
+            time.sleep(1.0)
+            if args.duration is not None and time.monotonic() - started >= args.duration:
+                break
+            print(f"[En vivo] {pipeline.summary()}")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        pipeline.close() # Espera a los hilos: el último segmento queda cerrado y completo
+        store.close()
+    print(f"[En vivo] {pipeline.summary()}")
+    if pipeline.error is not None:
+        print(f"Error: {pipeline.error}", file=sys.stderr)
+        return 1
+    print(f"{len(store)} detecciones en '{store.directory}'; {len(pipeline.segments)} segmento(s) de video.")
+    if args.track and len(store):
+        tracks_path = f"{store.directory}_trayectorias.csv"
+        save_track_statistics(track_statistics(store, pipeline.fps), tracks_path, store.names)
+        print(f"Trayectorias guardadas en: {tracks_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
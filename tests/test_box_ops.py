@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+from box_ops import nms, overlapping_pairs
+
+
+def random_boxes(rng, count, extent=300, max_side=40):
+    corners = rng.uniform(0, extent, (count, 2))
+    return np.hstack([corners, corners + rng.uniform(0, max_side, (count, 2))])
+
+
+def brute_force_pairs(boxes_a, boxes_b):
+    rows, cols = np.nonzero((boxes_b[None, :, 0] < boxes_a[:, None, 2]) & (boxes_b[None, :, 2] > boxes_a[:, None, 0]) &
+                            (boxes_b[None, :, 1] < boxes_a[:, None, 3]) & (boxes_b[None, :, 3] > boxes_a[:, None, 1]))
+    return set(zip(rows.tolist(), cols.tolist()))
+
+
+def greedy_nms(boxes, scores, iou_threshold):
+    """NMS de referencia, caja a caja."""
+    order = list(np.argsort(-scores, kind="stable"))
+    keep = []
+    while order:
+        best = order.pop(0)
+        keep.append(best)
+        order = [i for i in order if _iou(boxes[best], boxes[i]) <= iou_threshold]
+    return keep
+
+
+def _iou(a, b):
+    w = max(0.0, min(a[2], b[2]) - max(a[0], b[0]))
+    h = max(0.0, min(a[3], b[3]) - max(a[1], b[1]))
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - w * h
+    return w * h / max(union, 1e-9)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_overlapping_pairs_matches_brute_force(seed):
+    rng = np.random.default_rng(seed)
+    boxes_a = random_boxes(rng, 80, max_side=90)
+    boxes_b = random_boxes(rng, 120)
+    rows, cols = overlapping_pairs(boxes_a, boxes_b)
+    assert set(zip(rows.tolist(), cols.tolist())) == brute_force_pairs(boxes_a, boxes_b)
+    assert len(rows) == len(set(zip(rows.tolist(), cols.tolist())))
+
+
+def test_overlapping_pairs_empty():
+    rows, cols = overlapping_pairs(np.zeros((0, 4)), random_boxes(np.random.default_rng(0), 3))
+    assert len(rows) == len(cols) == 0
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_nms_matches_greedy_reference(seed):
+    rng = np.random.default_rng(seed)
+    boxes = random_boxes(rng, 200)
+    scores = rng.choice([0.2, 0.5, 0.9], len(boxes)) # Empates: se respeta el orden estable
+    assert nms(boxes, scores, 0.5).tolist() == greedy_nms(boxes, scores, 0.5)
+
+
+def test_nms_only_suppresses_within_a_class():
+    boxes = np.array([[0, 0, 10, 10], [1, 1, 10, 10], [0, 0, 10, 10]], dtype=np.float32)
+    scores = np.array([0.9, 0.8, 0.7])
+    assert nms(boxes, scores, 0.5).tolist() == [0]
+    assert nms(boxes, scores, 0.5, class_ids=[0, 0, 1]).tolist() == [0, 2]
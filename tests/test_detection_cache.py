@@ -0,0 +1,75 @@
+import os
+import types
+
+import numpy as np
+
+from detection_cache import DetectionCache
+
+
+def frame_boxes(*counts):
+    return [np.full((n, 6), i, dtype=np.float32) for i, n in enumerate(counts)]
+
+
+def make_file(path, content):
+    with open(path, "wb") as f:
+        f.write(content)
+    return str(path)
+
+
+def make_model(tmp_path, weights=b"pesos"):
+    return types.SimpleNamespace(ckpt_path=make_file(tmp_path / "w.pt", weights))
+
+
+def test_key_depends_on_content_weights_and_params(tmp_path):
+    cache = DetectionCache(str(tmp_path / "cache"))
+    video = make_file(tmp_path / "a.mp4", b"video")
+    model = make_model(tmp_path)
+    key = cache.key_for(video, model, {"conf": 0.25})
+    assert key == cache.key_for(video, model, {"conf": 0.25})
+    assert key != cache.key_for(video, model, {"conf": 0.5})
+    assert key.split("-")[0] == cache.key_for(make_file(tmp_path / "copia.mp4", b"video"), model, {"conf": 0.25}).split("-")[0]
+    os.utime(video, ns=(1, 1)) # Otro mtime invalida el memo, pero el contenido es el mismo
+    assert key == cache.key_for(video, model, {"conf": 0.25})
+    make_file(tmp_path / "a.mp4", b"otro video")
+    assert key != cache.key_for(video, model, {"conf": 0.25})
+    assert key != cache.key_for(video, make_model(tmp_path, b"otros pesos"), {"conf": 0.25})
+
+
+def test_put_get_round_trip(tmp_path):
+    cache = DetectionCache(str(tmp_path))
+    assert cache.get("nada") is None
+    cache.put("k", frame_boxes(2, 0, 3))
+    assert [len(b) for b in cache.get("k")] == [2, 0, 3]
+    assert cache.get("k")[2][0, 0] == 2
+
+
+def test_writer_commit_and_discard(tmp_path):
+    cache = DetectionCache(str(tmp_path))
+    writer = cache.writer("k")
+    for boxes in frame_boxes(1, 4, 0):
+        writer.append(boxes)
+    writer.commit()
+    assert [len(b) for b in cache.get("k")] == [1, 4, 0]
+    writer = cache.writer("parcial")
+    writer.append(frame_boxes(2)[0])
+    writer.discard()
+    assert cache.get("parcial") is None
+    assert not [name for name in os.listdir(str(tmp_path)) if name.endswith(".tmp")]
+
+
+def test_evict_removes_least_recently_used_and_prunes_memo(tmp_path):
+    cache = DetectionCache(str(tmp_path / "cache"), max_bytes=10 ** 9)
+    model = make_model(tmp_path)
+    keys = [cache.key_for(make_file(tmp_path / f"{i}.mp4", bytes([i])), model) for i in range(3)]
+    for i, key in enumerate(keys):
+        cache.put(key, frame_boxes(500))
+        path = cache._entry_path(key)
+        os.utime(path, ns=(i * 10 ** 9, i * 10 ** 9))
+    cache.get(keys[0]) # Uso reciente: pasa a ser la más nueva
+    cache.max_bytes = 2 * os.path.getsize(cache._entry_path(keys[0]))
+    cache.evict()
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[0]) is not None and cache.get(keys[2]) is not None
+    hashes = {entry[2] for entry in cache._load_hash_memo().values()}
+    assert keys[1].split("-")[0] not in hashes
+    assert keys[0].split("-")[0] in hashes
@@ -0,0 +1,57 @@
+import csv
+
+import numpy as np
+import pytest
+
+from detection_store import DetectionStore
+
+
+def boxes(count, frame):
+    rows = np.zeros((count, 6), dtype=np.float32)
+    rows[:, :4] = [frame, frame, frame + 10, frame + 10]
+    rows[:, 4] = 0.5
+    rows[:, 5] = frame % 2
+    return rows
+
+
+def filled_store(directory, frames=50, per_frame=7, capacity=4):
+    store = DetectionStore(str(directory), names={0: "cell", 1: "rbc"}, capacity=capacity)
+    for frame in range(frames):
+        store.append(frame, boxes(per_frame, frame), np.arange(per_frame))
+    return store
+
+
+def test_store_grows_past_initial_capacity_and_reopens(tmp_path):
+    store = filled_store(tmp_path / "s")
+    store.append(50, np.zeros((0, 6), np.float32)) # Frame sin detecciones
+    assert len(store) == 350
+    assert store.num_frames == 51
+    store.close()
+    reopened = DetectionStore.open(str(tmp_path / "s"))
+    assert len(reopened) == 350
+    assert reopened.column("frame_idx")[-1] == 49
+    assert reopened.column("xyxy")[7].tolist() == [1, 1, 11, 11]
+    assert reopened.frame_counts().tolist() == [7] * 50 + [0]
+    assert reopened.num_tracks() == 7
+    with pytest.raises(IOError):
+        reopened.append(51, boxes(1, 51))
+
+
+def test_frame_counts_per_class(tmp_path):
+    store = filled_store(tmp_path / "s", frames=4, per_frame=2)
+    assert store.frame_counts(per_class=True).tolist() == [[2, 0], [0, 2], [2, 0], [0, 2]]
+    assert store.class_names_found() == ["cell", "rbc"]
+
+
+def test_export_csv_and_npz(tmp_path):
+    store = filled_store(tmp_path / "s", frames=3, per_frame=2)
+    store.export(str(tmp_path / "d.csv"))
+    with open(tmp_path / "d.csv", newline="", encoding="utf-8") as f:
+        rows = list(csv.reader(f))
+    assert rows[0] == ["frame", "class_id", "class_name", "conf", "x1", "y1", "x2", "y2", "track_id"]
+    assert rows[3] == ["1", "1", "rbc", "0.5", "1.0", "1.0", "11.0", "11.0", "0"]
+    store.export(str(tmp_path / "d.npz"))
+    with np.load(tmp_path / "d.npz") as data:
+        assert data["frame_idx"].tolist() == [0, 0, 1, 1, 2, 2]
+    with pytest.raises(ValueError):
+        store.export(str(tmp_path / "d.xlsx"))
@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+
+from frame_pool import DEFAULT_MEMORY_CEILING_MB, FramePool, frames_for_budget, plan_frame_pool
+
+FULL_HD = (1080, 1920, 3)
+UHD = (2160, 3840, 3)
+GUI_BATCH_SIZE = 8 # main.BATCH_SIZE
+
+
+def test_frames_for_budget_clamps_to_maximum():
+    assert frames_for_budget((100, 100, 3), 100, minimum=2, maximum=10) == 10
+
+
+def test_frames_for_budget_rejects_ceiling_below_minimum():
+    with pytest.raises(ValueError):
+        frames_for_budget(FULL_HD, 10, minimum=4, maximum=10)
+
+
+@pytest.mark.parametrize("shape, stride", [(FULL_HD, 1), (FULL_HD, 20), (FULL_HD, 30), (UHD, 5), (UHD, 30)])
+def test_plan_frame_pool_fits_default_ceiling(shape, stride):
+    count, batch = plan_frame_pool(shape, DEFAULT_MEMORY_CEILING_MB, GUI_BATCH_SIZE, stride)
+    assert 1 <= batch <= GUI_BATCH_SIZE
+    assert count >= batch * stride + 2 # Lo que retiene la inferencia, más decodificación y anotado
+    assert count * np.prod(shape) <= DEFAULT_MEMORY_CEILING_MB * 2 ** 20
+
+
+def test_plan_frame_pool_keeps_full_batch_when_it_fits():
+    count, batch = plan_frame_pool((240, 320, 3), DEFAULT_MEMORY_CEILING_MB, GUI_BATCH_SIZE, stride=3, queued=10)
+    assert batch == GUI_BATCH_SIZE
+    assert count == GUI_BATCH_SIZE * 3 + 2 + 10
+
+
+def test_plan_frame_pool_reduces_batch_for_1080p_stride_30():
+    count, batch = plan_frame_pool(FULL_HD, DEFAULT_MEMORY_CEILING_MB, GUI_BATCH_SIZE, stride=30)
+    assert batch < GUI_BATCH_SIZE
+    assert count >= batch * 30 + 2
+
+
+def test_pool_recycles_buffers_and_counts_views():
+    pool = FramePool((4, 4, 3), 2)
+    a = pool.acquire()
+    b = pool.acquire()
+    assert pool.acquire(timeout=0.01) is None
+    pool.retain(a[1:2]) # Una vista cuenta como el buffer
+    pool.release(a)
+    assert pool.in_use == 2
+    pool.release(a[0:1])
+    pool.release(b)
+    assert pool.in_use == 0
+    pool.release(np.zeros(3)) # Ajeno al pool: se ignora
+    assert pool.acquire(timeout=0.01) is not None
+
+
+def test_closed_pool_wakes_waiters():
+    pool = FramePool((2, 2), 1)
+    pool.acquire()
+    pool.close()
+    assert pool.acquire(timeout=1) is None
@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+from frame_skip import KeyframeSelector, SkipStats, interpolate_boxes, match_f1
+
+
+def boxes(*rows):
+    return np.array(rows, dtype=np.float32).reshape(-1, 6)
+
+
+def test_selector_detects_every_stride_frames():
+    selector = KeyframeSelector(stride=3)
+    frame = np.zeros((8, 8, 3), np.uint8)
+    assert [selector.is_key(frame) for _ in range(7)] == [True, False, False, True, False, False, True]
+
+
+def test_selector_detects_on_motion():
+    selector = KeyframeSelector(stride=10, motion_threshold=5)
+    still = np.zeros((64, 64, 3), np.uint8)
+    assert selector.is_key(still)
+    assert not selector.is_key(still)
+    assert selector.is_key(np.full_like(still, 200))
+
+
+def test_interpolation_moves_matched_boxes_linearly():
+    start = boxes([0, 0, 10, 10, 0.8, 0])
+    end = boxes([4, 2, 14, 12, 0.6, 0])
+    middle = interpolate_boxes(start, end, 0.5)
+    assert middle[0, :4].tolist() == pytest.approx([2, 1, 12, 11])
+    assert middle[0, 4] == pytest.approx(0.7)
+
+
+def test_interpolation_of_unmatched_boxes_keeps_nearest_keyframe():
+    start = boxes([0, 0, 10, 10, 0.9, 0])
+    end = boxes([100, 100, 110, 110, 0.9, 1])
+    assert interpolate_boxes(start, end, 0.2)[:, 5].tolist() == [0]
+    assert interpolate_boxes(start, end, 0.8)[:, 5].tolist() == [1]
+
+
+def test_match_f1():
+    reference = boxes([0, 0, 10, 10, 0.9, 0], [20, 20, 30, 30, 0.9, 0])
+    assert match_f1(reference, reference) == pytest.approx(1.0)
+    assert match_f1(reference, reference[:1]) == pytest.approx(2 / 3)
+    assert match_f1(boxes(), boxes()) == pytest.approx(1.0)
+
+
+def test_speedup_counts_audit_inferences():
+    stats = SkipStats()
+    stats.frames, stats.inferred, stats.audited = 100, 20, 5
+    assert stats.speedup == pytest.approx(4.0)
+    assert stats.as_dict()["speedup"] == 4.0
@@ -0,0 +1,26 @@
+import numpy as np
+import pytest
+
+from box_ops import clamp_roi, parse_roi, translate_boxes
+
+
+def test_parse_roi():
+    assert parse_roi("10, 20,300,400") == (10, 20, 300, 400)
+    with pytest.raises(ValueError):
+        parse_roi("10,20,300")
+    with pytest.raises(ValueError):
+        parse_roi("a,b,c,d")
+
+
+def test_clamp_roi_orders_corners_and_clips_to_frame():
+    assert clamp_roi((300.4, 400, 10, -5), 320, 240) == (10, 0, 300, 240)
+
+
+def test_clamp_roi_rejects_regions_outside_the_frame():
+    with pytest.raises(ValueError):
+        clamp_roi((400, 10, 500, 100), 320, 240)
+
+
+def test_translate_boxes_keeps_conf_and_class():
+    moved = translate_boxes(np.array([[10, 20, 30, 40, 0.9, 1]], dtype=np.float32), -10, -20)
+    assert moved.tolist() == [[0, 0, 20, 20, pytest.approx(0.9), 1]]
@@ -0,0 +1,50 @@
+import cv2
+import numpy as np
+import pytest
+
+from tiling import TileReader, _check_decoded_size, merge_tile_boxes, tile_cores, tile_grid
+
+
+@pytest.mark.parametrize("width, height, tile_size, overlap", [(2000, 1500, 640, 0.2), (640, 480, 640, 0.2),
+                                                               (1283, 977, 256, 0.1), (1000, 1000, 300, 0.7)])
+def test_grid_covers_image_and_cores_are_exclusive(width, height, tile_size, overlap):
+    windows = tile_grid(width, height, tile_size, overlap)
+    coverage = np.zeros((height, width), dtype=np.int32)
+    for x0, y0, x1, y1 in windows:
+        coverage[y0:y1, x0:x1] += 1
+    assert coverage.min() >= 1
+    core_area = 0
+    for x0, y0, x1, y1 in tile_cores(windows):
+        if x1 > x0 and y1 > y0:
+            assert (coverage[y0:y1, x0:x1] == 1).all()
+            core_area += (x1 - x0) * (y1 - y0)
+    assert core_area == (coverage == 1).sum()
+
+
+def test_merge_keeps_core_boxes_and_merges_duplicates_in_overlap():
+    boxes = np.array([[10, 10, 20, 20, 0.9, 0], # Núcleo
+                      [600, 10, 620, 30, 0.8, 0], # Franja de solape, vista por dos teselas
+                      [601, 10, 620, 30, 0.7, 0],
+                      [605, 12, 618, 28, 0.6, 1]], dtype=np.float32) # Otra clase
+    in_core = np.array([True, False, False, False])
+    merged = merge_tile_boxes(boxes, 0.5, in_core)
+    assert merged[:, 4].tolist() == pytest.approx([0.9, 0.8, 0.6])
+
+
+def test_merge_empty():
+    assert len(merge_tile_boxes(np.zeros((0, 6), np.float32))) == 0
+
+
+def test_reader_decodes_small_png(tmp_path):
+    path = str(tmp_path / "a.png")
+    cv2.imwrite(path, np.full((30, 40, 3), 7, np.uint8))
+    reader = TileReader(path)
+    assert (reader.width, reader.height, reader.memory_mapped) == (40, 30, False)
+    assert reader.read(0, 0, 10, 5).shape == (5, 10, 3)
+
+
+def test_large_non_tiff_is_rejected_before_decoding(tmp_path):
+    path = str(tmp_path / "a.png")
+    cv2.imwrite(path, np.zeros((600, 800, 3), np.uint8))
+    with pytest.raises(IOError, match="TIFF sin comprimir"):
+        _check_decoded_size(path, max_mb=1)
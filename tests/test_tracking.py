@@ -0,0 +1,54 @@
+import numpy as np
+
+from detection_store import DetectionStore
+from tracking import CellTracker, associate, track_statistics, trajectories
+
+
+def cell(x, y, cls=0, size=10):
+    return [x, y, x + size, y + size, 0.9, cls]
+
+
+def test_associate_unique_and_ambiguous_pairs():
+    tracks = np.array([cell(0, 0), cell(100, 0), cell(104, 0)], dtype=np.float32)
+    detections = np.array([cell(1, 0), cell(103, 0), cell(101, 0)], dtype=np.float32)
+    rows, cols = associate(tracks, detections)
+    assert dict(zip(rows.tolist(), cols.tolist())) == {0: 0, 1: 2, 2: 1}
+
+
+def test_associate_ignores_other_classes_and_low_iou():
+    tracks = np.array([cell(0, 0, cls=0), cell(50, 50)], dtype=np.float32)
+    detections = np.array([cell(0, 0, cls=1), cell(58, 58)], dtype=np.float32)
+    rows, cols = associate(tracks, detections)
+    assert len(rows) == len(cols) == 0
+
+
+def test_tracker_keeps_ids_for_moving_cells():
+    tracker = CellTracker()
+    first = tracker.update(np.array([cell(0, 0), cell(200, 200)], dtype=np.float32))
+    for step in range(1, 6):
+        ids = tracker.update(np.array([cell(200 - 2 * step, 200), cell(3 * step, 0)], dtype=np.float32))
+    assert ids.tolist() == first[::-1].tolist()
+
+
+def test_tracker_closes_lost_tracks_after_max_age():
+    tracker = CellTracker(max_age=2)
+    old = tracker.update(np.array([cell(0, 0)], dtype=np.float32))
+    for _ in range(3):
+        tracker.update(np.zeros((0, 6), np.float32))
+    assert len(tracker) == 0
+    assert tracker.update(np.array([cell(0, 0)], dtype=np.float32))[0] != old[0]
+
+
+def test_track_statistics_and_trajectories(tmp_path):
+    store = DetectionStore(str(tmp_path / "store"))
+    for frame in range(4):
+        store.append(frame, np.array([cell(3 * frame, 0), cell(50, 4 * frame)], dtype=np.float32),
+                     np.array([7, 9]))
+    store.append(4, np.array([cell(0, 90)], dtype=np.float32)) # Sin seguir: no cuenta
+    stats = track_statistics(store, fps=10)
+    assert stats["track_id"].tolist() == [7, 9]
+    assert stats["detections"].tolist() == [4, 4]
+    assert stats["path_length_px"].tolist() == [9.0, 12.0]
+    assert stats["mean_speed_px_s"].tolist() == [30.0, 40.0]
+    paths = trajectories(store)
+    assert paths[9][:, 2].tolist() == [5.0, 9.0, 13.0, 17.0]
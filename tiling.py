@@ -0,0 +1,242 @@
+"""Inferencia por teselas para imágenes muy grandes (escaneos de portaobjetos).
+
+Pasar la imagen completa a model.predict la reduce al tamaño de entrada del modelo y las
+células pequeñas desaparecen. Aquí la imagen se recorre en teselas solapadas a resolución
+nativa, las teselas se pasan al modelo por lotes mientras un hilo lee las siguientes, y las
+cajas de teselas vecinas se fusionan con NMS en coordenadas de la imagen completa. Solo puede
+haber cajas repetidas en las franjas de solape: las que caen enteras en el núcleo exclusivo
+de su tesela (tile_cores) se conservan sin pasar por el NMS.
+
+La memoria solo queda acotada con TIFF sin comprimir: se mapean en memoria con tifffile, así
+que solo se lee del disco lo que ocupa cada tesela. El resto de formatos (PNG, JPEG, TIFF
+comprimido) no permite leer por regiones y se decodifica una vez completo; por encima de
+MAX_DECODED_MB se rechaza con un error que pide convertir la imagen a TIFF sin comprimir.
+"""
+import math
+import os
+import queue
+import threading
+import cv2
+import numpy as np
+from box_ops import nms, scale_boxes
+from detection_cache import boxes_array
+
+DEFAULT_TILE_SIZE = 640 # Lado de cada tesela en píxeles de la imagen original
+DEFAULT_TILE_OVERLAP = 0.2 # Fracción de solape entre teselas vecinas
+DEFAULT_TILE_BATCH = 8 # Teselas por llamada a model.predict
+DEFAULT_MERGE_IOU = 0.5 # IoU a partir del cual dos cajas de teselas vecinas se consideran la misma
+OVERVIEW_MAX_SIDE = 2048 # Lado máximo de la vista general reducida
+LARGE_FILE_BYTES = 64 * 1024 ** 2 # Por encima de esto la vista previa se decodifica ya reducida
+MAX_DECODED_MB = 1024 # Máximo que se decodifica completo cuando la imagen no se puede mapear en memoria
+
+_TILE_QUEUE_BATCHES = 2 # Lotes de teselas leídos por adelantado (acota la memoria)
+
+
+def tile_grid(width, height, tile_size=DEFAULT_TILE_SIZE, overlap=DEFAULT_TILE_OVERLAP):
+    """Ventanas (x0, y0, x1, y1) que cubren la imagen; la última de cada fila/columna se alinea al borde."""
+    stride = max(1, int(tile_size * (1 - overlap)))
+
+    def starts(length):
+        if length <= tile_size:
+            return [0]
+        return list(range(0, length - tile_size, stride)) + [length - tile_size]
+
+    return [(x, y, min(x + tile_size, width), min(y + tile_size, height))
+            for y in starts(height) for x in starts(width)]
+
+
+def tile_cores(windows):
+    """Núcleo (x0, y0, x1, y1) de cada ventana de tile_grid: la parte que no cubre ninguna otra.
+
+    Con solape de más de la mitad el núcleo puede quedar vacío (x1 <= x0 o y1 <= y0).
+    """
+    def exclusive(spans):
+        spans = sorted(set(spans))
+        cores = {}
+        for i, (start, end) in enumerate(spans):
+            cores[(start, end)] = (spans[i - 1][1] if i > 0 else start, spans[i + 1][0] if i + 1 < len(spans) else end)
+        return cores
+
+    x_cores = exclusive((x0, x1) for x0, _, x1, _ in windows)
+    y_cores = exclusive((y0, y1) for _, y0, _, y1 in windows)
+    return [(x_cores[(x0, x1)][0], y_cores[(y0, y1)][0], x_cores[(x0, x1)][1], y_cores[(y0, y1)][1])
+            for x0, y0, x1, y1 in windows]
+
+
+def _to_bgr(pixels, rgb):
+    """Convierte una región leída (gris, RGB(A), 8 o 16 bits) a BGR uint8 contiguo."""
+    if pixels.dtype == np.uint16:
+        pixels = (pixels >> 8).astype(np.uint8)
+    elif pixels.dtype != np.uint8:
+        pixels = np.clip(pixels * 255 if pixels.max() <= 1 else pixels, 0, 255).astype(np.uint8)
+    if pixels.ndim == 2:
+        return cv2.cvtColor(pixels, cv2.COLOR_GRAY2BGR)
+    if pixels.shape[2] == 4:
+        return cv2.cvtColor(pixels, cv2.COLOR_RGBA2BGR if rgb else cv2.COLOR_BGRA2BGR)
+    if rgb:
+        return cv2.cvtColor(pixels, cv2.COLOR_RGB2BGR)
+    return np.ascontiguousarray(pixels)
+
+
+def _check_decoded_size(path, max_mb=MAX_DECODED_MB):
+    """Lanza IOError si decodificar path completo (BGR) ocuparía más de max_mb. Solo lee la cabecera."""
+    from PIL import Image
+    try:
+        with Image.open(path) as image:
+            width, height = image.size
+    except Image.DecompressionBombError: # PIL ya la considera enorme (cientos de megapíxeles)
+        width = height = None
+    except OSError:
+        return # Formato que PIL no conoce: que lo intente OpenCV
+    if width is not None and width * height * 3 <= max_mb * 2 ** 20:
+        return
+    size = f"{width}x{height} " if width is not None else ""
+    raise IOError(f"La imagen {size}{path} ocuparía más de {max_mb} MB decodificada completa. Solo los TIFF sin "
+                  "comprimir se leen por teselas sin cargarla entera: conviértela a TIFF sin comprimir.")
+
+
+class TileReader:
+    """Lee regiones de una imagen, mapeada en memoria cuando el formato lo permite."""
+
+    def __init__(self, path):
+        self.path = path
+        self.memory_mapped = False
+        self._pixels = None
+        self._rgb = False
+        if os.path.splitext(path)[1].lower() in (".tif", ".tiff"):
+            try:
+                import tifffile # Opcional: solo para mapear TIFF grandes en memoria
+                pixels = tifffile.memmap(path, mode="r")
+                if pixels.ndim == 3 and pixels.shape[0] in (3, 4) and pixels.shape[2] not in (3, 4):
+                    pixels = pixels.transpose(1, 2, 0) # Planos de color separados
+                self._pixels, self._rgb, self.memory_mapped = pixels, True, True
+            except (ImportError, ValueError, OSError):
+                pass # Comprimido o sin tifffile: decodificar completo
+        if self._pixels is None:
+            _check_decoded_size(path)
+            self._pixels = cv2.imread(path, cv2.IMREAD_COLOR)
+            if self._pixels is None:
+                raise IOError(f"No se pudo leer la imagen: {path}")
+        self.height, self.width = self._pixels.shape[:2]
+
+    def read(self, x0, y0, x1, y1):
+        return _to_bgr(np.asarray(self._pixels[y0:y1, x0:x1]), self._rgb)
+
+    def overview(self, max_side=OVERVIEW_MAX_SIDE):
+        """Vista general reducida. Devuelve (imagen_bgr, escala) con escala = lado_vista / lado_original."""
+        step = max(1, math.ceil(max(self.width, self.height) / max_side))
+        view = _to_bgr(np.asarray(self._pixels[::step, ::step]), self._rgb) # Submuestreo: lee solo 1 de cada step filas
+        scale = min(max_side / self.width, max_side / self.height, 1.0)
+        size = (max(1, round(self.width * scale)), max(1, round(self.height * scale)))
+        if (view.shape[1], view.shape[0]) != size:
+            view = cv2.resize(view, size, interpolation=cv2.INTER_AREA)
+        return view, scale
+
+    def close(self):
+        self._pixels = None
+
+
+def read_overview(path, max_side=OVERVIEW_MAX_SIDE):
+    """Vista general de una imagen sin decodificarla completa cuando es posible. Devuelve (imagen_bgr, escala)."""
+    ext = os.path.splitext(path)[1].lower()
+    if ext in (".tif", ".tiff") or os.path.getsize(path) <= LARGE_FILE_BYTES:
+        reader = TileReader(path)
+        try:
+            return reader.overview(max_side)
+        finally:
+            reader.close()
+    # JPEG/PNG grandes: el decodificador reduce a 1/8 directamente
+    view = cv2.imread(path, cv2.IMREAD_REDUCED_COLOR_8)
+    if view is None:
+        raise IOError(f"No se pudo leer la imagen: {path}")
+    reduced_scale = min(max_side / view.shape[1], max_side / view.shape[0], 1.0)
+    if reduced_scale < 1.0:
+        view = cv2.resize(view, (max(1, round(view.shape[1] * reduced_scale)), max(1, round(view.shape[0] * reduced_scale))),
+                          interpolation=cv2.INTER_AREA)
+    return view, reduced_scale / 8
+
+
+def merge_tile_boxes(boxes, iou_threshold=DEFAULT_MERGE_IOU, in_core=None):
+    """Fusiona las cajas repetidas en zonas de solape (NMS por clase), de mayor a menor score.
+
+    in_core marca las cajas que están enteras en el núcleo de su tesela: ninguna otra tesela
+    las ve y las repetidas dentro de una tesela ya las quitó el NMS del modelo, así que se
+    conservan sin pasar por este.
+    """
+    if len(boxes) == 0:
+        return boxes
+    if in_core is None:
+        in_core = np.zeros(len(boxes), dtype=bool)
+    edge = np.flatnonzero(~in_core)
+    keep = edge[nms(boxes[edge, :4], boxes[edge, 4], iou_threshold, class_ids=boxes[edge, 5])]
+    merged = boxes[np.concatenate([np.flatnonzero(in_core), keep])]
+    return merged[np.argsort(-merged[:, 4], kind="stable")]
+
+
+def detect_tiled(model, path, tile_size=DEFAULT_TILE_SIZE, overlap=DEFAULT_TILE_OVERLAP, batch_size=DEFAULT_TILE_BATCH,
+                 merge_iou=DEFAULT_MERGE_IOU, predict_args=None, overview_max_side=OVERVIEW_MAX_SIDE):
+    """Detecta sobre la imagen completa por teselas.
+
+    Devuelve (cajas, vista_general, escala): cajas (N, 6) en coordenadas de la imagen original y
+    una vista general reducida con su escala, para mostrar el resultado.
+    """
+    reader = TileReader(path)
+    windows = tile_grid(reader.width, reader.height, tile_size, overlap)
+    cores = dict(zip(windows, tile_cores(windows)))
+    batches = queue.Queue(maxsize=_TILE_QUEUE_BATCHES)
+    stop = threading.Event()
+    read_error = []
+
+    def produce():
+        try:
+            for i in range(0, len(windows), batch_size):
+                batch_windows = windows[i:i + batch_size]
+                pixels = [reader.read(*window) for window in batch_windows]
+                while not stop.is_set():
+                    try:
+                        batches.put((batch_windows, pixels), timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+                if stop.is_set():
+                    return
+        except Exception as e:
+            read_error.append(e)
+        finally:
+            batches.put(None)
+
+    reader_thread = threading.Thread(target=produce, name="tile-reader", daemon=True)
+    reader_thread.start()
+    tile_boxes = []
+    tile_in_core = []
+    try:
+        while True:
+            item = batches.get()
+            if item is None:
+                break
+            batch_windows, pixels = item
+            results = model.predict(source=pixels, verbose=False, **(predict_args or {}))
+            for window, result in zip(batch_windows, results):
+                boxes = boxes_array(result).copy()
+                boxes[:, [0, 2]] += window[0]
+                boxes[:, [1, 3]] += window[1]
+                core_x0, core_y0, core_x1, core_y1 = cores[window]
+                tile_boxes.append(boxes)
+                tile_in_core.append((boxes[:, 0] >= core_x0) & (boxes[:, 1] >= core_y0) &
+                                    (boxes[:, 2] <= core_x1) & (boxes[:, 3] <= core_y1))
+        if read_error:
+            raise read_error[0]
+        if tile_boxes:
+            boxes = merge_tile_boxes(np.concatenate(tile_boxes), merge_iou, np.concatenate(tile_in_core))
+        else:
+            boxes = np.zeros((0, 6), np.float32)
+        overview, scale = reader.overview(overview_max_side)
+        return boxes, overview, scale
+    finally:
+        stop.set()
+        while reader_thread.is_alive(): # Desbloquear al lector si quedó esperando sitio en la cola
+            try:
+                batches.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        reader.close()
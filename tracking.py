@@ -0,0 +1,234 @@
+"""Seguimiento de células entre frames con identificadores persistentes.
+
+CellTracker mantiene un filtro de Kalman de velocidad constante por pista (centro, ancho y
+alto, y sus velocidades) con todas las pistas apiladas en arrays, de modo que predecir y
+corregir son operaciones matriciales por lotes sin bucles por objeto. La asociación usa IoU
+(misma clase) entre las cajas predichas y las detecciones:
+
+- las parejas candidatas salen de un barrido por franjas y x (box_ops.overlapping_pairs), sin
+  matriz completa de IoU entre miles de pistas y detecciones;
+- las parejas sin ambigüedad (una única candidata por pista y por detección), que son la gran
+  mayoría con células que se mueven poco, se asignan directamente;
+- solo el resto pasa por el algoritmo húngaro de scipy (linear_sum_assignment).
+
+Las trayectorias no se guardan aparte: cada detección lleva su track_id en el DetectionStore,
+y track_statistics calcula duración, recorrido y velocidades a partir de esas columnas.
+"""
+import csv
+import numpy as np
+from box_ops import overlapping_pairs, paired_iou
+
+TRACK_MIN_IOU = 0.3 # IoU mínima entre la caja predicha de una pista y una detección
+TRACK_MAX_AGE = 10 # Frames que una pista sobrevive sin detecciones antes de cerrarse
+
+_STD_POSITION = 1 / 20 # Desviaciones del filtro, relativas al tamaño de la caja (como en DeepSORT)
+_STD_VELOCITY = 1 / 160
+
+_TRANSITION = np.eye(8)
+_TRANSITION[:4, 4:] = np.eye(4) # Posición += velocidad en cada frame
+
+
+def _xyxy_to_cxcywh(boxes):
+    wh = boxes[:, 2:4] - boxes[:, :2]
+    return np.concatenate([boxes[:, :2] + wh / 2, wh], axis=1)
+
+
+def _cxcywh_to_xyxy(state):
+    half = state[:, 2:4] / 2
+    return np.concatenate([state[:, :2] - half, state[:, :2] + half], axis=1)
+
+
+def _box_scale(measurements):
+    """Tamaño de referencia de cada caja para escalar el ruido del filtro."""
+    return np.maximum(measurements[:, 2:4].max(axis=1), 1.0)
+
+
+def associate(track_boxes, det_boxes, min_iou=TRACK_MIN_IOU):
+    """Empareja pistas y detecciones, ambas (N, 6) con la clase en la columna 5. Devuelve (filas, columnas)."""
+    empty = np.zeros(0, dtype=np.int64)
+    if len(track_boxes) == 0 or len(det_boxes) == 0:
+        return empty, empty
+    rows, cols = overlapping_pairs(track_boxes, det_boxes)
+    ious = paired_iou(track_boxes[rows, :4], det_boxes[cols, :4])
+    keep = (ious >= min_iou) & (track_boxes[rows, 5] == det_boxes[cols, 5])
+    rows, cols, ious = rows[keep], cols[keep], ious[keep]
+    if len(rows) == 0:
+        return empty, empty
+
+    row_degree = np.bincount(rows, minlength=len(track_boxes))
+    col_degree = np.bincount(cols, minlength=len(det_boxes))
+    unique = (row_degree[rows] == 1) & (col_degree[cols] == 1)
+    matched_rows, matched_cols = [rows[unique]], [cols[unique]]
+
+    if not unique.all():
+        from scipy.optimize import linear_sum_assignment # Import diferido: ~0.5 s que no deben frenar el arranque
+        # Subproblema ambiguo: coste 1 - IoU entre las pistas y detecciones implicadas
+        amb_rows, amb_cols, amb_ious = rows[~unique], cols[~unique], ious[~unique]
+        row_ids, row_pos = np.unique(amb_rows, return_inverse=True)
+        col_ids, col_pos = np.unique(amb_cols, return_inverse=True)
+        cost = np.ones((len(row_ids), len(col_ids)), dtype=np.float32)
+        cost[row_pos, col_pos] = 1 - amb_ious
+        r, c = linear_sum_assignment(cost)
+        valid = cost[r, c] <= 1 - min_iou
+        matched_rows.append(row_ids[r[valid]])
+        matched_cols.append(col_ids[c[valid]])
+    return np.concatenate(matched_rows), np.concatenate(matched_cols)
+
+
+class CellTracker:
+    """Asigna un track_id persistente a cada detección, frame a frame."""
+
+    def __init__(self, min_iou=TRACK_MIN_IOU, max_age=TRACK_MAX_AGE):
+        self.min_iou = min_iou
+        self.max_age = max_age
+        self.mean = np.zeros((0, 8)) # Estado por pista: cx, cy, w, h y sus velocidades
+        self.covariance = np.zeros((0, 8, 8))
+        self.track_ids = np.zeros(0, dtype=np.int64)
+        self.classes = np.zeros(0, dtype=np.float32)
+        self.misses = np.zeros(0, dtype=np.int64) # Frames seguidos sin detección
+        self.next_id = 0
+
+    def __len__(self):
+        return len(self.track_ids)
+
+    def predicted_boxes(self):
+        """Cajas (N, 6) predichas para las pistas activas (conf 0)."""
+        boxes = np.zeros((len(self), 6), dtype=np.float32)
+        boxes[:, :4] = _cxcywh_to_xyxy(self.mean)
+        boxes[:, 5] = self.classes
+        return boxes
+
+    def update(self, boxes):
+        """Avanza un frame con sus detecciones (N, 6). Devuelve los track_id (N,) alineados con boxes."""
+        boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 6)
+        self._predict()
+        rows, cols = associate(self.predicted_boxes(), boxes, self.min_iou)
+        ids = np.full(len(boxes), -1, dtype=np.int64)
+        ids[cols] = self.track_ids[rows]
+        if len(rows):
+            self._correct(rows, _xyxy_to_cxcywh(boxes[cols, :4].astype(np.float64)))
+        self.misses += 1
+        self.misses[rows] = 0
+
+        alive = self.misses <= self.max_age
+        if not alive.all():
+            self._keep(alive)
+        new = ids == -1
+        if new.any():
+            ids[new] = self._start_tracks(boxes[new])
+        return ids
+
+    def _predict(self):
+        if not len(self):
+            return
+        scale = _box_scale(self.mean)
+        std = np.concatenate([np.repeat((_STD_POSITION * scale)[:, None], 4, axis=1),
+                              np.repeat((_STD_VELOCITY * scale)[:, None], 4, axis=1)], axis=1)
+        self.mean = self.mean @ _TRANSITION.T
+        self.covariance = _TRANSITION @ self.covariance @ _TRANSITION.T
+        self.covariance[:, np.arange(8), np.arange(8)] += std ** 2
+
+    def _correct(self, rows, measurements):
+        """Corrección de Kalman por lotes de las pistas rows con sus medidas (cx, cy, w, h)."""
+        mean, covariance = self.mean[rows], self.covariance[rows]
+        noise = (_STD_POSITION * _box_scale(measurements)) ** 2
+        innovation_cov = covariance[:, :4, :4].copy()
+        innovation_cov[:, np.arange(4), np.arange(4)] += noise[:, None]
+        # K = P H^T S^-1; como S es simétrica, K^T = S^-1 H P
+        gain = np.linalg.solve(innovation_cov, covariance[:, :4, :]).transpose(0, 2, 1)
+        innovation = measurements - mean[:, :4]
+        self.mean[rows] = mean + np.einsum("nij,nj->ni", gain, innovation)
+        self.covariance[rows] = covariance - gain @ covariance[:, :4, :]
+
+    def _start_tracks(self, boxes):
+        n = len(boxes)
+        measurements = _xyxy_to_cxcywh(boxes[:, :4].astype(np.float64))
+        scale = _box_scale(measurements)
+        std = np.concatenate([np.repeat((2 * _STD_POSITION * scale)[:, None], 4, axis=1),
+                              np.repeat((10 * _STD_VELOCITY * scale)[:, None], 4, axis=1)], axis=1)
+        covariance = np.zeros((n, 8, 8))
+        covariance[:, np.arange(8), np.arange(8)] = std ** 2
+        ids = np.arange(self.next_id, self.next_id + n, dtype=np.int64)
+        self.next_id += n
+        self.mean = np.concatenate([self.mean, np.concatenate([measurements, np.zeros((n, 4))], axis=1)])
+        self.covariance = np.concatenate([self.covariance, covariance])
+        self.track_ids = np.concatenate([self.track_ids, ids])
+        self.classes = np.concatenate([self.classes, boxes[:, 5]])
+        self.misses = np.concatenate([self.misses, np.zeros(n, dtype=np.int64)])
+        return ids
+
+    def _keep(self, mask):
+        self.mean = self.mean[mask]
+        self.covariance = self.covariance[mask]
+        self.track_ids = self.track_ids[mask]
+        self.classes = self.classes[mask]
+        self.misses = self.misses[mask]
+
+
+def track_statistics(store, fps=30):
+    """Estadísticas por pista a partir de las columnas de un DetectionStore. Devuelve un dict de arrays.
+
+    Claves: track_id, class_id, first_frame, last_frame, detections, lifetime_s,
+    path_length_px, net_displacement_px, mean_speed_px_s y max_speed_px_s.
+    """
+    track_ids = store.column("track_id")
+    tracked = np.flatnonzero(track_ids >= 0)
+    if len(tracked) == 0:
+        return {key: np.zeros(0) for key in ("track_id", "class_id", "first_frame", "last_frame", "detections",
+                                             "lifetime_s", "path_length_px", "net_displacement_px",
+                                             "mean_speed_px_s", "max_speed_px_s")}
+    fps = fps if fps > 0 else 30
+    ids = track_ids[tracked]
+    frames = store.column("frame_idx")[tracked]
+    order = np.lexsort((frames, ids)) # Por pista y, dentro de cada una, por frame
+    ids, frames = ids[order], frames[order].astype(np.int64)
+    xyxy = store.column("xyxy")[tracked[order]].astype(np.float64)
+    centers = (xyxy[:, :2] + xyxy[:, 2:]) / 2
+
+    starts = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]])
+    ends = np.r_[starts[1:], len(ids)] - 1
+    steps = np.linalg.norm(np.diff(centers, axis=0), axis=1)
+    same_track = ids[1:] == ids[:-1]
+    steps[~same_track] = 0
+    step_speed = np.where(same_track, steps / np.maximum(np.diff(frames), 1) * fps, 0)
+    # Los pasos entre pistas distintas valen 0, así que reduceat puede sumar desde cada inicio hasta el siguiente
+    path_length = np.add.reduceat(np.r_[steps, 0], starts)
+    lifetime_s = (frames[ends] - frames[starts]) / fps
+    return {
+        "track_id": ids[starts],
+        "class_id": store.column("class_id")[tracked[order]][starts],
+        "first_frame": frames[starts],
+        "last_frame": frames[ends],
+        "detections": ends - starts + 1,
+        "lifetime_s": lifetime_s,
+        "path_length_px": path_length,
+        "net_displacement_px": np.linalg.norm(centers[ends] - centers[starts], axis=1),
+        "mean_speed_px_s": np.divide(path_length, lifetime_s, out=np.zeros_like(path_length), where=lifetime_s > 0),
+        "max_speed_px_s": np.maximum.reduceat(np.r_[step_speed, 0], starts),
+    }
+
+
+def trajectories(store):
+    """Trayectoria de cada pista: dict track_id -> array (n, 3) con frame, cx, cy ordenado por frame."""
+    track_ids = store.column("track_id")
+    tracked = np.flatnonzero(track_ids >= 0)
+    ids = track_ids[tracked]
+    frames = store.column("frame_idx")[tracked]
+    order = np.lexsort((frames, ids))
+    xyxy = store.column("xyxy")[tracked[order]].astype(np.float64)
+    points = np.column_stack([frames[order], (xyxy[:, 0] + xyxy[:, 2]) / 2, (xyxy[:, 1] + xyxy[:, 3]) / 2])
+    ids = ids[order]
+    starts = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]]) if len(ids) else np.zeros(0, dtype=np.int64)
+    return {int(ids[s]): segment for s, segment in zip(starts, np.split(points, starts[1:]))}
+
+
+def save_track_statistics(stats, path, names=None):
+    """Guarda las estadísticas por pista en CSV (una fila por pista)."""
+    names = names or {}
+    columns = list(stats)
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(columns[:2] + ["class_name"] + columns[2:])
+        for row in zip(*(np.round(stats[c].astype(np.float64), 3).tolist() if stats[c].dtype.kind == "f"
+                         else stats[c].tolist() for c in columns)):
+            writer.writerow(list(row[:2]) + [names.get(int(row[1]), str(row[1]))] + list(row[2:]))
@@ -0,0 +1,214 @@
+"""Cola de trabajos sobre un pool de procesos para procesar muchos archivos a la vez.
+
+Cada proceso trabajador carga el modelo YOLO una sola vez y lo reutiliza para todos los archivos
+que recibe. El progreso y los resultados vuelven al proceso principal como eventos que se leen
+con WorkerPool.poll() (sin bloquear, apto para un temporizador de Tk).
+
+Eventos: ("progress", ruta, hechos, total), ("done", ruta, resumen), ("error", ruta, mensaje)
+"""
+import multiprocessing
+import os
+import queue
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+import detector
+from tracking import save_track_statistics
+from annotator import Annotator, DEFAULT_STYLE
+from detection_cache import DetectionCache, DEFAULT_CACHE_DIR
+from pipeline import DEFAULT_BATCH_SIZE
+from frame_pool import DEFAULT_MEMORY_CEILING_MB
+
+PROGRESS_INTERVAL_S = 0.5 # Mínimo tiempo entre eventos de progreso de un mismo archivo
+DEFAULT_EXPORT_FORMAT = "csv" # Formato al que se exporta el almacén de detecciones de cada archivo
+
+_worker_model = None # Modelo cargado una vez por proceso trabajador
+_worker_cache = None
+_worker_events = None
+_worker_cancel = None
+
+
+class JobCancelled(Exception):
+    pass
+
+
+def default_workers():
+    return max(1, os.cpu_count() or 1)
+
+
+def output_paths(input_path, output_dir, used_stems):
+    """Devuelve (ruta_media, directorio_detecciones) únicos dentro de output_dir para input_path."""
+    stem, ext = os.path.splitext(os.path.basename(input_path))
+    unique_stem = stem
+    n = 1
+    while unique_stem in used_stems:
+        n += 1
+        unique_stem = f"{stem}_{n}"
+    used_stems.add(unique_stem)
+    media_ext = ".mp4" if detector.is_video(input_path) else ext
+    return (os.path.join(output_dir, f"{unique_stem}_procesado{media_ext}"),
+            os.path.join(output_dir, f"{unique_stem}_detecciones"))
+
+
+def process_file(input_path, media_path, store_dir, batch_size, model=None, on_progress=None, cache=None,
+                 export_format=DEFAULT_EXPORT_FORMAT, tiling=None, frame_skip=None, track=False, annotation=DEFAULT_STYLE,
+                 encoder_options=None, predict_args=None, roi=None, max_memory_mb=DEFAULT_MEMORY_CEILING_MB):
+    """Procesa un archivo, escribe la salida anotada y el almacén de detecciones (y su exportación si
+    export_format no es None). Devuelve un resumen. tiling se aplica solo a imágenes (ver
+    detector.detect_image); frame_skip y track solo a videos (ver frame_skip.py y tracking.py).
+    annotation es el estilo de annotator.Annotator; con "none" no se escribe la salida anotada.
+    encoder_options configura la codificación de los videos de salida (ver encoder.VideoEncoder).
+    predict_args (p. ej. imgsz) y roi (región de interés, ver pipeline.VideoPipeline) se aplican a ambos.
+    max_memory_mb acota la memoria de los buffers de frame de cada video."""
+    model = model or _worker_model
+    cache = cache or _worker_cache
+    start = time.perf_counter()
+    skip_stats = {}
+    track_stats = {}
+    annotator = Annotator(model.names, annotation)
+    if detector.is_video(input_path):
+        store = detector.process_video_file(model, input_path, media_path, batch_size=batch_size,
+                                            on_progress=on_progress, cache=cache, store_dir=store_dir,
+                                            frame_skip=frame_skip, skip_stats=skip_stats,
+                                            track=track, track_stats=track_stats, annotator=annotator,
+                                            encoder_options=encoder_options, predict_args=predict_args, roi=roi,
+                                            max_memory_mb=max_memory_mb)
+    else:
+        store = detector.process_image_file(model, input_path, media_path, cache=cache, store_dir=store_dir,
+                                            tiling=tiling, annotator=annotator, predict_args=predict_args, roi=roi)
+        if on_progress:
+            on_progress(1, 1)
+    export_path = None
+    if export_format:
+        export_path = f"{store_dir}.{export_format}"
+        store.export(export_path)
+    summary = {
+        "input": input_path,
+        "output": media_path if annotator.enabled else None,
+        "detections_dir": store_dir,
+        "detections_export": export_path,
+        "frames": store.num_frames,
+        "detections": len(store),
+        "classes": store.class_names_found(),
+        "class_counts": detector.counts_by_name(np.bincount(store.column("class_id")), store.names) if len(store) else {},
+        "seconds": round(time.perf_counter() - start, 3),
+    }
+    if skip_stats:
+        summary["frame_skip"] = skip_stats
+    if track_stats:
+        tracks_path = f"{store_dir}_trayectorias.csv"
+        save_track_statistics(track_stats, tracks_path, store.names)
+        summary["tracks"] = len(track_stats["track_id"])
+        summary["tracks_export"] = tracks_path
+    return summary
+
+
+def _init_worker(model_path, events, cancel_event, cache_dir, model_options):
+    global _worker_model, _worker_cache, _worker_events, _worker_cancel
+    _worker_events = events
+    _worker_cancel = cancel_event
+    _worker_cache = DetectionCache(cache_dir) if cache_dir else None
+    _worker_model = detector.load_model(model_path, warmup=True, **model_options)
+
+
+def _run_job(input_path, media_path, store_dir, batch_size, export_format, tiling, frame_skip, track, annotation,
+             encoder_options, predict_args, roi, max_memory_mb):
+    last_report = 0.0
+
+    def report(done, total):
+        nonlocal last_report
+        if _worker_cancel.is_set():
+            raise JobCancelled("Procesamiento cancelado.")
+        now = time.monotonic()
+        if now - last_report >= PROGRESS_INTERVAL_S or done == total:
+            last_report = now
+            _worker_events.put(("progress", input_path, done, total))
+
+    return process_file(input_path, media_path, store_dir, batch_size, on_progress=report, export_format=export_format,
+                        tiling=tiling, frame_skip=frame_skip, track=track, annotation=annotation,
+                        encoder_options=encoder_options, predict_args=predict_args, roi=roi, max_memory_mb=max_memory_mb)
+
+
+class WorkerPool:
+    """Reparte archivos entre procesos trabajadores que mantienen el modelo cargado."""
+
+    def __init__(self, model_path, output_dir, workers=None, batch_size=DEFAULT_BATCH_SIZE, cache_dir=DEFAULT_CACHE_DIR,
+                 export_format=DEFAULT_EXPORT_FORMAT, tiling=None, frame_skip=None, track=False, annotation=DEFAULT_STYLE,
+                 encoder_options=None, model_options=None, predict_args=None, roi=None,
+                 max_memory_mb=DEFAULT_MEMORY_CEILING_MB):
+        self.output_dir = output_dir
+        self.batch_size = batch_size
+        self.export_format = export_format
+        self.tiling = tiling
+        self.frame_skip = frame_skip
+        self.track = track
+        self.annotation = annotation
+        self.encoder_options = encoder_options
+        self.predict_args = predict_args
+        self.roi = roi
+        self.max_memory_mb = max_memory_mb # Por trabajador: cada uno procesa un video a la vez
+        self.workers = workers or default_workers()
+        # Opciones de detector.load_model. Conviene pasar un backend ya elegido (model.backend_options)
+        # para que cada trabajador no repita la selección de "auto". Sin hilos explícitos se reparten
+        # los núcleos entre los trabajadores para que los runtimes no compitan por ellos.
+        model_options = dict(model_options or {})
+        if not model_options.get("threads"):
+            model_options["threads"] = max(1, (os.cpu_count() or 1) // self.workers)
+        # 'spawn' evita heredar el estado de torch/CUDA (o de Tk) del proceso padre
+        context = multiprocessing.get_context("spawn")
+        self._events = context.Queue()
+        self._cancel = context.Event()
+        self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=context,
+                                             initializer=_init_worker,
+                                             initargs=(model_path, self._events, self._cancel, cache_dir, model_options))
+        self._used_stems = set()
+        self._futures = set()
+
+    def submit(self, input_path, media_path=None, store_dir=None):
+        """Encola un archivo. Si no se indican rutas de salida se generan dentro de output_dir.
+
+        Devuelve (entrada, ruta_media, directorio_detecciones).
+        """
+        if media_path is None or store_dir is None:
+            os.makedirs(self.output_dir, exist_ok=True)
+            media_path, store_dir = output_paths(input_path, self.output_dir, self._used_stems)
+        future = self._executor.submit(_run_job, input_path, media_path, store_dir, self.batch_size, self.export_format,
+                                       self.tiling, self.frame_skip, self.track, self.annotation, self.encoder_options,
+                                       self.predict_args, self.roi, self.max_memory_mb)
+        self._futures.add(future)
+        future.add_done_callback(lambda f: self._on_job_done(input_path, f))
+        return input_path, media_path, store_dir
+
+    def _on_job_done(self, path, future):
+        self._futures.discard(future)
+        if future.cancelled():
+            self._events.put(("error", path, "Cancelado."))
+            return
+        error = future.exception()
+        if error is None:
+            self._events.put(("done", path, future.result()))
+        else:
+            self._events.put(("error", path, str(error)))
+
+    @property
+    def pending(self):
+        return len(self._futures)
+
+    def poll(self, timeout=None):
+        """Devuelve los eventos disponibles. Si timeout no es None espera hasta ese tiempo por el primero."""
+        events = []
+        try:
+            if timeout is not None:
+                events.append(self._events.get(timeout=timeout))
+            while True:
+                events.append(self._events.get_nowait())
+        except queue.Empty:
+            pass
+        return events
+
+    def shutdown(self, cancel=False):
+        """Cierra el pool. Con cancel=True descarta los trabajos pendientes e interrumpe los activos."""
+        if cancel:
+            self._cancel.set()
+        self._executor.shutdown(wait=not cancel, cancel_futures=cancel)